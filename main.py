@@ -2,6 +2,7 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 import asyncio
 from src.settings import settings
@@ -15,8 +16,12 @@ from src.routes import (
     billing,
     data_collection,
     meter_status,
+    power_quality,
 )
 from src.ml_model import power_prediction_service
+from src.utils.alerts import alert_dispatcher
+from src.utils.broadcast import broadcaster
+from src.utils.jobs import job_queue
 
 
 @asynccontextmanager
@@ -31,6 +36,9 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Failed to load ML model: {e}")
 
+    # Collector threads publish live readings onto this loop
+    broadcaster.bind(asyncio.get_running_loop())
+
     # Start scheduler
     scheduler.start()
     # Data collection starts as OFF by default
@@ -58,6 +66,15 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             print(f"Error shutting down scheduler: {e}")
 
+        # Drop queued jobs; running ones finish in their threads
+        job_queue.shutdown()
+        power_prediction_service.jobs.shutdown()
+
+        # Send alerts still waiting in the batch window
+        alert_dispatcher.stop()
+
+        broadcaster.close()
+
         print("Shutdown complete")
 
 
@@ -75,8 +92,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Range queries return large JSON arrays; compress anything worth compressing
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 # Include routers
 app.include_router(auth_routes.router)
 app.include_router(meter.router)
@@ -86,6 +107,7 @@ app.include_router(billing.router)
 app.include_router(data_collection.router)
 app.include_router(prediction.router)
 app.include_router(meter_status.router)
+app.include_router(power_quality.router)
 
 
 @app.get("/")
@@ -1,3 +1,4 @@
+from sqlalchemy import text
 
 from src.database import db_engine, get_db
 from src.models import Base
@@ -6,8 +7,22 @@ from src.init_meter import init_meter
 
 Base.metadata.create_all(bind=db_engine)
 
+# create_all leaves existing tables alone, but billing upserts need these
+# keys. Billing rows are derived data, so older duplicates can simply go.
+BILLING_KEYS = {
+    "unique_billing_date": ("billing", ["date"]),
+    "unique_cost_per_day": ("cost_per_day", ["date", "day"]),
+}
+with db_engine.begin() as conn:
+    for name, (table, columns) in BILLING_KEYS.items():
+        same_key = " AND ".join(f"a.{column} = b.{column}" for column in columns)
+        conn.execute(text(f"DELETE FROM {table} a USING {table} b WHERE {same_key} AND a.id < b.id"))
+        conn.execute(
+            text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        )
+
 db = next(get_db())
 try:
     init_meter(db)
 finally:
-    db.close()
\ No newline at end of file
+    db.close()
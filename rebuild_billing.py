@@ -0,0 +1,73 @@
+"""
+Recompute billing for several months concurrently, e.g. after a data fix
+or a tariff change:
+
+    python rebuild_billing.py 2025-01 2025-03
+    python rebuild_billing.py 2024-01:2024-12 --workers 8
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+from sqlalchemy.orm import Session
+from src.database import SessionLocal
+from src.api.billing import calculate_bill
+
+
+def parse_months(specs: list[str]) -> list[tuple[int, int]]:
+    months = []
+    for spec in specs:
+        first, _, last = spec.partition(":")
+        year, month = map(int, first.split("-"))
+        end_year, end_month = map(int, (last or first).split("-"))
+        while (year, month) <= (end_year, end_month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return sorted(set(months))
+
+
+def rebuild_month(year: int, month: int) -> float:
+    # Each worker needs its own session; months never share rows
+    db: Session = SessionLocal()
+    try:
+        started = perf_counter()
+        calculate_bill(year, month, db, rebuild=True)
+        return perf_counter() - started
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute monthly billing")
+    parser.add_argument("months", nargs="+", help="YYYY-MM or YYYY-MM:YYYY-MM")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    months = parse_months(args.months)
+    started = perf_counter()
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(rebuild_month, year, month): (year, month)
+            for year, month in months
+        }
+        for future in as_completed(futures):
+            year, month = futures[future]
+            try:
+                print(f"✓ {year}-{month:02d} rebuilt in {future.result():.2f}s")
+            except Exception as e:
+                failed += 1
+                print(f"✗ {year}-{month:02d} failed: {e}")
+
+    print(f"Rebuilt {len(months) - failed}/{len(months)} months in {perf_counter() - started:.2f}s")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
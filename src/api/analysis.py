@@ -0,0 +1,168 @@
+from datetime import datetime
+
+from sqlalchemy import desc, func, select, true
+from sqlalchemy.orm import Session
+
+from ..models import CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB
+
+
+# Per-phase columns every analysis aggregates over
+PHASE_COLUMNS = {
+    CurrentDB: [
+        CurrentDB.phase_A_current,
+        CurrentDB.phase_B_current,
+        CurrentDB.phase_C_current,
+    ],
+    VoltageDB: [
+        VoltageDB.phase_A_voltage,
+        VoltageDB.phase_B_voltage,
+        VoltageDB.phase_C_voltage,
+    ],
+    PowerDB: [
+        PowerDB.phase_A_active_power,
+        PowerDB.phase_B_active_power,
+        PowerDB.phase_C_active_power,
+    ],
+    EnergyDB: [
+        EnergyDB.phase_A_grid_consumption,
+        EnergyDB.phase_B_grid_consumption,
+        EnergyDB.phase_C_grid_consumption,
+    ],
+}
+
+
+def latest_readings(db: Session, model, depth: int = 1):
+    """
+    The newest `depth` readings of every meter in one statement.
+
+    Each meter probes its (meter_id, timestamp) index through a LATERAL
+    subquery, ranked 1 = newest. Meters without data come back once with
+    NULL reading columns, so callers can still report them.
+    """
+    table = model.__table__
+    latest = (
+        select(
+            # meter_id comes from MeterDB; a second, NULL-able copy from the
+            # lateral would shadow it on the result rows
+            *[column for column in table.columns if column.key != "meter_id"],
+            func.row_number().over(order_by=desc(table.c.timestamp)).label("rank"),
+        )
+        .where(table.c.meter_id == MeterDB.meter_id)
+        .order_by(desc(table.c.timestamp))
+        .limit(depth)
+        .lateral()
+    )
+
+    return (
+        db.query(MeterDB.meter_id, MeterDB.name.label("meter_name"), latest)
+        .outerjoin(latest, true())
+        .order_by(MeterDB.meter_id, latest.c.rank)
+        .all()
+    )
+
+
+def _phase_averages(model, start: datetime, end: datetime):
+    columns = PHASE_COLUMNS[model]
+    return (
+        select(
+            model.meter_id,
+            *[func.avg(column).label(column.key) for column in columns],
+        )
+        .where(model.timestamp >= start, model.timestamp < end)
+        .group_by(model.meter_id)
+        .subquery()
+    )
+
+
+def average_by_meter(db: Session, start: datetime, end: datetime, *models):
+    """
+    Per-phase averages over [start, end) for every meter and each given model,
+    as one grouped statement.
+
+    Rows are (meter_id, meter_name, <model averages>...) in the order of
+    `models`; meters without data get NULL averages.
+    """
+    query = db.query(MeterDB.meter_id, MeterDB.name.label("meter_name"))
+    for model in models:
+        averages = _phase_averages(model, start, end)
+        query = query.add_columns(
+            *[averages.c[column.key] for column in PHASE_COLUMNS[model]]
+        ).outerjoin(averages, averages.c.meter_id == MeterDB.meter_id)
+
+    return query.order_by(MeterDB.meter_id).all()
+
+
+# Metrics the aggregation engine exposes, each summed across the three phases
+METRICS = {
+    "current": CurrentDB,
+    "voltage": VoltageDB,
+    "power": PowerDB,
+    "energy": EnergyDB,
+}
+
+AGGREGATES = {
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+    "sum": func.sum,
+}
+
+# Aggregates that distribute over a sum of phases, so each phase can be
+# aggregated on its own and a phase without readings counts as zero
+PER_PHASE_AGGREGATES = ("avg", "sum")
+
+GRANULARITIES = ("hour", "day", "week", "month")
+
+
+def _phase_total(model, name: str):
+    columns = PHASE_COLUMNS[model]
+    if name in PER_PHASE_AGGREGATES:
+        return sum(func.coalesce(AGGREGATES[name](column), 0) for column in columns)
+    # min/max of the three-phase total only exist where every phase reported
+    return AGGREGATES[name](sum(columns[1:], columns[0]))
+
+
+def aggregate(
+    db: Session,
+    metrics: list[str],
+    aggregates: list[str],
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    meter_ids: list[int] | None = None,
+):
+    """
+    Aggregate metrics over [start, end) into date_trunc buckets per meter.
+
+    Runs one GROUP BY statement per table touched, however many meters,
+    buckets or aggregate functions are requested. avg and sum add up the
+    per-phase results, so a phase with NULL readings contributes zero
+    instead of voiding the row. Returns
+    {(meter_id, bucket): {"<metric>_<aggregate>": value}}.
+    """
+    result = {}
+    for metric in metrics:
+        model = METRICS[metric]
+        bucket = func.date_trunc(granularity, model.timestamp).label("bucket")
+
+        query = (
+            db.query(
+                model.meter_id,
+                bucket,
+                *[
+                    _phase_total(model, name).label(f"{metric}_{name}")
+                    for name in aggregates
+                ],
+            )
+            .filter(model.timestamp >= start, model.timestamp < end)
+            .group_by(model.meter_id, bucket)
+        )
+        if meter_ids is not None:
+            query = query.filter(model.meter_id.in_(meter_ids))
+
+        for row in query.all():
+            values = result.setdefault((row.meter_id, row.bucket), {})
+            for name in aggregates:
+                values[f"{metric}_{name}"] = row._mapping[f"{metric}_{name}"]
+
+    return result
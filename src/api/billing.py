@@ -1,188 +1,393 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import calendar
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy import func
+from sqlalchemy import Date, and_, case, cast, func, select, tuple_
 
-from ..models import EnergyDB, BillingDB, CostPerDayDB, CostPerMeterDB
+from ..models import (
+    EnergyDB,
+    BillingDB,
+    CostPerDayDB,
+    CostPerMeterDB,
+    CostPerMeterDayDB,
+    DailyEnergyDB,
+)
+from ..database import SessionLocal
+from ..utils.jobs import job_queue
 
 
+# Stored bills cost every kWh at this flat rate. Time-of-use rates, tiers
+# and demand charges of the tariffs table are applied by tariff.py, which
+# only /billing/tariffs/{year}/{month} uses.
 TARIFF = 8.0
 
+LEDGER_PHASES = ("a", "b", "c")
 
-def get_power_per_meter_per_day(year: int, month: int, day: int, db: Session):
-    start = datetime(year, month, day)
-    end = start + timedelta(days=1)
-    
-    # Get first and last readings for each meter/phase
-    from sqlalchemy import and_
-    
-    # Subquery for first reading of the day
-    first_reading = (
-        db.query(
-            EnergyDB.meter_id,
-            func.min(EnergyDB.timestamp).label("first_time")
-        )
-        .filter(
-            EnergyDB.timestamp >= start,
-            EnergyDB.timestamp < end
+# Advisory lock namespace serialising billing runs per month
+BILLING_LOCK_ID = 1
+
+
+def _upsert_daily_energy(db: Session, rows: list[dict], replace: bool = False):
+    """
+    Write ledger rows keyed on (meter_id, day) and mark them dirty.
+
+    By default readings are merged, keeping the earliest first reading and
+    the latest last reading, so ticks may arrive in any order. With
+    `replace` the given rows overwrite what is stored (used by rebuilds).
+    """
+    stmt = insert(DailyEnergyDB).values(rows)
+    excluded = stmt.excluded
+
+    if replace:
+        updates = {
+            column: excluded[column]
+            for column in rows[0]
+            if column not in ("meter_id", "day")
+        }
+    else:
+        earlier = excluded.first_timestamp < DailyEnergyDB.first_timestamp
+        later = excluded.last_timestamp > DailyEnergyDB.last_timestamp
+        updates = {}
+        for edge, condition in (("first", earlier), ("last", later)):
+            for column in [f"{edge}_timestamp"] + [f"{edge}_{p}" for p in LEDGER_PHASES]:
+                updates[column] = case(
+                    (condition, excluded[column]), else_=getattr(DailyEnergyDB, column)
+                )
+
+    updates["is_dirty"] = True
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DailyEnergyDB.meter_id, DailyEnergyDB.day], set_=updates
         )
-        .group_by(EnergyDB.meter_id)
-        .subquery()
     )
-    
-    # Subquery for last reading of the day
-    last_reading = (
-        db.query(
-            EnergyDB.meter_id,
-            func.max(EnergyDB.timestamp).label("last_time")
-        )
-        .filter(
-            EnergyDB.timestamp >= start,
-            EnergyDB.timestamp < end
+
+
+def _upsert(db: Session, model, rows: list[dict], keys: list[str]):
+    """Bulk INSERT ... ON CONFLICT (keys) DO UPDATE of every other column"""
+    stmt = insert(model).values(rows)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: stmt.excluded[column] for column in rows[0] if column not in keys},
         )
-        .group_by(EnergyDB.meter_id)
-        .subquery()
     )
-    
-    # Get first values
-    first_values = (
-        db.query(
-            EnergyDB.meter_id,
-            EnergyDB.phase_A_grid_consumption.label("first_a"),
-            EnergyDB.phase_B_grid_consumption.label("first_b"),
-            EnergyDB.phase_C_grid_consumption.label("first_c"),
-        )
-        .join(
-            first_reading,
-            and_(
-                EnergyDB.meter_id == first_reading.c.meter_id,
-                EnergyDB.timestamp == first_reading.c.first_time
+
+
+def record_daily_energy(db: Session, ticks: dict[int, tuple[datetime, list[dict]]]):
+    """
+    Fold one committed collector tick into the ledger; the caller commits.
+
+    Should the merge fail, the tick's days are rebuilt from their stored
+    readings instead, which also leaves them dirty for the next billing run.
+    """
+    rows = []
+    for meter_id, (ts, phases) in ticks.items():
+        row = {"meter_id": meter_id, "day": ts.date()}
+        for edge in ("first", "last"):
+            row[f"{edge}_timestamp"] = ts
+            for phase, reading in zip(LEDGER_PHASES, phases):
+                row[f"{edge}_{phase}"] = reading["grid_consumption"]
+        rows.append(row)
+
+    if not rows:
+        return
+    try:
+        with db.begin_nested():
+            _upsert_daily_energy(db, rows)
+    except Exception as e:
+        print("Daily energy ledger update failed, rebuilding from readings:", e)
+        days = [row["day"] for row in rows]
+        rebuild_daily_energy(db, min(days), max(days))
+
+
+def rebuild_daily_energy(db: Session, first_day: date, last_day: date):
+    """
+    Recompute the ledger for first_day..last_day from EnergyDB in one pass.
+
+    first_value/last_value over each (meter_id, day) partition give the
+    day's opening and closing counters, and DISTINCT ON keeps one row per
+    partition, so a whole month costs a single scan of its readings.
+    """
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+
+    day = cast(EnergyDB.timestamp, Date)
+    window = {
+        "partition_by": [EnergyDB.meter_id, day],
+        "order_by": EnergyDB.timestamp,
+        "rows": (None, None),
+    }
+    phases = {
+        "a": EnergyDB.phase_A_grid_consumption,
+        "b": EnergyDB.phase_B_grid_consumption,
+        "c": EnergyDB.phase_C_grid_consumption,
+    }
+    edges = {"first": func.first_value, "last": func.last_value}
+
+    columns = [EnergyDB.meter_id, day.label("day")]
+    for edge, value_at in edges.items():
+        columns.append(value_at(EnergyDB.timestamp).over(**window).label(f"{edge}_timestamp"))
+        for phase, column in phases.items():
+            columns.append(
+                func.coalesce(value_at(column).over(**window), 0).label(f"{edge}_{phase}")
             )
+
+    rows = [
+        dict(row._mapping)
+        for row in db.query(*columns)
+        .filter(EnergyDB.timestamp >= start, EnergyDB.timestamp < end)
+        .distinct(EnergyDB.meter_id, day)
+    ]
+
+    # Drop ledger rows whose readings have since been removed
+    rebuilt = {(row["meter_id"], row["day"]) for row in rows}
+    in_range = and_(DailyEnergyDB.day >= first_day, DailyEnergyDB.day <= last_day)
+    gone = [
+        key
+        for key in db.query(DailyEnergyDB.meter_id, DailyEnergyDB.day).filter(in_range)
+        if tuple(key) not in rebuilt
+    ]
+    if gone:
+        db.query(DailyEnergyDB).filter(
+            tuple_(DailyEnergyDB.meter_id, DailyEnergyDB.day).in_(gone)
+        ).delete(synchronize_session=False)
+
+    if rows:
+        _upsert_daily_energy(db, rows, replace=True)
+
+
+def dirty_months(db: Session) -> list[tuple[int, int]]:
+    """Months whose ledger has changed since they were last billed"""
+    month = func.date_trunc("month", DailyEnergyDB.day)
+    return [
+        (row.month.year, row.month.month)
+        for row in db.query(month.label("month"))
+        .filter(DailyEnergyDB.is_dirty)
+        .distinct()
+    ]
+
+
+def _bill_meter_days(db: Session, days: list[date]):
+    """
+    Re-cost the per-meter daily rows of `days` straight from the ledger with
+    one INSERT ... SELECT upsert, dropping rows that are no longer billable.
+    """
+    billable = and_(DailyEnergyDB.day.in_(days), DailyEnergyDB.energy >= 0)
+
+    stmt = insert(CostPerMeterDayDB).from_select(
+        ["meter_id", "day", "energy", "cost"],
+        select(
+            DailyEnergyDB.meter_id,
+            DailyEnergyDB.day,
+            DailyEnergyDB.energy,
+            DailyEnergyDB.energy * TARIFF,
+        ).where(billable),
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[CostPerMeterDayDB.meter_id, CostPerMeterDayDB.day],
+            set_={"energy": stmt.excluded.energy, "cost": stmt.excluded.cost},
         )
-        .all()
     )
-    
-    # Get last values
-    last_values = (
+
+    db.query(CostPerMeterDayDB).filter(
+        CostPerMeterDayDB.day.in_(days),
+        ~select(DailyEnergyDB.meter_id)
+        .where(
+            billable,
+            DailyEnergyDB.meter_id == CostPerMeterDayDB.meter_id,
+            DailyEnergyDB.day == CostPerMeterDayDB.day,
+        )
+        .exists(),
+    ).delete(synchronize_session=False)
+
+
+RANGE_GRANULARITIES = ("day", "month", "total")
+
+
+def cost_range(
+    db: Session,
+    first_day: date,
+    last_day: date,
+    granularity: str,
+    per_meter: bool,
+    meter_ids: list[int] | None = None,
+):
+    """
+    Billed energy and cost over first_day..last_day, summed per day, month or
+    over the whole range, optionally split by meter, in one grouped query.
+    """
+    columns, group_by = [], []
+    if granularity != "total":
+        period = func.date_trunc(granularity, CostPerMeterDayDB.day)
+        columns.append(cast(period, Date).label("period"))
+        group_by.append(period)
+    if per_meter:
+        columns.append(CostPerMeterDayDB.meter_id)
+        group_by.append(CostPerMeterDayDB.meter_id)
+
+    query = (
         db.query(
-            EnergyDB.meter_id,
-            EnergyDB.phase_A_grid_consumption.label("last_a"),
-            EnergyDB.phase_B_grid_consumption.label("last_b"),
-            EnergyDB.phase_C_grid_consumption.label("last_c"),
+            *columns,
+            func.sum(CostPerMeterDayDB.energy).label("energy"),
+            func.sum(CostPerMeterDayDB.cost).label("cost"),
+        )
+        .filter(CostPerMeterDayDB.day >= first_day, CostPerMeterDayDB.day <= last_day)
+        .group_by(*group_by)
+        .order_by(*group_by)
+    )
+    if meter_ids is not None:
+        query = query.filter(CostPerMeterDayDB.meter_id.in_(meter_ids))
+
+    return [dict(row._mapping) for row in query.all()]
+
+
+def calculate_bill(year: int, month: int, db: Session, rebuild: bool = False):
+    """
+    Bring the month's billing up to date from the daily energy ledger.
+
+    Only days whose ledger rows changed since the last run (or that were
+    never billed) are re-costed; monthly totals are then re-summed from the
+    small per-day tables. Unbilled days missing from the ledger are rebuilt
+    from EnergyDB in a single pass; `rebuild` does that for the whole month.
+    Costs use the flat TARIFF, not the stored tariffs.
+    """
+    month_key = f"{year}-{month:02d}"
+    _, total_days = calendar.monthrange(year, month)
+
+    # Runs for the same month (from any worker or process) take turns
+    db.execute(select(func.pg_advisory_xact_lock(BILLING_LOCK_ID, year * 100 + month)))
+
+    first_day = date(year, month, 1)
+    next_month = first_day + timedelta(days=total_days)
+    in_month = and_(DailyEnergyDB.day >= first_day, DailyEnergyDB.day < next_month)
+
+    all_days = set(range(1, total_days + 1))
+    billed_days = {
+        day for (day,) in db.query(CostPerDayDB.day).filter(CostPerDayDB.date == month_key)
+    }
+
+    # Days never billed may predate the ledger (e.g. imported history)
+    if rebuild:
+        missing_days = all_days
+    else:
+        ledger_days = {
+            row.day.day
+            for row in db.query(DailyEnergyDB.day).filter(in_month).distinct()
+        }
+        missing_days = (all_days - billed_days) - ledger_days
+    if missing_days:
+        rebuild_daily_energy(
+            db, date(year, month, min(missing_days)), date(year, month, max(missing_days))
         )
-        .join(
-            last_reading,
-            and_(
-                EnergyDB.meter_id == last_reading.c.meter_id,
-                EnergyDB.timestamp == last_reading.c.last_time
+
+    # Claim the dirty rows first: a concurrent ingest touching one of them
+    # waits for this transaction and then marks it dirty again for next run
+    dirty_days = {
+        row.day.day
+        for row in db.execute(
+            DailyEnergyDB.__table__.update()
+            .where(in_month, DailyEnergyDB.is_dirty)
+            .values(is_dirty=False)
+            .returning(DailyEnergyDB.day)
+        )
+    }
+    stale_days = all_days if rebuild else dirty_days | (all_days - billed_days)
+
+    # Negative deltas mean a counter reset or bad data and are not billed
+    billable = and_(in_month, DailyEnergyDB.energy >= 0)
+
+    if stale_days:
+        energy_per_day = {
+            row.day.day: row.energy
+            for row in db.query(
+                DailyEnergyDB.day, func.sum(DailyEnergyDB.energy).label("energy")
             )
+            .filter(billable)
+            .group_by(DailyEnergyDB.day)
+            if row.day.day in stale_days
+        }
+
+        _upsert(
+            db,
+            CostPerDayDB,
+            [
+                {"date": month_key, "day": day, "cost": energy_per_day.get(day, 0) * TARIFF}
+                for day in sorted(stale_days)
+            ],
+            ["date", "day"],
+        )
+        _bill_meter_days(db, [date(year, month, day) for day in stale_days])
+
+    meter_total_costs = {
+        meter_id: energy * TARIFF
+        for meter_id, energy in db.query(
+            DailyEnergyDB.meter_id, func.sum(DailyEnergyDB.energy)
         )
+        .filter(billable)
+        .group_by(DailyEnergyDB.meter_id)
+    }
+
+    daily_costs = (
+        db.query(CostPerDayDB.day, CostPerDayDB.cost)
+        .filter(CostPerDayDB.date == month_key)
+        .order_by(CostPerDayDB.day)
         .all()
     )
-    
-    # Create lookup dictionaries
-    first_dict = {row.meter_id: row for row in first_values}
-    last_dict = {row.meter_id: row for row in last_values}
-    
-    meter_to_energy = {}
-    
-    for meter_id in first_dict.keys():
-        if meter_id not in last_dict:
-            continue
-            
-        first = first_dict[meter_id]
-        last = last_dict[meter_id]
-        
-        # Calculate consumption as difference
-        phase_a = (last.last_a or 0) - (first.first_a or 0)
-        phase_b = (last.last_b or 0) - (first.first_b or 0)
-        phase_c = (last.last_c or 0) - (first.first_c or 0)
-        
-        total = phase_a + phase_b + phase_c
-        
-        # Handle meter rollover (if meter resets to 0)
-        if total < 0:
-            # This might indicate a meter reset or error
-            # You may want to log this or handle differently
-            continue
-            
-        meter_to_energy[meter_id] = total
-    
-    return meter_to_energy
-
-def calculate_bill(year: int, month: int, db: Session):
-    month_key = f"{year}-{month:02d}"
-    _, total_days = calendar.monthrange(year, month)
-    
-    # Track total cost per meter for the entire month
-    meter_total_costs = {}
-    
-    # Temporary storage for new data
-    new_daily_costs = []
-    total_cost = 0
+
+    total_cost = sum(cost for _, cost in daily_costs)
     expensive_day = 0
     expensive_day_cost = 0
-    
-    # Main calculation
-    for day in range(1, total_days + 1):
-        meter_to_energy = get_power_per_meter_per_day(year, month, day, db)
-        total_per_day = 0
-        
-        for meter_id, energy in meter_to_energy.items():
-            cost = energy * TARIFF
-            total_per_day += cost
-            
-            # Accumulate cost for this meter across all days
-            if meter_id not in meter_total_costs:
-                meter_total_costs[meter_id] = 0
-            meter_total_costs[meter_id] += cost
-        
-        # Store daily cost in temporary list
-        new_daily_costs.append(
-            CostPerDayDB(
-                date=month_key,
-                day=day,
-                cost=total_per_day
-            )
-        )
-        
-        total_cost += total_per_day
-        
-        # Update expensive day
-        if total_per_day > expensive_day_cost:
+    for day, cost in daily_costs:
+        if cost > expensive_day_cost:
             expensive_day = day
-            expensive_day_cost = total_per_day
-    
-    # Calculate average per day
-    days_count = len(new_daily_costs)
-    avg_cost_per_day = total_cost / days_count if days_count else 0
-    
-    # Now delete old data and insert new data atomically
-    db.query(CostPerDayDB).filter(CostPerDayDB.date == month_key).delete()
-    db.query(CostPerMeterDB).filter(CostPerMeterDB.date == month_key).delete()
-    db.query(BillingDB).filter(BillingDB.date == month_key).delete()
-    
-    # Insert all new daily costs
-    for daily_cost in new_daily_costs:
-        db.add(daily_cost)
-    
-    # Insert all meter costs
-    for meter_id, total_meter_cost in meter_total_costs.items():
-        db.add(CostPerMeterDB(
-            date=month_key,
-            meter_id=meter_id,
-            cost=total_meter_cost
-        ))
-    
-    # Create fresh billing record
-    billing = BillingDB(
-        date=month_key,
-        total_cost=total_cost,
-        avg_cost_per_day=avg_cost_per_day,
-        expensive_day=expensive_day,
-        expensive_day_cost=expensive_day_cost,
+            expensive_day_cost = cost
+
+    avg_cost_per_day = total_cost / total_days if total_days else 0
+
+    # Only meters that no longer have billable energy lose their row
+    db.query(CostPerMeterDB).filter(
+        CostPerMeterDB.date == month_key,
+        CostPerMeterDB.meter_id.notin_(list(meter_total_costs)),
+    ).delete(synchronize_session=False)
+    if meter_total_costs:
+        _upsert(
+            db,
+            CostPerMeterDB,
+            [
+                {"date": month_key, "meter_id": meter_id, "cost": cost}
+                for meter_id, cost in meter_total_costs.items()
+            ],
+            ["date", "meter_id"],
+        )
+
+    _upsert(
+        db,
+        BillingDB,
+        [
+            {
+                "date": month_key,
+                "total_cost": total_cost,
+                "avg_cost_per_day": avg_cost_per_day,
+                "expensive_day": expensive_day,
+                "expensive_day_cost": expensive_day_cost,
+            }
+        ],
+        ["date"],
     )
-    db.add(billing)
-    
+
     db.commit()
+
+
+def _run_billing(year: int, month: int, rebuild: bool):
+    db = SessionLocal()
+    try:
+        calculate_bill(year, month, db, rebuild=rebuild)
+        print(f"Billing completed for {year}-{month:02d}")
+    finally:
+        db.close()
+
+
+def submit_billing(year: int, month: int, rebuild: bool = False):
+    """Queue a billing run; joins the month's pending run if there is one"""
+    return job_queue.submit(("billing", year, month, rebuild), _run_billing, year, month, rebuild)
@@ -0,0 +1,270 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import BigInteger, DateTime, cast, desc, func, literal, select
+from sqlalchemy.orm import Session
+
+from ..models import PowerDB
+from .analysis import PHASE_COLUMNS
+
+
+# Demand windows the utility bills on, in minutes
+DEMAND_WINDOWS = (15, 30)
+
+
+def _minute_samples(start: datetime, end: datetime, meter_ids=None):
+    """Total active power in kW per meter, aligned to the minute"""
+    phase_sum = sum(PHASE_COLUMNS[PowerDB][1:], PHASE_COLUMNS[PowerDB][0])
+    minute = func.date_trunc("minute", PowerDB.timestamp)
+
+    query = (
+        select(
+            PowerDB.meter_id,
+            minute.label("ts"),
+            (func.avg(phase_sum) / 1000).label("kw"),
+        )
+        .where(PowerDB.timestamp >= start, PowerDB.timestamp < end)
+        .group_by(PowerDB.meter_id, minute)
+    )
+    if meter_ids is not None:
+        query = query.where(PowerDB.meter_id.in_(meter_ids))
+
+    return query.cte("samples")
+
+
+def _rolling_demand(samples, window_minutes: int):
+    """
+    Each meter's average power over the trailing window ending at each of
+    its samples.
+
+    Ordering by the minute index lets the frame be a plain integer RANGE,
+    so the window covers exactly `window_minutes` of wall-clock time
+    whatever the collection interval is.
+    """
+    minute_index = cast(func.floor(func.extract("epoch", samples.c.ts) / 60), BigInteger)
+    return select(
+        samples.c.meter_id,
+        samples.c.ts,
+        func.avg(samples.c.kw)
+        .over(
+            partition_by=samples.c.meter_id,
+            order_by=minute_index,
+            range_=(-(window_minutes - 1), 0),
+        )
+        .label("demand_kw"),
+    ).cte("meter_demand")
+
+
+def _grid_demand(meter_demand, end: datetime, window_minutes: int):
+    """
+    Every meter's rolling demand carried forward onto a shared one-minute grid.
+
+    Meters report on their own clocks, so a given minute rarely holds a
+    sample from each of them. Each sample's demand holds for the minutes up
+    to the meter's next sample, and at most one window, after which a
+    silent meter drops out rather than holding its last value indefinitely.
+    """
+    window = timedelta(minutes=window_minutes)
+    next_sample = func.lead(meter_demand.c.ts).over(
+        partition_by=meter_demand.c.meter_id, order_by=meter_demand.c.ts
+    )
+    spans = select(
+        meter_demand.c.meter_id,
+        meter_demand.c.ts,
+        meter_demand.c.demand_kw,
+        func.least(
+            func.coalesce(next_sample, cast(literal(end), DateTime)),
+            meter_demand.c.ts + window,
+        ).label("until"),
+    ).subquery()
+
+    minute = func.generate_series(
+        spans.c.ts, spans.c.until - timedelta(minutes=1), timedelta(minutes=1)
+    )
+    return select(
+        spans.c.meter_id,
+        minute.label("ts"),
+        spans.c.demand_kw,
+    ).cte("grid_demand")
+
+
+def _demand_ctes(start: datetime, end: datetime, window_minutes: int, meter_ids):
+    # Read one window early so the first intervals in range are complete
+    samples = _minute_samples(start - timedelta(minutes=window_minutes), end, meter_ids)
+    meter_demand = _rolling_demand(samples, window_minutes)
+    grid_demand = _grid_demand(meter_demand, end, window_minutes)
+
+    # Campus demand sums every meter's demand at each grid minute
+    campus_demand = (
+        select(grid_demand.c.ts, func.sum(grid_demand.c.demand_kw).label("demand_kw"))
+        .group_by(grid_demand.c.ts)
+        .cte("campus_demand")
+    )
+    return meter_demand, grid_demand, campus_demand
+
+
+def _ranked_meter_peaks(db: Session, meter_demand, start: datetime, granularity: str):
+    meter_period = func.date_trunc(granularity, meter_demand.c.ts)
+    ranked_meters = (
+        select(
+            meter_demand.c.meter_id,
+            meter_period.label("period"),
+            meter_demand.c.ts,
+            meter_demand.c.demand_kw,
+            func.row_number()
+            .over(
+                partition_by=[meter_demand.c.meter_id, meter_period],
+                order_by=desc(meter_demand.c.demand_kw),
+            )
+            .label("rn"),
+        )
+        .where(meter_demand.c.ts >= start)
+        .subquery()
+    )
+    return db.execute(
+        select(ranked_meters)
+        .where(ranked_meters.c.rn == 1)
+        .order_by(ranked_meters.c.meter_id, ranked_meters.c.period)
+    ).all()
+
+
+def meter_peak_demand(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    window_minutes: int,
+    granularity: str,
+    meter_ids: list[int] | None = None,
+):
+    """
+    Each meter's peak rolling demand per day or month over [start, end), in
+    one statement. Rows are (meter_id, period, ts, demand_kw, rn).
+    """
+    samples = _minute_samples(start - timedelta(minutes=window_minutes), end, meter_ids)
+    meter_demand = _rolling_demand(samples, window_minutes)
+    return _ranked_meter_peaks(db, meter_demand, start, granularity)
+
+
+def peak_demand(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    window_minutes: int,
+    granularity: str,
+    meter_ids: list[int] | None = None,
+):
+    """
+    Peak rolling demand per day or month over [start, end), in two statements.
+
+    Returns per-meter peaks and campus peaks, where campus demand is the sum
+    over the selected meters on a common one-minute grid. Each campus peak
+    carries the coincident demand of every meter reporting at that moment.
+    """
+    meter_demand, grid_demand, campus_demand = _demand_ctes(
+        start, end, window_minutes, meter_ids
+    )
+    meter_peaks = _ranked_meter_peaks(db, meter_demand, start, granularity)
+
+    campus_period = func.date_trunc(granularity, campus_demand.c.ts)
+    ranked_campus = (
+        select(
+            campus_period.label("period"),
+            campus_demand.c.ts,
+            campus_demand.c.demand_kw,
+            func.row_number()
+            .over(partition_by=campus_period, order_by=desc(campus_demand.c.demand_kw))
+            .label("rn"),
+        )
+        .where(campus_demand.c.ts >= start)
+        .subquery()
+    )
+    coincident = db.execute(
+        select(
+            ranked_campus.c.period,
+            ranked_campus.c.ts,
+            ranked_campus.c.demand_kw,
+            grid_demand.c.meter_id,
+            grid_demand.c.demand_kw.label("meter_demand_kw"),
+        )
+        .join(grid_demand, grid_demand.c.ts == ranked_campus.c.ts, isouter=True)
+        .where(ranked_campus.c.rn == 1)
+        .order_by(ranked_campus.c.period, grid_demand.c.meter_id)
+    ).all()
+
+    campus = {}
+    for row in coincident:
+        peak = campus.setdefault(
+            row.period,
+            {
+                "period": row.period,
+                "peak_at": row.ts,
+                "demand_kw": row.demand_kw,
+                "coincident": [],
+            },
+        )
+        if row.meter_id is not None:
+            peak["coincident"].append(
+                {"meter_id": row.meter_id, "demand_kw": row.meter_demand_kw}
+            )
+
+    return {
+        "meters": [
+            {
+                "meter_id": row.meter_id,
+                "period": row.period,
+                "peak_at": row.ts,
+                "demand_kw": row.demand_kw,
+            }
+            for row in meter_peaks
+        ],
+        "campus": list(campus.values()),
+    }
+
+
+def top_demand_intervals(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    window_minutes: int,
+    limit: int,
+    meter_ids: list[int] | None = None,
+    per_meter: bool = False,
+):
+    """
+    The `limit` highest rolling-demand windows in [start, end), either for
+    the campus total or for each meter separately.
+    """
+    meter_demand, _, campus_demand = _demand_ctes(start, end, window_minutes, meter_ids)
+
+    if not per_meter:
+        rows = db.execute(
+            select(campus_demand.c.ts, campus_demand.c.demand_kw)
+            .where(campus_demand.c.ts >= start)
+            .order_by(desc(campus_demand.c.demand_kw))
+            .limit(limit)
+        ).all()
+        return [{"ends_at": row.ts, "demand_kw": row.demand_kw} for row in rows]
+
+    ranked = (
+        select(
+            meter_demand.c.meter_id,
+            meter_demand.c.ts,
+            meter_demand.c.demand_kw,
+            func.row_number()
+            .over(
+                partition_by=meter_demand.c.meter_id,
+                order_by=desc(meter_demand.c.demand_kw),
+            )
+            .label("rn"),
+        )
+        .where(meter_demand.c.ts >= start)
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked)
+        .where(ranked.c.rn <= limit)
+        .order_by(ranked.c.meter_id, ranked.c.rn)
+    ).all()
+    return [
+        {"meter_id": row.meter_id, "ends_at": row.ts, "demand_kw": row.demand_kw}
+        for row in rows
+    ]
@@ -3,6 +3,12 @@ from ..settings import settings
 from sqlalchemy.orm import Session
 from ..models import CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB
 from ..database import SessionLocal
+from ..utils.broadcast import broadcaster
+from ..utils.cache import result_cache
+from ..utils.heartbeat import heartbeat
+from ..utils.meter_status import flatline_monitor
+from .billing import record_daily_energy
+from .power_quality import evaluate_power_quality
 from datetime import datetime
 
 
@@ -95,25 +101,89 @@ def insert_meterdata(db: Session, meter_id: int, meter_data: dict):
     )
 
     db.add_all([current, voltage, power, energy])
+    return ts
 
 
-def store_all_meter_data():
-    db: Session = SessionLocal()
-    try:
-        meters = db.query(MeterDB).all()
+def _reading_event(meter_id: int, ts: datetime, phases: list[dict]):
+    """A tick as streamed to clients, keyed like /meter/{meter_id}/latest"""
+    event = {"type": "reading", "meter_id": meter_id, "timestamp": ts.isoformat()}
+    for phase, reading in zip("ABC", phases):
+        for field, value in reading.items():
+            event[f"phase_{phase}_{field}"] = value
+    return event
 
-        for meter in meters:
-            meter_data = fetch_meter_data(meter.sn)
-            if meter_data is None:
-                continue
-            insert_meterdata(db, meter.meter_id, meter_data)
-            print(f"data stored for meter {meter.meter_id} at time {datetime.now()}")
 
+def _derive(db: Session, name: str, step):
+    """
+    Run one derived step of a tick in its own transaction, after the raw
+    readings are committed. A failure is logged and rolled back on its own,
+    so derived analytics never cost raw data. Returns None on failure.
+    """
+    try:
+        result = step()
         db.commit()
+        return result
     except Exception as e:
         db.rollback()
-        print("store_all_meter_data error:", e)
-        raise
+        print(f"store_all_meter_data {name} error:", e)
+        return None
+
+
+def _store_readings(db: Session):
+    """Insert one reading per answering meter; the caller commits them"""
+    meters = db.query(MeterDB).all()
+    ticks = {}
+
+    for meter in meters:
+        meter_data = fetch_meter_data(meter.sn)
+        if meter_data is None:
+            continue
+        ts = insert_meterdata(db, meter.meter_id, meter_data)
+        ticks[meter.meter_id] = (
+            ts,
+            [meter_data["phaseAdata"], meter_data["phaseBdata"], meter_data["phaseCdata"]],
+        )
+        print(f"data stored for meter {meter.meter_id} at time {datetime.now()}")
+
+    heartbeat.record(
+        db, [meter.meter_id for meter in meters], {m: ts for m, (ts, _) in ticks.items()}
+    )
+    return ticks
+
+
+def store_all_meter_data():
+    db: Session = SessionLocal()
+    try:
+        try:
+            ticks = _store_readings(db)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Its view of the meters now runs ahead of the table
+            heartbeat.discard()
+            print("store_all_meter_data error:", e)
+            raise
+
+        events = [_reading_event(meter_id, ts, phases) for meter_id, (ts, phases) in ticks.items()]
+
+        _derive(db, "daily energy", lambda: record_daily_energy(db, ticks))
+
+        # The monitor's windows only take samples the database already holds
+        if ticks and settings.FLATLINE_STREAMING:
+            flipped = _derive(db, "flatline", lambda: flatline_monitor.observe(db, ticks))
+            for meter_id, flat in (flipped or {}).items():
+                events.append({"type": "flatline", "meter_id": meter_id, "is_flatline": flat})
+
+        # Runs even on an empty tick, which may be what ends a silent meter's events
+        transitions = _derive(db, "power quality", lambda: evaluate_power_quality(db, ticks))
+        for meter_id, rule, severity in transitions or []:
+            events.append(
+                {"type": "power_quality", "meter_id": meter_id, "rule": rule, "severity": severity}
+            )
+
+        # Everything cached so far was computed from the previous tick
+        result_cache.invalidate()
+        broadcaster.publish(events)
     finally:
         db.close()
 
@@ -140,33 +210,3 @@ def add_iammeter_station(station_data: dict):
     except Exception as e:
         print("IAMMETER station error:", e)
         return None
-
-
-def calculate_unbalance(A, B, C):
-    avg = (A + B + C) / 3
-    if avg == 0:
-        return 0.0
-
-    max_dev = max(abs(A - avg), abs(B - avg), abs(C - avg))
-
-    return round((max_dev / avg) * 100, 2)
-
-
-def voltage_status(unbalance):
-    if unbalance < 1:
-        return "NORMAL"
-    elif unbalance < 2:
-        return "ACCEPTABLE"
-    elif unbalance < 3:
-        return "WARNING"
-    else:
-        return "CRITICAL"
-
-
-def current_status(unbalance):
-    if unbalance < 10:
-        return "NORMAL"
-    elif unbalance < 20:
-        return "WARNING"
-    else:
-        return "CRITICAL"
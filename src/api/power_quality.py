@@ -0,0 +1,278 @@
+from bisect import bisect_right
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import CurrentDB, MeterHeartbeatDB, PowerQualityEventDB, VoltageDB
+from ..settings import settings
+
+
+# Phases drawing less than this are idle; their power factor is meaningless
+LOADED_PHASE_WATTS = 100
+
+
+def calculate_unbalance(A, B, C):
+    avg = (A + B + C) / 3
+    if avg == 0:
+        return 0.0
+
+    max_dev = max(abs(A - avg), abs(B - avg), abs(C - avg))
+
+    return round((max_dev / avg) * 100, 2)
+
+
+# Unbalance limits (%) separating consecutive status levels
+VOLTAGE_UNBALANCE_LIMITS = settings.PQ_VOLTAGE_UNBALANCE_LIMITS
+VOLTAGE_STATUS_LEVELS = ("NORMAL", "ACCEPTABLE", "WARNING", "CRITICAL")
+
+CURRENT_UNBALANCE_LIMITS = settings.PQ_CURRENT_UNBALANCE_LIMITS
+CURRENT_STATUS_LEVELS = ("NORMAL", "WARNING", "CRITICAL")
+
+
+def voltage_status(unbalance):
+    return VOLTAGE_STATUS_LEVELS[bisect_right(VOLTAGE_UNBALANCE_LIMITS, unbalance)]
+
+
+def current_status(unbalance):
+    return CURRENT_STATUS_LEVELS[bisect_right(CURRENT_UNBALANCE_LIMITS, unbalance)]
+
+
+def unbalance_percent(phases: np.ndarray) -> np.ndarray:
+    """calculate_unbalance over an (n, 3) array of phase values at once"""
+    avg = phases.mean(axis=1)
+    max_dev = np.abs(phases - avg[:, None]).max(axis=1)
+    safe_avg = np.where(avg == 0, 1, avg)
+    return np.round(np.where(avg == 0, 0.0, max_dev / safe_avg * 100), 2)
+
+
+def _alarm(status):
+    return status if status in ("WARNING", "CRITICAL") else None
+
+
+def _above(value, warning, critical):
+    if value > critical:
+        return "CRITICAL"
+    if value > warning:
+        return "WARNING"
+    return None
+
+
+def _below(value, warning, critical):
+    if value < critical:
+        return "CRITICAL"
+    if value < warning:
+        return "WARNING"
+    return None
+
+
+# Each rule maps one tick's three phase readings to (severity or None, value)
+def _voltage_unbalance(phases):
+    value = calculate_unbalance(*(p["voltage"] for p in phases))
+    return _alarm(voltage_status(value)), value
+
+
+def _current_unbalance(phases):
+    value = calculate_unbalance(*(p["current"] for p in phases))
+    return _alarm(current_status(value)), value
+
+
+def _over_voltage(phases):
+    value = max(p["voltage"] for p in phases)
+    warning, critical = settings.PQ_OVER_VOLTAGE_RATIOS
+    nominal = settings.PQ_NOMINAL_VOLTAGE
+    return _above(value, nominal * warning, nominal * critical), value
+
+
+def _under_voltage(phases):
+    value = min(p["voltage"] for p in phases)
+    warning, critical = settings.PQ_UNDER_VOLTAGE_RATIOS
+    nominal = settings.PQ_NOMINAL_VOLTAGE
+    return _below(value, nominal * warning, nominal * critical), value
+
+
+def _low_power_factor(phases):
+    loaded = [abs(p["power_factor"]) for p in phases if p["active_power"] > LOADED_PHASE_WATTS]
+    if not loaded:
+        return None, 1.0
+    value = min(loaded)
+    return _below(value, settings.PQ_MIN_POWER_FACTOR, settings.PQ_CRITICAL_POWER_FACTOR), value
+
+
+def _overcurrent(phases):
+    value = max(p["current"] for p in phases)
+    rated = settings.PQ_MAX_CURRENT
+    return _above(value, rated * settings.PQ_CURRENT_WARNING_RATIO, rated), value
+
+
+RULES = {
+    "voltage_unbalance": _voltage_unbalance,
+    "current_unbalance": _current_unbalance,
+    "over_voltage": _over_voltage,
+    "under_voltage": _under_voltage,
+    "low_power_factor": _low_power_factor,
+    "overcurrent": _overcurrent,
+}
+
+# Rules whose worst value is the smallest one seen
+LOWER_IS_WORSE = {"under_voltage", "low_power_factor"}
+
+
+def evaluate_power_quality(db: Session, ticks: dict[int, tuple[datetime, list[dict]]]):
+    """
+    Run every rule over one collector tick and keep the events table in step.
+
+    `ticks` maps meter_id to (timestamp, [phase A, B, C readings]). An event
+    opens when a rule starts firing, closes when it stops, and is split when
+    the severity changes, so each row is a run at a single severity. Open
+    events of other meters are closed once the heartbeat check finds them
+    stale. Changes are added to the session for the caller to commit.
+
+    Returns the (meter_id, rule, severity or None) transitions of this tick.
+    """
+    open_events = {
+        (event.meter_id, event.rule): event
+        for event in db.query(PowerQualityEventDB).filter(
+            PowerQualityEventDB.ended_at.is_(None),
+            PowerQualityEventDB.meter_id.in_(list(ticks)),
+        )
+    }
+
+    transitions = []
+    for meter_id, (ts, phases) in ticks.items():
+        for rule, evaluate in RULES.items():
+            severity, value = evaluate(phases)
+            event = open_events.get((meter_id, rule))
+
+            if event is not None and event.severity == severity:
+                worst = min if rule in LOWER_IS_WORSE else max
+                event.peak_value = worst(event.peak_value, value)
+                event.last_value = value
+                continue
+
+            if event is None and severity is None:
+                continue
+            transitions.append((meter_id, rule, severity))
+
+            if event is not None:
+                event.ended_at = ts
+
+            if severity is not None:
+                db.add(
+                    PowerQualityEventDB(
+                        meter_id=meter_id,
+                        rule=rule,
+                        severity=severity,
+                        started_at=ts,
+                        peak_value=value,
+                        last_value=value,
+                    )
+                )
+
+    return transitions + _close_stale_events(db, list(ticks))
+
+
+def _close_stale_events(db: Session, reporting: list[int]):
+    """
+    End the open events of meters flagged stale that did not report in
+    this tick, at their last sample; no later tick would ever close them.
+    """
+    transitions = []
+    for event, last_sample_at in (
+        db.query(PowerQualityEventDB, MeterHeartbeatDB.last_sample_at)
+        .join(MeterHeartbeatDB, MeterHeartbeatDB.meter_id == PowerQualityEventDB.meter_id)
+        .filter(
+            PowerQualityEventDB.ended_at.is_(None),
+            MeterHeartbeatDB.is_stale,
+            PowerQualityEventDB.meter_id.notin_(reporting),
+        )
+    ):
+        event.ended_at = max(last_sample_at or event.started_at, event.started_at)
+        transitions.append((event.meter_id, event.rule, None))
+    return transitions
+
+
+# Percentiles reported for unbalance series
+UNBALANCE_PERCENTILES = (50, 90, 95, 99)
+
+UNBALANCE_SOURCES = {
+    "voltage": (VoltageDB, VOLTAGE_UNBALANCE_LIMITS, VOLTAGE_STATUS_LEVELS),
+    "current": (CurrentDB, CURRENT_UNBALANCE_LIMITS, CURRENT_STATUS_LEVELS),
+}
+
+
+def _sample_durations(timestamps: np.ndarray) -> np.ndarray:
+    """
+    Seconds each sample stands for: the gap to the next sample, capped at
+    three typical intervals so collector downtime is not attributed to the
+    last reading before it.
+    """
+    if len(timestamps) < 2:
+        return np.zeros(len(timestamps))
+    gaps = np.diff(timestamps).astype("timedelta64[s]").astype(float)
+    typical = np.median(gaps)
+    return np.minimum(np.append(gaps, typical), 3 * typical)
+
+
+def unbalance_report(
+    db: Session,
+    kind: str,
+    meter_id: int,
+    start: datetime,
+    end: datetime,
+    include_series: bool = True,
+):
+    """
+    Unbalance series, percentiles and time in each status for one meter over
+    [start, end), computed with NumPy over the whole column block.
+    """
+    model, limits, levels = UNBALANCE_SOURCES[kind]
+    prefix = f"phase_{{}}_{kind}"
+
+    rows = db.execute(
+        select(
+            model.timestamp,
+            getattr(model, prefix.format("A")),
+            getattr(model, prefix.format("B")),
+            getattr(model, prefix.format("C")),
+        )
+        .where(model.meter_id == meter_id, model.timestamp >= start, model.timestamp < end)
+        .order_by(model.timestamp)
+    ).all()
+
+    if not rows:
+        return {"samples": 0}
+
+    # Transpose once into columns; far cheaper than building arrays row by row
+    ts_column, *phase_columns = zip(*rows)
+    timestamps = np.array(ts_column, dtype="datetime64[s]")
+    phases = np.column_stack(phase_columns).astype(float)
+
+    unbalance = unbalance_percent(phases)
+    status = np.digitize(unbalance, limits)
+    seconds = np.bincount(status, weights=_sample_durations(timestamps), minlength=len(levels))
+
+    report = {
+        "samples": len(rows),
+        "summary": {
+            "mean": round(float(unbalance.mean()), 2),
+            "max": float(unbalance.max()),
+            **{
+                f"p{p}": round(float(value), 2)
+                for p, value in zip(
+                    UNBALANCE_PERCENTILES, np.percentile(unbalance, UNBALANCE_PERCENTILES)
+                )
+            },
+        },
+        "time_in_status_minutes": {
+            level: round(float(seconds[i]) / 60, 1) for i, level in enumerate(levels)
+        },
+    }
+    if include_series:
+        report["series"] = {
+            "timestamp": timestamps.astype(str).tolist(),
+            "unbalance_percent": unbalance.tolist(),
+            "status": np.array(levels)[status].tolist(),
+        }
+    return report
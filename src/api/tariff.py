@@ -0,0 +1,222 @@
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..models import EnergyDB, TariffDB, TariffRateDB, TariffTierDB
+from .analysis import PHASE_COLUMNS
+from .demand import meter_peak_demand
+
+
+# How far back to look for the counter value preceding the first hour
+COUNTER_LOOKBACK = timedelta(days=1)
+# Demand charges bill the highest average power over this many minutes
+BILLING_DEMAND_WINDOW = 15
+
+
+def hourly_energy(db: Session, start: datetime, end: datetime, meter_ids=None):
+    """
+    Energy consumed per meter per hour over [start, end), as a matrix.
+
+    The database reduces the cumulative counters to one closing value per
+    meter and hour and diffs consecutive hours with lag(), so only
+    meters x hours rows leave it. Returns (meter_ids, hours, energy) where
+    energy[i, h] is the kWh of meter_ids[i] in hours[h]; negative deltas
+    (counter resets) are dropped.
+
+    After a collection gap the first delta holds the whole gap's energy;
+    it is spread evenly over the hours since the previous reading, so it
+    is neither billed at the resuming hour's rate nor counted as a spike.
+    """
+    phase_sum = sum(PHASE_COLUMNS[EnergyDB][1:], PHASE_COLUMNS[EnergyDB][0])
+    hour = func.date_trunc("hour", EnergyDB.timestamp)
+
+    query = (
+        select(
+            EnergyDB.meter_id,
+            hour.label("hour"),
+            func.min(phase_sum).label("opening"),
+            func.max(phase_sum).label("closing"),
+        )
+        .where(EnergyDB.timestamp >= start - COUNTER_LOOKBACK, EnergyDB.timestamp < end)
+        .group_by(EnergyDB.meter_id, hour)
+    )
+    if meter_ids is not None:
+        query = query.where(EnergyDB.meter_id.in_(meter_ids))
+    counters = query.subquery()
+
+    ordered = dict(partition_by=counters.c.meter_id, order_by=counters.c.hour)
+    previous = func.lag(counters.c.closing).over(**ordered)
+    previous_hour = func.lag(counters.c.hour).over(**ordered)
+    deltas = select(
+        counters.c.meter_id,
+        counters.c.hour,
+        # The first hour seen has nothing before it; bill what it recorded
+        (counters.c.closing - func.coalesce(previous, counters.c.opening)).label("delta"),
+        # Hours the delta accumulated over, 1 unless readings were missing
+        func.coalesce(
+            func.extract("epoch", counters.c.hour - previous_hour) / 3600, 1
+        ).label("span"),
+    ).subquery()
+
+    rows = db.execute(
+        select(deltas).where(deltas.c.hour >= start).order_by(deltas.c.meter_id)
+    ).all()
+
+    hours = np.arange(
+        np.datetime64(start, "h"), np.datetime64(end, "h"), dtype="datetime64[h]"
+    )
+    if not rows:
+        return np.array([], dtype=int), hours, np.zeros((0, len(hours)))
+
+    meter_column, hour_column, delta_column, span_column = zip(*rows)
+    meters, meter_index = np.unique(np.array(meter_column), return_inverse=True)
+    hour_index = (np.array(hour_column, dtype="datetime64[h]") - hours[0]).astype(int)
+    span = np.array(span_column, dtype=float).round().astype(int)
+    delta = np.clip(np.array(delta_column, dtype=float), 0, None)
+
+    # One entry per hour each delta covers, ending at the hour it was read
+    covered = np.repeat(np.arange(len(span)), span)
+    back = np.arange(len(covered)) - np.repeat(np.cumsum(span) - span, span)
+    covered_hour = hour_index[covered] - back
+    # Gap hours before `start` belong to the previous period
+    kept = covered_hour >= 0
+
+    energy = np.zeros((len(meters), len(hours)))
+    np.add.at(
+        energy,
+        (meter_index[covered[kept]], covered_hour[kept]),
+        (delta / span)[covered[kept]],
+    )
+    return meters, hours, energy
+
+
+def _calendar_fields(hours: np.ndarray):
+    """Month (1-12), weekday (0=Monday) and hour of day of each hour"""
+    month = hours.astype("datetime64[M]").astype(int) % 12 + 1
+    # 1970-01-01 was a Thursday
+    weekday = (hours.astype("datetime64[D]").astype(int) + 3) % 7
+    hour_of_day = hours.astype(int) % 24
+    return month, weekday, hour_of_day
+
+
+def _in_range(values: np.ndarray, first: int, last: int) -> np.ndarray:
+    """first <= values <= last, wrapping around when last < first"""
+    if first <= last:
+        return (values >= first) & (values <= last)
+    return (values >= first) | (values <= last)
+
+
+def rate_matrix(tariffs, rates, hours: np.ndarray) -> np.ndarray:
+    """
+    Energy rate of every tariff in every hour, shape (tariffs, hours).
+
+    Rows start at the tariff's base rate; each time-of-use period then
+    overwrites the hours it covers, later periods winning overlaps.
+    """
+    month, weekday, hour_of_day = _calendar_fields(hours)
+    row_of = {tariff.id: i for i, tariff in enumerate(tariffs)}
+
+    matrix = np.empty((len(tariffs), len(hours)))
+    matrix[:] = np.array([tariff.base_rate for tariff in tariffs])[:, None]
+
+    for period in sorted(rates, key=lambda period: period.id):
+        hours_covered = (
+            _in_range(month, period.start_month, period.end_month)
+            & np.isin(weekday, [int(day) for day in period.weekdays])
+            & _in_range(hour_of_day, period.start_hour, period.end_hour - 1)
+        )
+        matrix[row_of[period.tariff_id], hours_covered] = period.rate
+    return matrix
+
+
+def _tier_cost(tiers, totals: np.ndarray) -> np.ndarray:
+    """Block adders for each meter's monthly total, over all tiers at once"""
+    if not tiers:
+        return np.zeros(len(totals))
+    lower = np.array([tier.from_kwh for tier in tiers])
+    upper = np.array([np.inf if tier.to_kwh is None else tier.to_kwh for tier in tiers])
+    adders = np.array([tier.rate_adder for tier in tiers])
+    in_block = np.clip(totals[:, None] - lower, 0, upper - lower)
+    return in_block @ adders
+
+
+def compare_tariffs(
+    db: Session,
+    year: int,
+    month: int,
+    tariff_ids: list[int] | None = None,
+    meter_ids: list[int] | None = None,
+):
+    """
+    Bill every meter for the month under each tariff, in one pass.
+
+    The month is loaded once as a meters x hours energy matrix; energy
+    charges for all tariffs are a single matrix product with the
+    tariffs x hours rate matrix. Demand is each meter's highest
+    BILLING_DEMAND_WINDOW-minute rolling average power, from the power
+    readings.
+    """
+    query = db.query(TariffDB)
+    if tariff_ids is not None:
+        query = query.filter(TariffDB.id.in_(tariff_ids))
+    tariffs = query.order_by(TariffDB.id).all()
+    if not tariffs:
+        return []
+
+    ids = [tariff.id for tariff in tariffs]
+    rates = db.query(TariffRateDB).filter(TariffRateDB.tariff_id.in_(ids)).all()
+    tiers = {}
+    for tier in (
+        db.query(TariffTierDB)
+        .filter(TariffTierDB.tariff_id.in_(ids))
+        .order_by(TariffTierDB.from_kwh)
+    ):
+        tiers.setdefault(tier.tariff_id, []).append(tier)
+
+    _, total_days = calendar.monthrange(year, month)
+    start = datetime(year, month, 1)
+    end = start + timedelta(days=total_days)
+
+    meters, hours, energy = hourly_energy(db, start, end, meter_ids)
+    energy_cost = energy @ rate_matrix(tariffs, rates, hours).T
+    totals = energy.sum(axis=1)
+
+    peaks = {
+        row.meter_id: row.demand_kw
+        for row in meter_peak_demand(
+            db, start, end, BILLING_DEMAND_WINDOW, "month", [int(m) for m in meters]
+        )
+    }
+    peak_kw = np.array([peaks.get(meter_id) or 0.0 for meter_id in meters])
+
+    results = []
+    for i, tariff in enumerate(tariffs):
+        tier_cost = _tier_cost(tiers.get(tariff.id, []), totals)
+        demand_cost = peak_kw * tariff.demand_charge_per_kw
+        meter_totals = energy_cost[:, i] + tier_cost + demand_cost + tariff.fixed_charge
+
+        results.append(
+            {
+                "tariff_id": tariff.id,
+                "name": tariff.name,
+                "currency": tariff.currency,
+                "total_cost": round(float(meter_totals.sum()), 2),
+                "meters": [
+                    {
+                        "meter_id": int(meter_id),
+                        "energy_kwh": round(float(totals[j]), 3),
+                        "peak_kw": round(float(peak_kw[j]), 3),
+                        "energy_cost": round(float(energy_cost[j, i]), 2),
+                        "tier_cost": round(float(tier_cost[j]), 2),
+                        "demand_cost": round(float(demand_cost[j]), 2),
+                        "fixed_charge": tariff.fixed_charge,
+                        "total_cost": round(float(meter_totals[j]), 2),
+                    }
+                    for j, meter_id in enumerate(meters)
+                ],
+            }
+        )
+    return results
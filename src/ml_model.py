@@ -1,10 +1,142 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple
+import json
+import multiprocessing
+import os
 import pickle
+import queue
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 
+from sqlalchemy import Integer, cast, extract, func, select
+
+from src.database import SessionLocal
+from src.models import PowerDB
+from src.settings import settings
+from src.utils.jobs import Job, JobQueue, report_progress
+
+# ============================================================================
+# Flat array trees
+# ============================================================================
+class FlatTree(NamedTuple):
+    """A tree (or several, side by side) as parallel node arrays"""
+    feature: np.ndarray    # split feature per node, -1 at leaves
+    threshold: np.ndarray  # go left when x[feature] <= threshold
+    left: np.ndarray       # child node indices; leaves point at themselves
+    right: np.ndarray
+    value: np.ndarray      # prediction at leaves
+    depth: int             # longest root-to-leaf path
+
+
+def traverse(flat: FlatTree, roots: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """
+    Leaf values reached from each root for every row of X, level by level.
+
+    All (root, sample) pairs advance one level per step as whole-array
+    operations; pairs already at a leaf stay put, since leaves are their
+    own children. Returns an array of shape (len(roots), len(X)).
+    """
+    rows = np.arange(len(X))
+    node = np.repeat(roots[:, None], len(X), axis=1)
+    for _ in range(flat.depth):
+        feature = np.maximum(flat.feature[node], 0)
+        go_left = X[rows, feature] <= flat.threshold[node]
+        node = np.where(go_left, flat.left[node], flat.right[node])
+    return flat.value[node]
+
+
+def concat_trees(trees: List[FlatTree]) -> Tuple[FlatTree, np.ndarray]:
+    """Stack trees into one set of node arrays; returns it and the roots"""
+    sizes = np.array([len(tree.feature) for tree in trees])
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    flat = FlatTree(
+        feature=np.concatenate([tree.feature for tree in trees]),
+        threshold=np.concatenate([tree.threshold for tree in trees]),
+        left=np.concatenate([tree.left + root for tree, root in zip(trees, roots)]),
+        right=np.concatenate([tree.right + root for tree, root in zip(trees, roots)]),
+        value=np.concatenate([tree.value for tree in trees]),
+        depth=max(tree.depth for tree in trees),
+    )
+    return flat, roots
+
+
+# ============================================================================
+# Histogram split search
+# ============================================================================
+MAX_BINS = 255
+MIN_SPLIT_SAMPLES = 10
+MIN_LEAF_SAMPLES = 5
+
+
+class FeatureBins:
+    """
+    Features quantised once into at most MAX_BINS ordered bins.
+
+    Bin b of feature f holds cuts[f][b - 1] < x <= cuts[f][b], so splitting
+    after bin b is the threshold x <= cuts[f][b]. Low-cardinality features
+    (month, weekday, hour, minute) get one bin per distinct value.
+    """
+
+    def __init__(self, X, max_bins=MAX_BINS):
+        X = np.asarray(X, dtype=float)
+        self.cuts = []
+        self.codes = np.empty(X.shape, dtype=np.uint8)
+        for f in range(X.shape[1]):
+            distinct = np.unique(X[:, f])
+            if len(distinct) <= max_bins:
+                cuts = distinct[:-1]
+            else:
+                quantiles = np.linspace(0, 1, max_bins + 1)[1:-1]
+                cuts = np.unique(np.quantile(X[:, f], quantiles, method='lower'))
+            self.cuts.append(cuts)
+            self.codes[:, f] = np.searchsorted(cuts, X[:, f], side='left')
+
+    @property
+    def n_features(self):
+        return len(self.cuts)
+
+
+def _best_split(bins: FeatureBins, codes: np.ndarray, y: np.ndarray):
+    """
+    (feature, bin) minimising the children's squared error, or None.
+
+    Minimising SSE is maximising sum_left^2 / n_left + sum_right^2 / n_right;
+    both come from cumulative per-bin counts and sums, so each feature costs
+    two bincounts however many thresholds it has.
+    """
+    n = len(y)
+    total = y.sum()
+    best_score = total * total / n  # no split
+    best = None
+
+    for f in range(bins.n_features):
+        n_bins = len(bins.cuts[f]) + 1
+        if n_bins < 2:
+            continue
+        n_left = np.cumsum(np.bincount(codes[:, f], minlength=n_bins))[:-1]
+        sum_left = np.cumsum(np.bincount(codes[:, f], weights=y, minlength=n_bins))[:-1]
+        n_right = n - n_left
+        sum_right = total - sum_left
+
+        valid = (n_left >= MIN_LEAF_SAMPLES) & (n_right >= MIN_LEAF_SAMPLES)
+        if not valid.any():
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = sum_left ** 2 / n_left + sum_right ** 2 / n_right
+        score = np.where(valid, score, -np.inf)
+
+        b = int(np.argmax(score))
+        if score[b] > best_score + 1e-9 * abs(best_score):
+            best_score = score[b]
+            best = (f, b)
+
+    return best
+
+
 # ============================================================================
 # Simple Decision Tree
 # ============================================================================
@@ -12,48 +144,65 @@ class SimpleTree:
     def __init__(self, max_depth=5):
         self.max_depth = max_depth
         self.tree = None
+        self.flat = None
     
-    def fit(self, X, y, depth=0):
-        """Build a simple tree by finding best splits"""
-        if depth >= self.max_depth or len(y) < 10:
-            return np.mean(y)
-        
-        best_score = float('inf')
-        best_feature = None
-        best_split = None
-        
-        for feature in range(X.shape[1]):
-            split_value = np.median(X[:, feature])
-            left_mask = X[:, feature] <= split_value
-            right_mask = ~left_mask
-            
-            if np.sum(left_mask) < 5 or np.sum(right_mask) < 5:
+    def fit(self, X, y, indices=None, bins=None):
+        """
+        Grow the tree straight into flat node arrays.
+
+        Features are binned once (or `bins` is shared by the caller) and
+        each node scores every candidate threshold of every feature from
+        per-bin cumulative sums. Nodes only carry index arrays into the
+        training data; `indices` (e.g. a bootstrap sample) selects the rows.
+        """
+        bins = bins or FeatureBins(X)
+        y = np.asarray(y, dtype=float)
+        root_indices = np.arange(len(y)) if indices is None else np.asarray(indices)
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        depth_reached = 0
+        stack = [(root_indices, 0, None, None)]
+
+        while stack:
+            idx, depth, parent, children = stack.pop()
+            i = len(feature)
+            if parent is not None:
+                children[parent] = i
+            depth_reached = max(depth_reached, depth)
+
+            feature.append(-1)
+            threshold.append(np.inf)
+            left.append(i)
+            right.append(i)
+            value.append(y[idx].mean())
+
+            if depth >= self.max_depth or len(idx) < MIN_SPLIT_SAMPLES:
                 continue
-            
-            left_error = np.var(y[left_mask]) * np.sum(left_mask)
-            right_error = np.var(y[right_mask]) * np.sum(right_mask)
-            score = left_error + right_error
-            
-            if score < best_score:
-                best_score = score
-                best_feature = feature
-                best_split = split_value
-        
-        if best_feature is None:
-            return np.mean(y)
-        
-        left_mask = X[:, best_feature] <= best_split
-        right_mask = ~left_mask
-        
-        return {
-            'feature': best_feature,
-            'split': best_split,
-            'left': self.fit(X[left_mask], y[left_mask], depth + 1),
-            'right': self.fit(X[right_mask], y[right_mask], depth + 1)
-        }
-    
+            codes = bins.codes[idx]
+            split = _best_split(bins, codes, y[idx])
+            if split is None:
+                continue
+
+            f, b = split
+            feature[i] = f
+            threshold[i] = bins.cuts[f][b]
+            go_left = codes[:, f] <= b
+            stack.append((idx[~go_left], depth + 1, i, right))
+            stack.append((idx[go_left], depth + 1, i, left))
+
+        self.flat = FlatTree(
+            feature=np.array(feature, dtype=np.intp),
+            threshold=np.array(threshold, dtype=float),
+            left=np.array(left, dtype=np.intp),
+            right=np.array(right, dtype=np.intp),
+            value=np.array(value, dtype=float),
+            depth=depth_reached,
+        )
+        return self
+
     def predict_one(self, x, node):
-        """Predict one sample"""
+        """Predict one sample from a nested dict tree (models pickled before
+        trees were grown as arrays)"""
         if not isinstance(node, dict):
             return node
         
@@ -62,183 +211,710 @@ class SimpleTree:
         else:
             return self.predict_one(x, node['right'])
     
+    def compile(self) -> FlatTree:
+        """Flatten the nested dict tree into node arrays"""
+        feature, threshold, left, right, value = [], [], [], [], []
+
+        def add(node, depth):
+            i = len(feature)
+            feature.append(-1)
+            threshold.append(np.inf)
+            left.append(i)
+            right.append(i)
+            value.append(np.nan)
+
+            if not isinstance(node, dict):
+                value[i] = node
+                return depth
+
+            feature[i] = node['feature']
+            threshold[i] = node['split']
+            left[i] = len(feature)
+            left_depth = add(node['left'], depth + 1)
+            right[i] = len(feature)
+            right_depth = add(node['right'], depth + 1)
+            return max(left_depth, right_depth)
+
+        depth = add(self.tree, 0)
+        self.flat = FlatTree(
+            feature=np.array(feature, dtype=np.intp),
+            threshold=np.array(threshold, dtype=float),
+            left=np.array(left, dtype=np.intp),
+            right=np.array(right, dtype=np.intp),
+            value=np.array(value, dtype=float),
+            depth=depth,
+        )
+        return self.flat
+
     def predict(self, X):
         """Predict multiple samples"""
-        return np.array([self.predict_one(x, self.tree) for x in X])
+        # Models pickled before trees were compiled have no flat arrays yet
+        flat = getattr(self, 'flat', None) or self.compile()
+        return traverse(flat, np.zeros(1, dtype=np.intp), np.asarray(X))[0]
 
 
 # ============================================================================
 # Simple Random Forest
 # ============================================================================
+# Training data shared by every tree a worker process grows
+_worker_data = {}
+
+
+def _init_worker(bins, y):
+    _worker_data['bins'] = bins
+    _worker_data['y'] = y
+
+
+def _grow_tree(max_depth: int, seed: np.random.SeedSequence) -> SimpleTree:
+    """Fit one tree on a bootstrap sample drawn from its own seed"""
+    bins, y = _worker_data['bins'], _worker_data['y']
+    indices = np.random.default_rng(seed).integers(0, len(y), len(y))
+    tree = SimpleTree(max_depth=max_depth)
+    tree.fit(None, y, indices, bins)
+    return tree
+
+
 class SimpleForest:
-    def __init__(self, n_trees=10, max_depth=5):
+    def __init__(self, n_trees=10, max_depth=5, n_jobs=1, random_state=None):
         self.n_trees = n_trees
         self.max_depth = max_depth
+        self.n_jobs = n_jobs
+        self.random_state = random_state
         self.trees = []
-    
-    def fit(self, X, y):
-        """Train multiple trees on random samples"""
+        self.flat = None
+        self.roots = None
+
+    def fit(self, X, y, progress: Optional[Callable] = None):
+        """
+        Train multiple trees on random samples.
+
+        Each tree draws its bootstrap from a child of one SeedSequence, so
+        a given random_state yields the same forest whatever the number of
+        worker processes (n_jobs) or the order they finish in. `progress`,
+        if given, is called as progress(trees_done, n_trees).
+        """
         print(f"Training {self.n_trees} trees...")
-        
-        for i in range(self.n_trees):
-            indices = np.random.choice(len(X), len(X), replace=True)
-            X_sample = X[indices]
-            y_sample = y[indices]
-            
-            tree = SimpleTree(max_depth=self.max_depth)
-            tree.tree = tree.fit(X_sample, y_sample)
-            self.trees.append(tree)
-            
-            if (i + 1) % 5 == 0:
-                print(f"  {i + 1}/{self.n_trees} complete")
-        
+
+        seed = np.random.SeedSequence(self.random_state)
+        # Recorded so an unseeded run can be reproduced
+        self.random_state = seed.entropy
+        tree_seeds = seed.spawn(self.n_trees)
+
+        bins = FeatureBins(X)
+        y = np.asarray(y, dtype=float)
+        trees = [None] * self.n_trees
+
+        if self.n_jobs == 1:
+            _init_worker(bins, y)
+            for i, tree_seed in enumerate(tree_seeds):
+                trees[i] = _grow_tree(self.max_depth, tree_seed)
+                if progress:
+                    progress(i + 1, self.n_trees)
+                if (i + 1) % 5 == 0:
+                    print(f"  {i + 1}/{self.n_trees} complete")
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs, initializer=_init_worker, initargs=(bins, y)
+            ) as pool:
+                futures = {
+                    pool.submit(_grow_tree, self.max_depth, tree_seed): i
+                    for i, tree_seed in enumerate(tree_seeds)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    trees[futures[future]] = future.result()
+                    if progress:
+                        progress(done, self.n_trees)
+                    if done % 5 == 0:
+                        print(f"  {done}/{self.n_trees} complete")
+
+        self.trees = trees
+        self.compile()
         print("✓ Training done!")
-    
+
+    @classmethod
+    def from_arrays(cls, flat: FlatTree, roots: np.ndarray, **params):
+        """A forest ready to predict from stored node arrays, without trees"""
+        forest = cls(n_trees=len(roots), **params)
+        forest.flat, forest.roots = flat, roots
+        return forest
+
+    def compile(self):
+        """Stack every tree's node arrays so the forest predicts in one pass"""
+        self.flat, self.roots = concat_trees(
+            [getattr(tree, 'flat', None) or tree.compile() for tree in self.trees]
+        )
+
     def predict(self, X):
         """Average predictions from all trees"""
-        predictions = np.array([tree.predict(X) for tree in self.trees])
+        if getattr(self, 'flat', None) is None:
+            self.compile()
+        predictions = traverse(self.flat, self.roots, np.asarray(X))
         return np.mean(predictions, axis=0)
 
 
+# ============================================================================
+# Features and prediction grid
+# ============================================================================
+FEATURES = ['Month', 'DayOfWeek', 'Hour', 'Minute']
+
+
+def time_features(timestamps) -> np.ndarray:
+    """Feature matrix (n, len(FEATURES)) for any sequence of timestamps"""
+    index = pd.DatetimeIndex(timestamps)
+    return np.column_stack([index.month, index.dayofweek, index.hour, index.minute])
+
+
+# Every distinct feature row: month x day of week x hour x minute
+GRID_SHAPE = (12, 7, 24, 60)
+# Rows per forest pass while filling the grid, to bound traversal memory
+GRID_CHUNK = 20160
+
+
+def grid_index(X: np.ndarray) -> np.ndarray:
+    """Flat grid position of each Month/DayOfWeek/Hour/Minute row"""
+    X = np.asarray(X, dtype=int)
+    return np.ravel_multi_index(
+        (X[:, 0] - 1, X[:, 1], X[:, 2], X[:, 3]), GRID_SHAPE
+    )
+
+
+def build_grid(model) -> np.ndarray:
+    """
+    The model's prediction for every possible input, shape GRID_SHAPE.
+
+    About 121k rows, so one pass over the forest at training or load time
+    turns every later prediction into an array lookup.
+    """
+    month, day, hour, minute = np.indices(GRID_SHAPE).reshape(len(GRID_SHAPE), -1)
+    X = np.column_stack([month + 1, day, hour, minute])
+    grid = np.empty(len(X), dtype=np.float32)
+    for start in range(0, len(X), GRID_CHUNK):
+        grid[start:start + GRID_CHUNK] = model.predict(X[start:start + GRID_CHUNK])
+    return grid.reshape(GRID_SHAPE)
+
+
+# ============================================================================
+# Model Registry
+# ============================================================================
+NODE_ARRAYS = ['feature', 'threshold', 'left', 'right', 'value']
+
+
+class ModelRegistry:
+    """
+    Versioned models on disk as plain .npy arrays plus a JSON manifest.
+
+    Each version is a directory holding the forest's node arrays, its
+    roots and its prediction grid, all loaded memory-mapped, so startup
+    cost does not grow with the forest. A version directory is written
+    under a temporary name and renamed into place; CURRENT names the live
+    version and is swapped with os.replace, so readers never see a
+    half-written model or pointer.
+    """
+
+    MANIFEST = 'manifest.json'
+    POINTER = 'CURRENT'
+
+    def __init__(self, root: str, keep: int = 5):
+        self.root = Path(root)
+        self.keep = keep
+
+    def versions(self) -> List[str]:
+        """Complete versions, oldest first"""
+        if not self.root.exists():
+            return []
+        return sorted(
+            path.name for path in self.root.iterdir()
+            if not path.name.startswith('.') and (path / self.MANIFEST).exists()
+        )
+
+    def current(self) -> Optional[str]:
+        pointer = self.root / self.POINTER
+        if not pointer.exists():
+            return None
+        return pointer.read_text().strip() or None
+
+    def manifest(self, version: str) -> Dict:
+        if version not in self.versions():
+            raise FileNotFoundError(f"Model version {version} not found")
+        return json.loads((self.root / version / self.MANIFEST).read_text())
+
+    def save(self, model: 'SimpleForest', stats: Dict, grid: np.ndarray) -> str:
+        """Write a new version (not yet live) and return its name"""
+        version = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+        staging = self.root / f".{version}"
+        staging.mkdir(parents=True)
+        if getattr(model, 'flat', None) is None:
+            model.compile()
+
+        for name in NODE_ARRAYS:
+            np.save(staging / f"{name}.npy", getattr(model.flat, name))
+        np.save(staging / "roots.npy", model.roots)
+        np.save(staging / "grid.npy", np.asarray(grid, dtype=np.float32))
+
+        manifest = {
+            'version': version,
+            'features': FEATURES,
+            'depth': int(model.flat.depth),
+            'n_trees': len(model.roots),
+            'max_depth': model.max_depth,
+            'random_state': model.random_state,
+            'stats': stats,
+            'created_at': datetime.now().isoformat(),
+        }
+        (staging / self.MANIFEST).write_text(json.dumps(manifest, indent=2))
+        os.replace(staging, self.root / version)
+        return version
+
+    def load(self, version: str) -> Tuple['SimpleForest', Dict, np.ndarray]:
+        """Memory-map a version's forest, stats and grid"""
+        manifest = self.manifest(version)
+        if manifest['features'] != FEATURES:
+            raise ValueError(f"Model version {version} uses features {manifest['features']}")
+
+        path = self.root / version
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode='r') for name in NODE_ARRAYS}
+        model = SimpleForest.from_arrays(
+            FlatTree(**arrays, depth=manifest['depth']),
+            np.load(path / "roots.npy"),
+            max_depth=manifest['max_depth'],
+            random_state=manifest['random_state'],
+        )
+        return model, manifest['stats'], np.load(path / "grid.npy", mmap_mode='r')
+
+    def promote(self, version: str):
+        """Make `version` the live model"""
+        if version not in self.versions():
+            raise FileNotFoundError(f"Model version {version} not found")
+        staging = self.root / f".{self.POINTER}"
+        with open(staging, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, self.root / self.POINTER)
+        self.prune()
+
+    def previous(self) -> str:
+        """The newest version older than the live one"""
+        current = self.current()
+        older = [version for version in self.versions() if current is None or version < current]
+        if not older:
+            raise ValueError("No earlier model version to roll back to")
+        return older[-1]
+
+    def prune(self):
+        """Drop the oldest versions beyond `keep`, never the live one"""
+        current = self.current()
+        stale = [version for version in self.versions() if version != current]
+        for version in stale[:max(len(stale) - (self.keep - 1), 0)]:
+            shutil.rmtree(self.root / version, ignore_errors=True)
+
+    def discard(self, version: str):
+        """Delete a version that never went live"""
+        if version == self.current():
+            raise ValueError(f"Model version {version} is live")
+        shutil.rmtree(self.root / version, ignore_errors=True)
+
+
+# ============================================================================
+# Training
+# ============================================================================
+# Validation a trained model must pass before it may go live
+MIN_MODEL_R2 = 0.0
+# Rows fetched per round trip when training from the database
+TRAINING_CHUNK = 50_000
+
+
+def load_training_csv(
+    csv_path: str, progress: Optional[Callable] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Features and kW targets from a Time,Main_Transformer export"""
+    print("Loading data...")
+    df = pd.read_csv(csv_path)
+
+    df['DateTime'] = pd.to_datetime(df['Time'], format='%m/%d/%Y %H:%M')
+
+    # Clean power data
+    df['Power'] = df['Main_Transformer'].str.replace(',', '').str.replace(' W', '').astype(float) / 1000
+    df = df.dropna(subset=['Power'])
+
+    print(f"✓ Loaded {len(df)} records")
+    if progress:
+        progress('loading', len(df), len(df))
+    return time_features(df['DateTime']), df['Power'].values
+
+
+def load_training_db(
+    meter_id: int,
+    start: datetime,
+    end: datetime,
+    hourly: bool = False,
+    progress: Optional[Callable] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Features and kW targets for one meter's PowerDB readings in [start, end).
+
+    The database computes the feature columns and the three-phase total,
+    and rows stream through a server-side cursor in TRAINING_CHUNK blocks
+    into arrays sized by a count up front, so memory stays at the size of
+    the result arrays however long the range. With `hourly`, readings are
+    averaged per hour first (minute is then always 0).
+    """
+    power_kw = (
+        PowerDB.phase_A_active_power + PowerDB.phase_B_active_power + PowerDB.phase_C_active_power
+    ) / 1000
+    timestamp = func.date_trunc('hour', PowerDB.timestamp) if hourly else PowerDB.timestamp
+    power = func.avg(power_kw) if hourly else power_kw
+
+    base = select(timestamp.label('timestamp'), power.label('power')).where(
+        PowerDB.meter_id == meter_id,
+        PowerDB.timestamp >= start,
+        PowerDB.timestamp < end,
+    )
+    if hourly:
+        base = base.group_by(timestamp)
+    readings = base.subquery()
+
+    # ISO weekday minus one matches pandas' dayofweek (0=Monday)
+    query = select(
+        cast(extract('month', readings.c.timestamp), Integer),
+        cast(extract('isodow', readings.c.timestamp), Integer) - 1,
+        cast(extract('hour', readings.c.timestamp), Integer),
+        cast(extract('minute', readings.c.timestamp), Integer),
+        readings.c.power,
+    ).order_by(readings.c.timestamp)
+
+    db = SessionLocal()
+    try:
+        total = db.execute(select(func.count()).select_from(readings)).scalar_one()
+        X = np.empty((total, len(FEATURES)), dtype=np.int16)
+        y = np.empty(total)
+
+        filled = 0
+        result = db.execute(query.execution_options(yield_per=TRAINING_CHUNK))
+        for rows in result.partitions():
+            # Readings committed after the count are left out
+            chunk = np.array(rows[:total - filled], dtype=float)
+            if not len(chunk):
+                break
+            X[filled:filled + len(chunk)] = chunk[:, :len(FEATURES)]
+            y[filled:filled + len(chunk)] = chunk[:, len(FEATURES)]
+            filled += len(chunk)
+            if progress:
+                progress('loading', filled, total)
+        result.close()
+    finally:
+        db.close()
+
+    if not filled:
+        raise ValueError(f"No power readings for meter {meter_id} between {start} and {end}")
+    print(f"✓ Loaded {filled} records for meter {meter_id}")
+    return X[:filled], y[:filled]
+
+
+def train_forest(
+    X: np.ndarray, y: np.ndarray, progress: Optional[Callable] = None
+) -> Tuple['SimpleForest', Dict]:
+    """Fit a forest on 80% of the rows and score it on the rest"""
+    # Split into train/test
+    split = int(0.8 * len(X))
+    indices = np.random.permutation(len(X))
+    X_train, y_train = X[indices[:split]], y[indices[:split]]
+    X_test, y_test = X[indices[split:]], y[indices[split:]]
+
+    model = SimpleForest(
+        n_trees=settings.FOREST_TREES,
+        max_depth=8,
+        n_jobs=settings.TRAINING_WORKERS,
+    )
+    model.fit(
+        X_train, y_train,
+        progress=progress and (lambda done, total: progress('training', done, total)),
+    )
+
+    # Evaluate
+    y_pred = model.predict(X_test)
+    mae = np.mean(np.abs(y_pred - y_test))
+    rmse = np.sqrt(np.mean((y_pred - y_test) ** 2))
+    r2 = 1 - np.sum((y_test - y_pred) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2)
+
+    stats = {
+        'mae': float(mae),
+        'rmse': float(rmse),
+        'r2': float(r2),
+        'train_samples': len(X_train),
+        'test_samples': len(X_test),
+        'power_range': {
+            'min': float(np.min(y)),
+            'max': float(np.max(y)),
+            'mean': float(np.mean(y))
+        },
+        'trained_at': datetime.now().isoformat()
+    }
+    return model, stats
+
+
+def validate_model(stats: Dict, grid: np.ndarray) -> Optional[str]:
+    """Why a trained model must not go live, or None if it may"""
+    if not stats['test_samples']:
+        return "no test samples to score it on"
+    if not np.isfinite(stats['r2']):
+        return "R² is undefined (the test targets do not vary)"
+    if stats['r2'] < MIN_MODEL_R2:
+        return f"R² {stats['r2']:.4f} is below {MIN_MODEL_R2}"
+    if grid.shape != GRID_SHAPE or not np.isfinite(grid).all():
+        return "prediction grid has missing or non-finite values"
+    return None
+
+
+def _training_process(loader: Callable, args: tuple, registry_root: str, messages):
+    """
+    Body of a training process: load, fit, build the grid and store an
+    unpromoted registry version. Reports ('progress', {...}) while working
+    and finally ('done', version) or ('error', message) on `messages`.
+    """
+    def progress(stage, done=0, total=0):
+        messages.put(('progress', {'stage': stage, 'done': done, 'total': total}))
+
+    try:
+        progress('loading')
+        X, y = loader(*args, progress=progress)
+        model, stats = train_forest(X, y, progress)
+        progress('grid')
+        grid = build_grid(model)
+        progress('saving')
+        messages.put(('done', ModelRegistry(registry_root).save(model, stats, grid)))
+    except Exception as e:
+        messages.put(('error', f"{type(e).__name__}: {e}"))
+
+
 # ============================================================================
 # Power Prediction Service
 # ============================================================================
+class LoadedModel(NamedTuple):
+    """Everything predictions read, replaced as a single reference"""
+    model: 'SimpleForest'
+    stats: Dict
+    grid: np.ndarray
+    version: Optional[str]
+
+
+TRAINING_JOB = ('training',)
+
+
 class PowerPredictionService:
     """Service for managing and using the power prediction model"""
     
-    def __init__(self, model_path: str = "data/power_model.pkl"):
+    def __init__(self, model_path: str = "data/power_model.pkl", registry_path: str = "data/models"):
+        # Pickled models predate the registry and are only read as a fallback
         self.model_path = Path(model_path)
-        self.model = None
-        self.model_stats = None
-        
+        self.grid_path = self.model_path.with_suffix('.grid.npy')
+        self.registry = ModelRegistry(registry_path, keep=settings.MODEL_KEEP)
+        # Swapped whole, so a request never mixes two models' parts
+        self.loaded: Optional[LoadedModel] = None
+        # Training gets its own worker so it never holds up billing jobs;
+        # a failed run may be retried straight away with other data
+        self.jobs = JobQueue(max_workers=1, retry_after=0, name="training")
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.loaded.version if self.loaded else None
+
     def train_model(self, csv_path: str) -> Dict:
-        """Train a new model from CSV data"""
-        print("Loading data...")
-        df = pd.read_csv(csv_path)
-        
-        # Extract time features
-        df['DateTime'] = pd.to_datetime(df['Time'], format='%m/%d/%Y %H:%M')
-        df['Month'] = df['DateTime'].dt.month
-        df['DayOfWeek'] = df['DateTime'].dt.dayofweek
-        df['Hour'] = df['DateTime'].dt.hour
-        df['Minute'] = df['DateTime'].dt.minute
-        
-        # Clean power data
-        df['Power'] = df['Main_Transformer'].str.replace(',', '').str.replace(' W', '').astype(float) / 1000
-        df = df.dropna(subset=['Power'])
-        
-        print(f"✓ Loaded {len(df)} records")
-        
-        # Prepare features
-        features = ['Month', 'DayOfWeek', 'Hour', 'Minute']
-        X = df[features].values
-        y = df['Power'].values
-        
-        # Split into train/test
-        split = int(0.8 * len(X))
-        indices = np.random.permutation(len(X))
-        X_train, y_train = X[indices[:split]], y[indices[:split]]
-        X_test, y_test = X[indices[split:]], y[indices[split:]]
-        
-        # Train model
-        self.model = SimpleForest(n_trees=10, max_depth=8)
-        self.model.fit(X_train, y_train)
-        
-        # Evaluate
-        y_pred = self.model.predict(X_test)
-        mae = np.mean(np.abs(y_pred - y_test))
-        rmse = np.sqrt(np.mean((y_pred - y_test) ** 2))
-        r2 = 1 - np.sum((y_test - y_pred) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2)
-        
-        self.model_stats = {
-            'mae': float(mae),
-            'rmse': float(rmse),
-            'r2': float(r2),
-            'train_samples': len(X_train),
-            'test_samples': len(X_test),
-            'power_range': {
-                'min': float(df['Power'].min()),
-                'max': float(df['Power'].max()),
-                'mean': float(df['Power'].mean())
-            },
-            'trained_at': datetime.now().isoformat()
-        }
-        
-        # Save model
-        self.save_model()
-        
-        return self.model_stats
-    
-    def save_model(self):
-        """Save model to disk"""
-        self.model_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.model_path, 'wb') as f:
-            pickle.dump({
-                'model': self.model,
-                'stats': self.model_stats
-            }, f)
-        print(f"✓ Model saved to {self.model_path}")
-    
-    def load_model(self):
-        """Load model from disk"""
+        """Train a new model from CSV data in this process and make it live"""
+        model, stats = train_forest(*load_training_csv(csv_path))
+        grid = build_grid(model)
+
+        problem = validate_model(stats, grid)
+        if problem:
+            raise ValueError(f"Trained model rejected: {problem}")
+
+        version = self.registry.save(model, stats, grid)
+        self.registry.promote(version)
+        self.loaded = LoadedModel(model, stats, grid, version)
+        print(f"✓ Model saved as version {version}")
+        return stats
+
+    def train_in_background(self, loader: Callable, *args) -> Dict:
+        """
+        Job body: train in a separate process, relaying its progress to the
+        job, then validate the stored version and hot-swap it in.
+
+        The process is spawned rather than forked so it starts clean of the
+        server's threads; it still runs the forest's own worker pool.
+        """
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        process = context.Process(
+            target=_training_process,
+            args=(loader, args, str(self.registry.root), messages),
+            name='training',
+        )
+        process.start()
+        try:
+            version = None
+            while version is None:
+                try:
+                    kind, payload = messages.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"Training process died (exit code {process.exitcode})")
+                    continue
+                if kind == 'progress':
+                    report_progress(**payload)
+                elif kind == 'error':
+                    raise RuntimeError(payload)
+                else:
+                    version = payload
+        finally:
+            process.join()
+
+        report_progress(stage='validating', done=0, total=0)
+        model, stats, grid = self.registry.load(version)
+        problem = validate_model(stats, grid)
+        if problem:
+            self.registry.discard(version)
+            raise ValueError(f"Trained model rejected: {problem}")
+
+        self.registry.promote(version)
+        self.loaded = LoadedModel(model, stats, grid, version)
+        print(f"✓ Model version {version} is live")
+        return {'version': version, 'stats': stats}
+
+    def submit_training(
+        self, loader: Callable, *args, cleanup: Optional[Path] = None
+    ) -> Optional[Job]:
+        """
+        Queue background training; `cleanup` is deleted once it finishes.
+
+        Returns None, after deleting `cleanup`, if another training job is
+        already queued or running.
+        """
+        def run():
+            try:
+                return self.train_in_background(loader, *args)
+            finally:
+                if cleanup is not None:
+                    cleanup.unlink(missing_ok=True)
+
+        job = self.jobs.submit_exclusive(TRAINING_JOB, run)
+        if job is None and cleanup is not None:
+            cleanup.unlink(missing_ok=True)
+        return job
+
+    def load_model(self, version: Optional[str] = None):
+        """Load the live registry version (or `version`), else the legacy pickle"""
+        version = version or self.registry.current()
+        if version is not None:
+            self.loaded = LoadedModel(*self.registry.load(version), version)
+            print(f"✓ Model version {version} loaded")
+            return
+
         if not self.model_path.exists():
             raise FileNotFoundError(f"Model not found at {self.model_path}")
         
         with open(self.model_path, 'rb') as f:
             data = pickle.load(f)
-            self.model = data['model']
-            self.model_stats = data['stats']
+
+        # A grid older than the model was built from a previous one
+        if (
+            not self.grid_path.exists()
+            or self.grid_path.stat().st_mtime < self.model_path.stat().st_mtime
+        ):
+            np.save(self.grid_path, build_grid(data['model']))
+        grid = np.load(self.grid_path, mmap_mode='r')
+        self.loaded = LoadedModel(data['model'], data['stats'], grid, None)
         print(f"✓ Model loaded from {self.model_path}")
-    
+
+    def list_models(self) -> List[Dict]:
+        """Every stored version with its stats, newest first"""
+        current = self.registry.current()
+        return [
+            {
+                'version': version,
+                'live': version == current,
+                'created_at': manifest['created_at'],
+                'n_trees': manifest['n_trees'],
+                'stats': manifest['stats'],
+            }
+            for version in reversed(self.registry.versions())
+            for manifest in [self.registry.manifest(version)]
+        ]
+
+    def promote(self, version: str):
+        """Load `version`, then point the registry at it"""
+        self.load_model(version)
+        self.registry.promote(version)
+
+    def rollback(self) -> str:
+        """Go back to the version before the live one"""
+        version = self.registry.previous()
+        self.promote(version)
+        return version
+
+    def _require_model(self) -> LoadedModel:
+        loaded = self.loaded
+        if loaded is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        return loaded
+
+    def predict_features(self, X: np.ndarray) -> np.ndarray:
+        """Predict every row of a (n, 4) Month/DayOfWeek/Hour/Minute matrix"""
+        grid = self._require_model().grid
+        return grid.reshape(-1)[grid_index(X)].astype(float)
+
+    def predict_batch(self, timestamps) -> np.ndarray:
+        """Predict power in kW at each timestamp, as one grid lookup"""
+        return self.predict_features(time_features(timestamps))
+
     def predict_single(self, month: int, day_of_week: int, hour: int, minute: int) -> float:
         """Predict power for a single time point"""
-        if self.model is None:
-            raise ValueError("Model not loaded. Call load_model() first.")
-        
-        X = np.array([[month, day_of_week, hour, minute]])
-        prediction = self.model.predict(X)[0]
-        return float(prediction)
-    
+        grid = self._require_model().grid
+        return float(grid[month - 1, day_of_week, hour, minute])
+
+    def _predict_days(
+        self, month: int, days: List[int], interval_minutes: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Predictions of shape (len(days), slots per day), sliced from the grid"""
+        grid = self._require_model().grid
+        hours = np.repeat(np.arange(24), len(range(0, 60, interval_minutes)))
+        minutes = np.tile(np.arange(0, 60, interval_minutes), 24)
+        powers = grid[month - 1, days][:, :, ::interval_minutes]
+        return powers.reshape(len(days), len(hours)).astype(float), hours, minutes
+
+    @staticmethod
+    def _day_series(powers, hours, minutes) -> List[Dict]:
+        return [
+            {
+                'hour': int(hour),
+                'minute': int(minute),
+                'time': f"{hour:02d}:{minute:02d}",
+                'power_kw': round(float(power), 2)
+            }
+            for hour, minute, power in zip(hours, minutes, powers)
+        ]
+
     def predict_24h(self, month: int, day_of_week: int, interval_minutes: int = 5) -> List[Dict]:
         """Generate 24-hour predictions"""
-        if self.model is None:
-            raise ValueError("Model not loaded. Call load_model() first.")
-        
-        predictions = []
-        
-        for hour in range(24):
-            for minute in range(0, 60, interval_minutes):
-                pred = self.predict_single(month, day_of_week, hour, minute)
-                predictions.append({
-                    'hour': hour,
-                    'minute': minute,
-                    'time': f"{hour:02d}:{minute:02d}",
-                    'power_kw': round(pred, 2)
-                })
-        
-        return predictions
-    
+        powers, hours, minutes = self._predict_days(month, [day_of_week], interval_minutes)
+        return self._day_series(powers[0], hours, minutes)
+
     def predict_week(self, month: int, start_day: int = 0) -> Dict[str, List[Dict]]:
         """Generate predictions for a full week"""
-        if self.model is None:
-            raise ValueError("Model not loaded. Call load_model() first.")
-        
         day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        week_predictions = {}
-        
-        for i in range(7):
-            day_of_week = (start_day + i) % 7
-            day_name = day_names[day_of_week]
-            week_predictions[day_name] = self.predict_24h(month, day_of_week, interval_minutes=60)
-        
-        return week_predictions
-    
+        days = [(start_day + i) % 7 for i in range(7)]
+        powers, hours, minutes = self._predict_days(month, days, 60)
+
+        return {
+            day_names[day]: self._day_series(powers[i], hours, minutes)
+            for i, day in enumerate(days)
+        }
+
     def get_stats(self) -> Dict:
         """Get model statistics"""
-        if self.model_stats is None:
+        if self.loaded is None:
             raise ValueError("Model stats not available. Train or load model first.")
-        return self.model_stats
+        return self.loaded.stats
 
 
 # Global instance
-power_prediction_service = PowerPredictionService()
\ No newline at end of file
+power_prediction_service = PowerPredictionService()
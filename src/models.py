@@ -4,8 +4,10 @@ from sqlalchemy import (
     Column,
     Index,
     String,
+    Date,
     DateTime,
     Boolean,
+    Computed,
     Float,
     Integer,
     ForeignKey,
@@ -122,6 +124,45 @@ class EnergyDB(Base):
     )
 
 
+class DailyEnergyDB(Base):
+    """
+    Energy ledger: first and last counter readings per meter per day,
+    maintained by the collector so billing never rescans EnergyDB.
+    """
+
+    __tablename__ = "daily_energy"
+
+    meter_id = Column(
+        Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), primary_key=True
+    )
+    day = Column(Date, primary_key=True)
+
+    first_timestamp = Column(DateTime, nullable=False)
+    first_a = Column(Float, nullable=False)
+    first_b = Column(Float, nullable=False)
+    first_c = Column(Float, nullable=False)
+
+    last_timestamp = Column(DateTime, nullable=False)
+    last_a = Column(Float, nullable=False)
+    last_b = Column(Float, nullable=False)
+    last_c = Column(Float, nullable=False)
+
+    energy = Column(
+        Float,
+        Computed(
+            "(last_a - first_a) + (last_b - first_b) + (last_c - first_c)",
+            persisted=True,
+        ),
+    )
+
+    # Set whenever the row changes; cleared once billing has consumed it
+    is_dirty = Column(Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        Index("idx_daily_energy_dirty", "day", postgresql_where=is_dirty),
+    )
+
+
 class BillingDB(Base):
     __tablename__ = "billing"
 
@@ -132,6 +173,8 @@ class BillingDB(Base):
     expensive_day = Column(Integer, nullable=False)
     expensive_day_cost = Column(Float, nullable=False)
 
+    __table_args__ = (UniqueConstraint("date", name="unique_billing_date"),)
+
 
 class CostPerDayDB(Base):
     __tablename__ = "cost_per_day"
@@ -141,6 +184,8 @@ class CostPerDayDB(Base):
     day = Column(Integer, nullable=False)
     cost = Column(Float, nullable=False)
 
+    __table_args__ = (UniqueConstraint("date", "day", name="unique_cost_per_day"),)
+
 
 class CostPerMeterDB(Base):
     __tablename__ = "cost_per_meter"
@@ -155,6 +200,77 @@ class CostPerMeterDB(Base):
     __table_args__ = (UniqueConstraint("date", "meter_id", name="unique_constraint"),)
 
 
+class CostPerMeterDayDB(Base):
+    """Billed energy and cost per meter per day, for drill-down and ranges"""
+
+    __tablename__ = "cost_per_meter_day"
+
+    id = Column(Integer, primary_key=True, index=True)
+    meter_id = Column(
+        Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), nullable=False
+    )
+    day = Column(Date, nullable=False)
+    energy = Column(Float, nullable=False)
+    cost = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("meter_id", "day", name="unique_cost_per_meter_day"),
+        Index("idx_cost_per_meter_day_day", "day"),
+    )
+
+
+class TariffDB(Base):
+    """
+    A tariff: base energy rate overridden by time-of-use periods, plus
+    consumption tiers, a demand charge and a fixed monthly charge per meter.
+    """
+
+    __tablename__ = "tariffs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+    currency = Column(String, nullable=False, default="NPR")
+    base_rate = Column(Float, nullable=False)  # per kWh outside every period
+    demand_charge_per_kw = Column(Float, nullable=False, default=0)
+    fixed_charge = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=get_nepal_time)
+
+
+class TariffRateDB(Base):
+    """Time-of-use period; later periods win where they overlap"""
+
+    __tablename__ = "tariff_rates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tariff_id = Column(
+        Integer, ForeignKey("tariffs.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    rate = Column(Float, nullable=False)  # per kWh
+
+    # Inclusive month range (wraps over the new year, e.g. 11..2)
+    start_month = Column(Integer, nullable=False, default=1)
+    end_month = Column(Integer, nullable=False, default=12)
+    # Weekdays as digits, 0=Monday
+    weekdays = Column(String, nullable=False, default="0123456")
+    # Hour range [start_hour, end_hour), wraps over midnight when end < start
+    start_hour = Column(Integer, nullable=False, default=0)
+    end_hour = Column(Integer, nullable=False, default=24)
+
+
+class TariffTierDB(Base):
+    """Per-kWh adder for monthly consumption falling inside this block"""
+
+    __tablename__ = "tariff_tiers"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tariff_id = Column(
+        Integer, ForeignKey("tariffs.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    from_kwh = Column(Float, nullable=False)
+    to_kwh = Column(Float, nullable=True)  # NULL = unbounded
+    rate_adder = Column(Float, nullable=False)
+
+
 class MeterStatusDB(Base):
     __tablename__ = "meter_status"
 
@@ -169,6 +285,59 @@ class MeterStatusDB(Base):
     alert_active = Column(Boolean, nullable=False, default=False)
 
 
+class MeterHeartbeatDB(Base):
+    """Collector's view of each meter, one row per meter, updated every tick"""
+
+    __tablename__ = "meter_heartbeat"
+
+    meter_id = Column(
+        Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), primary_key=True
+    )
+
+    last_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    # Newest reading timestamp (meter local time) and when it last advanced
+    last_sample_at = Column(DateTime, nullable=True)
+    last_fresh_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Seconds between the last two collection attempts
+    interval_seconds = Column(Float, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+
+    is_stale = Column(Boolean, nullable=False, default=False)
+
+
+class PowerQualityEventDB(Base):
+    """A contiguous run of ticks during which one rule fired at one severity"""
+
+    __tablename__ = "power_quality_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    meter_id = Column(
+        Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), nullable=False
+    )
+    rule = Column(String, nullable=False)
+    severity = Column(String, nullable=False)
+
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=True)  # NULL while still active
+
+    peak_value = Column(Float, nullable=False)
+    last_value = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "idx_pq_events_meter_started", "meter_id", "rule", "severity", "started_at"
+        ),
+        Index("idx_pq_events_started", "started_at"),
+        Index(
+            "idx_pq_events_open",
+            "meter_id",
+            postgresql_where=ended_at.is_(None),
+        ),
+    )
+
+
 class DataCollectionScheduleDB(Base):
     """Stores the current data collection schedule configuration"""
 
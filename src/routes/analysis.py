@@ -1,114 +1,102 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import func, desc, cast, Date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, cast, Date
 from sqlalchemy.orm import Session
 from ..models import EnergyDB, MeterDB, PowerDB, VoltageDB, CurrentDB
 from ..database import get_db
-from ..api.iammeter import voltage_status, calculate_unbalance, current_status
+from ..api.analysis import (
+    AGGREGATES,
+    GRANULARITIES,
+    METRICS,
+    PHASE_COLUMNS,
+    aggregate,
+    average_by_meter,
+    latest_readings,
+)
+from ..api.demand import DEMAND_WINDOWS, peak_demand, top_demand_intervals
 from ..api.iammeter import get_meter_id_by_name
-from datetime import datetime, date
+from ..api.power_quality import (
+    calculate_unbalance,
+    current_status,
+    unbalance_report,
+    voltage_status,
+)
+from ..utils.cache import result_cache
+from ..utils.http_cache import (
+    data_watermark,
+    is_closed_year,
+    latest_timestamps,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
+from datetime import datetime, date, timedelta
+from typing import List, Literal
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
+# Live views are invalidated by the collector after every tick; the TTL only
+# bounds how long an entry can outlive a collector that stopped running.
+LIVE_CACHE_TTL = 5 * 60
+
 @router.get("/avg_consumption_yearly")
 def get_yearly_consumption_and_power(
     year: int = Query(..., ge=2000),
     db: Session = Depends(get_db)
 ):
-    start_date = date(year, 1, 1)
-    end_date = date(year + 1, 1, 1)
+    start_date = datetime(year, 1, 1)
+    end_date = datetime(year + 1, 1, 1)
 
-    meters = db.query(MeterDB).all()
-    result = []
+    rows = average_by_meter(db, start_date, end_date, PowerDB, EnergyDB)
 
-    for m in meters:
-        power_data = (
-            db.query(
-                func.avg(PowerDB.phase_A_active_power),
-                func.avg(PowerDB.phase_B_active_power),
-                func.avg(PowerDB.phase_C_active_power),
-            )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .filter(PowerDB.timestamp >= start_date)
-            .filter(PowerDB.timestamp < end_date)
-            .one()
-        )
-
-        energy_data = (
-            db.query(
-                func.avg(EnergyDB.phase_A_grid_consumption),
-                func.avg(EnergyDB.phase_B_grid_consumption),
-                func.avg(EnergyDB.phase_C_grid_consumption),
-            )
-            .filter(EnergyDB.meter_id == m.meter_id)
-            .filter(EnergyDB.timestamp >= start_date)
-            .filter(EnergyDB.timestamp < end_date)
-            .one()
-        )
-
-        total_avg_power = sum(v or 0 for v in power_data)
-        total_avg_energy = sum(v or 0 for v in energy_data)
-
-        result.append({
-            "meter_name": m.name,
+    return [
+        {
+            "meter_name": row.meter_name,
             "year": year,
-            "average_power": total_avg_power,
-            "average_energy": total_avg_energy,
-        })
-
-    return result
+            "average_power": sum(
+                getattr(row, column.key) or 0 for column in PHASE_COLUMNS[PowerDB]
+            ),
+            "average_energy": sum(
+                getattr(row, column.key) or 0 for column in PHASE_COLUMNS[EnergyDB]
+            ),
+        }
+        for row in rows
+    ]
 
 
 @router.get("/prev_curr_power")
 def get_previous_current_power(db: Session = Depends(get_db)):
-    meters = db.query(MeterDB).all()
-    result = []
-
-    for m in meters:
-        latest_power = (
-            db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
-                PowerDB.timestamp,
-            )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .order_by(desc(PowerDB.timestamp))
-            .first()
-        )
-
-        previous_power = (
-            db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
-                PowerDB.timestamp,
-            )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .order_by(desc(PowerDB.timestamp))
-            .offset(1)
-            .first()
-        )
+    return result_cache.get_or_compute(
+        result_cache.key("analysis:prev_curr_power"),
+        LIVE_CACHE_TTL,
+        lambda: _previous_current_power(db),
+    )
 
-        def avg_power(row):
-            if not row:
-                return None
-            return (
-                (row.phase_A_active_power or 0) +
-                (row.phase_B_active_power or 0) +
-                (row.phase_C_active_power or 0)
-            ) / 3
 
-        current_avg_power = avg_power(latest_power)
-        previous_avg_power = avg_power(previous_power)
+def _previous_current_power(db: Session):
+    def avg_power(row):
+        if not row:
+            return None
+        return (
+            (row.phase_A_active_power or 0) +
+            (row.phase_B_active_power or 0) +
+            (row.phase_C_active_power or 0)
+        ) / 3
 
-        result.append({
-            "meter_name": m.name,
-            "current_power": current_avg_power,
-            "previous_power": previous_avg_power,
-        })
-
-    return result
+    # rank 1 is the newest reading, rank 2 the one before it
+    readings = {}
+    for row in latest_readings(db, PowerDB, depth=2):
+        meter = readings.setdefault(row.meter_id, {"meter_name": row.meter_name})
+        if row.rank is not None:
+            meter[row.rank] = row
 
+    return [
+        {
+            "meter_name": meter["meter_name"],
+            "current_power": avg_power(meter.get(1)),
+            "previous_power": avg_power(meter.get(2)),
+        }
+        for meter in readings.values()
+    ]
 
 
 @router.get("/avg_daily_energy")
@@ -117,6 +105,14 @@ def get_avg_daily_energy_across_meters(
     to_date: date = Query(...),
     db: Session = Depends(get_db)
 ):
+    return result_cache.get_or_compute(
+        result_cache.key("analysis:avg_daily_energy", from_date, to_date),
+        LIVE_CACHE_TTL,
+        lambda: _avg_daily_energy(from_date, to_date, db),
+    )
+
+
+def _avg_daily_energy(from_date: date, to_date: date, db: Session):
     # per-meter daily energy
     per_meter_daily = (
         db.query(
@@ -154,70 +150,226 @@ def get_avg_daily_energy_across_meters(
     ]
 
     
+def _resolve_meters(db: Session, meters: List[str] | None) -> dict:
+    """meter_id -> name for the requested meter names, or for all meters"""
+    meter_query = db.query(MeterDB.meter_id, MeterDB.name)
+    if meters:
+        meter_query = meter_query.filter(MeterDB.name.in_(meters))
+    meter_names = dict(meter_query.all())
+
+    if meters:
+        missing = set(meters) - set(meter_names.values())
+        if missing:
+            raise HTTPException(
+                status_code=404, detail=f"Meter not found: {', '.join(sorted(missing))}"
+            )
+    return meter_names
+
+
+def _check_window(window_minutes: int):
+    if window_minutes not in DEMAND_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window_minutes must be one of {list(DEMAND_WINDOWS)}",
+        )
+
+
+def _date_range(from_date: date, to_date: date) -> tuple[datetime, datetime]:
+    """Inclusive date range as a half-open datetime interval"""
+    if from_date > to_date:
+        raise HTTPException(
+            status_code=400, detail="from_date cannot be later than to_date"
+        )
+    return (
+        datetime.combine(from_date, datetime.min.time()),
+        datetime.combine(to_date + timedelta(days=1), datetime.min.time()),
+    )
+
+
+@router.get("/aggregate")
+def get_aggregate(
+    metrics: List[Literal[tuple(METRICS)]] = Query(...),
+    aggregates: List[Literal[tuple(AGGREGATES)]] = Query(["avg"]),
+    granularity: Literal[GRANULARITIES] = Query("day"),
+    meters: List[str] = Query(None, description="Meter names; all meters if omitted"),
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    db: Session = Depends(get_db),
+):
+    meter_names = _resolve_meters(db, meters)
+
+    buckets = aggregate(
+        db,
+        list(dict.fromkeys(metrics)),
+        list(dict.fromkeys(aggregates)),
+        granularity,
+        *_date_range(from_date, to_date),
+        meter_ids=list(meter_names) if meters else None,
+    )
+
+    return {
+        "success": True,
+        "granularity": granularity,
+        "from_date": from_date,
+        "to_date": to_date,
+        "data": [
+            {
+                "meter_name": meter_names.get(meter_id),
+                "bucket": bucket,
+                **values,
+            }
+            for (meter_id, bucket), values in sorted(buckets.items())
+        ],
+    }
+
+
+@router.get("/peak_demand")
+def get_peak_demand(
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    granularity: Literal["day", "month"] = Query("month"),
+    window_minutes: int = Query(15, description="Rolling window: 15 or 30"),
+    meters: List[str] = Query(None, description="Meter names; all meters if omitted"),
+    db: Session = Depends(get_db),
+):
+    """Peak rolling demand (kW) per meter and campus-wide, with coincident peaks"""
+    _check_window(window_minutes)
+    start, end = _date_range(from_date, to_date)
+    meter_names = _resolve_meters(db, meters)
+
+    peaks = peak_demand(
+        db,
+        start,
+        end,
+        window_minutes,
+        granularity,
+        meter_ids=list(meter_names) if meters else None,
+    )
+
+    for peak in peaks["meters"]:
+        peak["meter_name"] = meter_names.get(peak["meter_id"])
+    for peak in peaks["campus"]:
+        for share in peak["coincident"]:
+            share["meter_name"] = meter_names.get(share["meter_id"])
+
+    return {
+        "success": True,
+        "granularity": granularity,
+        "window_minutes": window_minutes,
+        "data": peaks,
+    }
+
+
+@router.get("/peak_demand/top")
+def get_top_demand_intervals(
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    window_minutes: int = Query(15, description="Rolling window: 15 or 30"),
+    limit: int = Query(10, ge=1, le=100),
+    per_meter: bool = Query(False),
+    meters: List[str] = Query(None, description="Meter names; all meters if omitted"),
+    db: Session = Depends(get_db),
+):
+    """Highest demand windows, campus-wide or per meter"""
+    _check_window(window_minutes)
+    start, end = _date_range(from_date, to_date)
+    meter_names = _resolve_meters(db, meters)
+
+    intervals = top_demand_intervals(
+        db,
+        start,
+        end,
+        window_minutes,
+        limit,
+        meter_ids=list(meter_names) if meters else None,
+        per_meter=per_meter,
+    )
+    if per_meter:
+        for interval in intervals:
+            interval["meter_name"] = meter_names.get(interval["meter_id"])
+
+    return {
+        "success": True,
+        "window_minutes": window_minutes,
+        "data": intervals,
+    }
+
+
+@router.get("/unbalance")
+def get_unbalance(
+    meter_name: str = Query(...),
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    include_series: bool = Query(True),
+    db: Session = Depends(get_db),
+):
+    """Voltage and current unbalance series, percentiles and time in status"""
+    start, end = _date_range(from_date, to_date)
+    meter_id = get_meter_id_by_name(db, meter_name)
+    if not meter_id:
+        raise HTTPException(status_code=404, detail="Meter not found")
+
+    return {
+        "success": True,
+        "meter_name": meter_name,
+        "from_date": from_date,
+        "to_date": to_date,
+        "voltage": unbalance_report(db, "voltage", meter_id, start, end, include_series),
+        "current": unbalance_report(db, "current", meter_id, start, end, include_series),
+    }
+
+
 MONTHS = {
     1: "jan", 2: "feb", 3: "mar", 4: "apr",
     5: "may", 6: "jun", 7: "jul", 8: "aug",
     9: "sep", 10: "oct", 11: "nov", 12: "dec"
 }
 @router.get("/monthly_average/{year}/{meter_name}")
-def monthly_average(meter_name: str, year: int, db:Session = Depends(get_db)):
+def monthly_average(
+    meter_name: str,
+    year: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
     data = {}
-    meter_id = get_meter_id_by_name(meter_name)
-    for month in range(1, 13):
-        start_date = datetime(year, month, 1)
-        end_date = (
-            datetime(year + 1, 1, 1)
-            if month == 12
-            else datetime(year, month + 1, 1)
-        )
+    meter_id = get_meter_id_by_name(db, meter_name)
+    if not meter_id:
+        raise HTTPException(status_code=404, detail="Meter not found")
+
+    # Only backfills change a closed year, and those may land anywhere in
+    # it; the current year just grows, so its newest readings suffice
+    closed = is_closed_year(year)
+    mark = data_watermark if closed else latest_timestamps
+    watermark = mark(
+        db,
+        [CurrentDB, VoltageDB, PowerDB, EnergyDB],
+        datetime(year, 1, 1),
+        datetime(year + 1, 1, 1),
+        meter_id=meter_id,
+    )
+    etag = make_etag("monthly_average", meter_id, year, *watermark)
+    cached = not_modified(request, etag, closed)
+    if cached:
+        return cached
+    set_cache_headers(response, etag, closed)
+
+    monthly = aggregate(
+        db,
+        ["current", "voltage", "power", "energy"],
+        ["avg"],
+        "month",
+        datetime(year, 1, 1),
+        datetime(year + 1, 1, 1),
+        meter_ids=[meter_id],
+    )
 
-        avg_current = db.query(
-            (
-                func.coalesce(func.avg(CurrentDB.phase_A_current), 0) +
-                func.coalesce(func.avg(CurrentDB.phase_B_current), 0) +
-                func.coalesce(func.avg(CurrentDB.phase_C_current), 0)
-            )
-        ).filter(
-            CurrentDB.meter_id == meter_id,
-            CurrentDB.timestamp >= start_date,
-            CurrentDB.timestamp < end_date
-        ).scalar()
-        
-        avg_voltage = db.query(
-            (
-                func.coalesce(func.avg(VoltageDB.phase_A_voltage), 0) +
-                func.coalesce(func.avg(VoltageDB.phase_B_voltage), 0) +
-                func.coalesce(func.avg(VoltageDB.phase_C_voltage), 0)
-            )
-        ).filter(
-            VoltageDB.meter_id == meter_id,
-            VoltageDB.timestamp >= start_date,
-            VoltageDB.timestamp < end_date
-        ).scalar()       
-
-        avg_power = db.query(
-            (
-                func.coalesce(func.avg(PowerDB.phase_A_active_power), 0) +
-                func.coalesce(func.avg(PowerDB.phase_B_active_power), 0) +
-                func.coalesce(func.avg(PowerDB.phase_C_active_power), 0)
-            )
-        ).filter(
-            PowerDB.meter_id == meter_id,
-            PowerDB.timestamp >= start_date,
-            PowerDB.timestamp < end_date
-        ).scalar()
-
-        avg_energy = db.query(
-            (
-                func.coalesce(func.avg(EnergyDB.phase_A_grid_consumption), 0) +
-                func.coalesce(func.avg(EnergyDB.phase_B_grid_consumption), 0) +
-                func.coalesce(func.avg(EnergyDB.phase_C_grid_consumption), 0)
-            )
-        ).filter(
-            EnergyDB.meter_id == meter_id,
-            EnergyDB.timestamp >= start_date,
-            EnergyDB.timestamp < end_date
-        ).scalar()
+    for month in range(1, 13):
+        values = monthly.get((meter_id, datetime(year, month, 1)), {})
+        avg_current = values.get("current_avg") or 0
+        avg_voltage = values.get("voltage_avg") or 0
+        avg_power = values.get("power_avg") or 0
+        avg_energy = values.get("energy_avg") or 0
 
         data[MONTHS[month]] = {
             "average_current": avg_current,
@@ -233,19 +385,20 @@ def monthly_average(meter_name: str, year: int, db:Session = Depends(get_db)):
     }
 @router.get("/voltage")
 def get_voltage_analysis(db: Session = Depends(get_db)):
-    meters = db.query(MeterDB).all()
+    return result_cache.get_or_compute(
+        result_cache.key("analysis:voltage"),
+        LIVE_CACHE_TTL,
+        lambda: _voltage_analysis(db),
+    )
+
+
+def _voltage_analysis(db: Session):
     result = []
-    for m in meters:
-        latest_voltage = (
-            db.query(VoltageDB)
-            .filter(VoltageDB.meter_id == m.meter_id)
-            .order_by(desc(VoltageDB.timestamp))
-            .first()
-        )
+    for latest_voltage in latest_readings(db, VoltageDB):
 
-        if not latest_voltage:
+        if latest_voltage.timestamp is None:
             result.append({
-                "meter_name": m.name,
+                "meter_name": latest_voltage.meter_name,
                 "status": "NO_DATA"
             })
             continue
@@ -257,7 +410,7 @@ def get_voltage_analysis(db: Session = Depends(get_db)):
         )
 
         result.append({
-            "meter_name": m.name,
+            "meter_name": latest_voltage.meter_name,
             "timestamp": latest_voltage.timestamp,
             "phase_A_voltage": latest_voltage.phase_A_voltage,
             "phase_B_voltage": latest_voltage.phase_B_voltage,
@@ -273,19 +426,20 @@ def get_voltage_analysis(db: Session = Depends(get_db)):
 
 @router.get("/current")
 def get_current_analysis(db: Session = Depends(get_db)):
-    meters = db.query(MeterDB).all()
+    return result_cache.get_or_compute(
+        result_cache.key("analysis:current"),
+        LIVE_CACHE_TTL,
+        lambda: _current_analysis(db),
+    )
+
+
+def _current_analysis(db: Session):
     result = []
-    for m in meters:
-        latest_current = (
-            db.query(CurrentDB)
-            .filter(CurrentDB.meter_id == m.meter_id)
-            .order_by(desc(CurrentDB.timestamp))
-            .first()
-        )   
-
-        if not latest_current:
+    for latest_current in latest_readings(db, CurrentDB):   
+
+        if latest_current.timestamp is None:
             result.append({
-                "meter_name": m.name,
+                "meter_name": latest_current.meter_name,
                 "status": "NO_DATA"
             })
             continue
@@ -297,7 +451,7 @@ def get_current_analysis(db: Session = Depends(get_db)):
         )
 
         result.append({
-            "meter_name": m.name,
+            "meter_name": latest_current.meter_name,
             "timestamp": latest_current.timestamp,
             "phase_A_current": latest_current.phase_A_current,
             "phase_B_current": latest_current.phase_B_current,
@@ -1,20 +1,217 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from datetime import date
+from typing import List, Literal, Optional
 
-from ..models import BillingDB, CostPerDayDB, CostPerMeterDB
+from ..models import (
+  BillingDB,
+  CostPerDayDB,
+  CostPerMeterDB,
+  TariffDB,
+  TariffRateDB,
+  TariffTierDB,
+  get_nepal_time,
+)
 from ..database import get_db
-from ..api.billing import calculate_bill
+from ..api.billing import RANGE_GRANULARITIES, cost_range, submit_billing
+from ..api.tariff import compare_tariffs
+from ..utils.http_cache import is_closed_month, make_etag, not_modified, set_cache_headers
+from ..utils.jobs import job_queue
+from .auth.auth_utils import require_admin
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
 
+class TariffRateInput(BaseModel):
+  rate: float = Field(..., ge=0)
+  start_month: int = Field(1, ge=1, le=12)
+  end_month: int = Field(12, ge=1, le=12)
+  weekdays: str = Field("0123456", pattern=r"^[0-6]{1,7}$", example="01234")
+  start_hour: int = Field(0, ge=0, le=23)
+  end_hour: int = Field(24, ge=1, le=24)
+
+
+class TariffTierInput(BaseModel):
+  from_kwh: float = Field(..., ge=0)
+  to_kwh: Optional[float] = Field(None, gt=0)
+  rate_adder: float
+
+
+class TariffInput(BaseModel):
+  name: str
+  currency: str = "NPR"
+  base_rate: float = Field(..., ge=0)
+  demand_charge_per_kw: float = Field(0, ge=0)
+  fixed_charge: float = Field(0, ge=0)
+  rates: List[TariffRateInput] = []
+  tiers: List[TariffTierInput] = []
+
+
+def _tariff_dict(tariff, rates, tiers):
+  return {
+    "id": tariff.id,
+    "name": tariff.name,
+    "currency": tariff.currency,
+    "base_rate": tariff.base_rate,
+    "demand_charge_per_kw": tariff.demand_charge_per_kw,
+    "fixed_charge": tariff.fixed_charge,
+    "rates": [
+      {
+        "rate": r.rate,
+        "start_month": r.start_month,
+        "end_month": r.end_month,
+        "weekdays": r.weekdays,
+        "start_hour": r.start_hour,
+        "end_hour": r.end_hour,
+      }
+      for r in rates
+    ],
+    "tiers": [
+      {"from_kwh": t.from_kwh, "to_kwh": t.to_kwh, "rate_adder": t.rate_adder}
+      for t in tiers
+    ],
+  }
+
+
+@router.get("/tariffs")
+def list_tariffs(db: Session = Depends(get_db)):
+  rates = {}
+  for rate in db.query(TariffRateDB).order_by(TariffRateDB.id):
+    rates.setdefault(rate.tariff_id, []).append(rate)
+  tiers = {}
+  for tier in db.query(TariffTierDB).order_by(TariffTierDB.from_kwh):
+    tiers.setdefault(tier.tariff_id, []).append(tier)
+
+  return [
+    _tariff_dict(tariff, rates.get(tariff.id, []), tiers.get(tariff.id, []))
+    for tariff in db.query(TariffDB).order_by(TariffDB.id)
+  ]
+
+
+@router.post("/tariffs", dependencies=[Depends(require_admin)])
+def create_tariff(tariff_input: TariffInput, db: Session = Depends(get_db)):
+  if db.query(TariffDB).filter(TariffDB.name == tariff_input.name).first():
+    raise HTTPException(status_code=409, detail=f"Tariff {tariff_input.name} already exists")
+
+  for tier in tariff_input.tiers:
+    if tier.to_kwh is not None and tier.to_kwh <= tier.from_kwh:
+      raise HTTPException(status_code=400, detail="Tier to_kwh must exceed from_kwh")
+
+  tariff = TariffDB(
+    name=tariff_input.name,
+    currency=tariff_input.currency,
+    base_rate=tariff_input.base_rate,
+    demand_charge_per_kw=tariff_input.demand_charge_per_kw,
+    fixed_charge=tariff_input.fixed_charge,
+  )
+  db.add(tariff)
+  db.flush()
+
+  rates = [TariffRateDB(tariff_id=tariff.id, **r.model_dump()) for r in tariff_input.rates]
+  tiers = [TariffTierDB(tariff_id=tariff.id, **t.model_dump()) for t in tariff_input.tiers]
+  db.add_all(rates + tiers)
+  db.commit()
+
+  return _tariff_dict(tariff, rates, tiers)
+
+
+@router.delete("/tariffs/{tariff_id}", dependencies=[Depends(require_admin)])
+def delete_tariff(tariff_id: int, db: Session = Depends(get_db)):
+  deleted = db.query(TariffDB).filter(TariffDB.id == tariff_id).delete()
+  if not deleted:
+    raise HTTPException(status_code=404, detail=f"Tariff {tariff_id} not found")
+  db.commit()
+  return "Tariff Deleted"
+
+
+@router.get("/tariffs/{year}/{month}")
+def compare_bill_tariffs(
+    year: int,
+    month: int,
+    tariff_ids: Optional[List[int]] = Query(None),
+    meter_ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db)
+  ):
+  """Bill the month under each tariff (all stored tariffs by default)"""
+  if not 1 <= month <= 12:
+    raise HTTPException(status_code=400, detail="month must be between 1 and 12")
+
+  tariffs = compare_tariffs(db, year, month, tariff_ids, meter_ids)
+  if not tariffs:
+    raise HTTPException(status_code=404, detail="No matching tariffs")
+  return {"date": f"{year}-{month:02d}", "tariffs": tariffs}
+
+
+def _check_billable_month(year: int, month: int):
+  """Reject months that cannot be billed before anything is queued"""
+  if not 1 <= month <= 12:
+    raise HTTPException(status_code=400, detail="month must be between 1 and 12")
+  today = get_nepal_time().date()
+  if year < 1 or (year, month) > (today.year, today.month):
+    raise HTTPException(status_code=400, detail=f"{year}-{month:02d} has not started yet")
+
+
+def _job_accepted(job):
+  """202 pointing the client at the job to poll; 500 if it recently failed"""
+  status_url = f"/billing/jobs/{job.id}"
+  return JSONResponse(
+    status_code=500 if job.status == "failed" else 202,
+    content={**job.to_dict(), "status_url": status_url},
+    headers={"Location": status_url},
+  )
+
+
+@router.get("/range")
+def get_billing_range(
+    from_date: date = Query(..., description="Start date (YYYY-MM-DD)"),
+    to_date: date = Query(..., description="End date (YYYY-MM-DD), inclusive"),
+    granularity: Literal[RANGE_GRANULARITIES] = Query("month"),
+    per_meter: bool = Query(False),
+    meter_ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db)
+  ):
+  """
+  Costs across any range of billed days, e.g. month-over-month per meter.
+  Billed at the flat rate; see /billing/tariffs/{year}/{month} for tariffs.
+  """
+  if from_date > to_date:
+    raise HTTPException(status_code=400, detail="from_date cannot be later than to_date")
+
+  return {
+    "from_date": from_date,
+    "to_date": to_date,
+    "granularity": granularity,
+    "data": cost_range(db, from_date, to_date, granularity, per_meter, meter_ids),
+  }
+
+
+# Declared before /{year}/{month}, which would otherwise capture this path
+@router.get("/jobs/{job_id}")
+def get_billing_job(job_id: str):
+  job = job_queue.get(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+  return job.to_dict()
+
+
 @router.get("/{year}/{month}")
 def get_bill(
     year: int,
     month: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
   ):
+  """
+  The month's stored bill, or 202 and a job to poll while it is computed.
+
+  Bills are flat-rate (every kWh at one price). Time-of-use rates, tiers
+  and demand charges of the stored tariffs are only applied by
+  /billing/tariffs/{year}/{month}.
+  """
+  _check_billable_month(year, month)
   month_key = f"{year}-{month:02d}"
 
   billing = (
@@ -28,18 +225,19 @@ def get_bill(
     .first()
   )
 
+  # Never billed: compute in the background rather than in this request.
+  # A month already billed is served as is while any refresh runs.
   if not billing:
-    calculate_bill(year, month, db)
-    billing = (
-      db.query(
-        BillingDB.total_cost,
-        BillingDB.avg_cost_per_day,
-        BillingDB.expensive_day,
-        BillingDB.expensive_day_cost,
-      )
-      .filter(BillingDB.date == month_key)
-      .first()
-    )
+    return _job_accepted(submit_billing(year, month))
+
+  # The billing row is rewritten together with its daily and per-meter costs,
+  # so its values identify the whole response
+  etag = make_etag("billing", month_key, *billing)
+  closed = is_closed_month(year, month)
+  cached = not_modified(request, etag, closed)
+  if cached:
+    return cached
+  set_cache_headers(response, etag, closed)
 
   cost_per_day = (
     db.query(
@@ -101,14 +299,8 @@ def get_bill(
 def do_bill(
     year: int,
     month: int,
-    db: Session = Depends(get_db)
   ):
-
-  month_key = f"{year}-{month:02d}"
-
-  db.query(BillingDB).filter(BillingDB.date == month_key).delete()
-  db.query(CostPerDayDB).filter(CostPerDayDB.date == month_key).delete()
-  db.query(CostPerMeterDB).filter(CostPerMeterDB.date == month_key).delete()
-
-  calculate_bill(year, month, db)
-  return "Billing Calculated"
+  """Recompute the month's flat-rate bill from its readings, in the background"""
+  _check_billable_month(year, month)
+  # A rebuild re-costs every day of the month, so nothing needs clearing first
+  return _job_accepted(submit_billing(year, month, rebuild=True))
@@ -1,13 +1,24 @@
-from typing import List
+import asyncio
+import json
+from typing import List, Optional
 from pydantic import BaseModel, Field
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from ..models import CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB
 from ..database import get_db
 from ..api.iammeter import get_meter_id_by_name
-from datetime import datetime, date, time
+from ..utils.broadcast import broadcaster
+from ..utils.http_cache import (
+    data_watermark,
+    is_closed_day,
+    make_etag,
+    not_modified,
+    set_cache_headers,
+)
+from datetime import datetime, date, time, timedelta
 
 
 # Pydantic models for request validation
@@ -32,6 +43,9 @@ class BulkLocationUpdate(BaseModel):
 
 router = APIRouter(prefix="/meter", tags=["meter"])
 
+# Seconds between keep-alive comments on idle event streams
+STREAM_KEEPALIVE = 15
+
 
 @router.get("")
 def get_all_meters(db: Session = Depends(get_db)):
@@ -53,6 +67,41 @@ def get_all_meters(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/stream")
+async def stream_meter_data(
+    request: Request,
+    meter_ids: Optional[List[int]] = Query(None, description="Meters to follow; all if omitted"),
+):
+    """
+    Server-Sent Events feed of new readings and status changes.
+
+    Events are `reading` (same fields as /meter/{meter_id}/latest),
+    `power_quality` (a rule starting, changing severity or clearing) and
+    `flatline`, each pushed once the collector has committed its tick.
+    """
+    subscription = broadcaster.subscribe(meter_ids)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{meter_id}/latest")
 def get_latest_meter_data(meter_id: int, db: Session = Depends(get_db)):
     row = (
@@ -139,6 +188,8 @@ def get_todays_data(meter_name: str, db: Session = Depends(get_db)):
 
 @router.get("/databydate")
 def get_data_by_date_range(
+    request: Request,
+    response: Response,
     meter_name: str = Query(...),
     from_date: date = Query(...),
     to_date: date = Query(...),
@@ -155,6 +206,22 @@ def get_data_by_date_range(
 
     start = datetime.combine(from_date, time.min)
     end = datetime.combine(to_date, time.max)
+
+    # Answer revalidations from the range's high-water mark before touching the rows
+    watermark = data_watermark(
+        db,
+        [CurrentDB, VoltageDB, PowerDB, EnergyDB],
+        start,
+        datetime.combine(to_date + timedelta(days=1), time.min),
+        meter_id=meter_id,
+    )
+    etag = make_etag("databydate", meter_id, from_date, to_date, *watermark)
+    closed = is_closed_day(to_date)
+    cached = not_modified(request, etag, closed)
+    if cached:
+        return cached
+    set_cache_headers(response, etag, closed)
+
     try:
         rows = (
             db.query(CurrentDB, VoltageDB, PowerDB, EnergyDB)
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
 from src.database import get_db
 from src.models import MeterStatusDB
+from src.utils.heartbeat import STALE_INTERVALS, meter_lag
 
 router = APIRouter(prefix="/meter_status", tags=["meter_status"])
 
@@ -14,6 +15,16 @@ def get_all_status(db: Session = Depends(get_db)):
 def get_down(db: Session = Depends(get_db)):
     return db.query(MeterStatusDB).filter(MeterStatusDB.is_flatline == True).all()
 
+# Declared before /{meter_id}, which would otherwise capture this path
+@router.get("/stale")
+def get_stale(
+    intervals: int = Query(STALE_INTERVALS, ge=1, description="Allowed lag in collection intervals"),
+    include_fresh: bool = False,
+    db: Session = Depends(get_db),
+):
+    report = meter_lag(db, intervals)
+    return report if include_fresh else [row for row in report if row["is_stale"]]
+
 @router.get("/{meter_id}")
 def get_one(meter_id: int, db: Session = Depends(get_db)):
     return db.get(MeterStatusDB, meter_id)
@@ -0,0 +1,131 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..api.iammeter import get_meter_id_by_name
+from ..api.power_quality import RULES
+from ..database import get_db
+from ..models import MeterDB, PowerQualityEventDB, get_nepal_time
+
+router = APIRouter(prefix="/power_quality", tags=["power_quality"])
+
+
+def _event_filters(db, from_date, to_date, meter_name, rule, severity):
+    if from_date > to_date:
+        raise HTTPException(
+            status_code=400, detail="from_date cannot be later than to_date"
+        )
+    if rule is not None and rule not in RULES:
+        raise HTTPException(status_code=400, detail=f"Unknown rule '{rule}'")
+
+    filters = [
+        PowerQualityEventDB.started_at >= datetime.combine(from_date, datetime.min.time()),
+        PowerQualityEventDB.started_at
+        < datetime.combine(to_date + timedelta(days=1), datetime.min.time()),
+    ]
+    if meter_name is not None:
+        meter_id = get_meter_id_by_name(db, meter_name)
+        if not meter_id:
+            raise HTTPException(status_code=404, detail="Meter not found")
+        filters.append(PowerQualityEventDB.meter_id == meter_id)
+    if rule is not None:
+        filters.append(PowerQualityEventDB.rule == rule)
+    if severity is not None:
+        filters.append(PowerQualityEventDB.severity == severity.upper())
+    return filters
+
+
+@router.get("/rules")
+def get_rules():
+    return {"success": True, "rules": list(RULES)}
+
+
+@router.get("/events")
+def get_events(
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    meter_name: Optional[str] = Query(None),
+    rule: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """Events that started in the date range, oldest first"""
+    filters = _event_filters(db, from_date, to_date, meter_name, rule, severity)
+
+    rows = (
+        db.query(PowerQualityEventDB, MeterDB.name)
+        .join(MeterDB, MeterDB.meter_id == PowerQualityEventDB.meter_id)
+        .filter(*filters)
+        .order_by(PowerQualityEventDB.started_at)
+        .all()
+    )
+
+    return {
+        "success": True,
+        "count": len(rows),
+        "data": [
+            {
+                "meter_id": event.meter_id,
+                "meter_name": name,
+                "rule": event.rule,
+                "severity": event.severity,
+                "started_at": event.started_at,
+                "ended_at": event.ended_at,
+                "peak_value": event.peak_value,
+                "last_value": event.last_value,
+            }
+            for event, name in rows
+        ],
+    }
+
+
+@router.get("/summary")
+def get_summary(
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    meter_name: Optional[str] = Query(None),
+    rule: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """Event counts and total duration per meter, rule and severity"""
+    filters = _event_filters(db, from_date, to_date, meter_name, rule, severity)
+
+    # Still-open events count up to now
+    now = get_nepal_time().replace(tzinfo=None)
+    duration = func.extract(
+        "epoch",
+        func.coalesce(PowerQualityEventDB.ended_at, now) - PowerQualityEventDB.started_at,
+    )
+
+    rows = (
+        db.query(
+            MeterDB.name,
+            PowerQualityEventDB.rule,
+            PowerQualityEventDB.severity,
+            func.count(PowerQualityEventDB.id).label("events"),
+            func.sum(duration).label("total_seconds"),
+        )
+        .join(MeterDB, MeterDB.meter_id == PowerQualityEventDB.meter_id)
+        .filter(*filters)
+        .group_by(MeterDB.name, PowerQualityEventDB.rule, PowerQualityEventDB.severity)
+        .order_by(MeterDB.name, PowerQualityEventDB.rule, PowerQualityEventDB.severity)
+        .all()
+    )
+
+    return {
+        "success": True,
+        "data": [
+            {
+                "meter_name": row.name,
+                "rule": row.rule,
+                "severity": row.severity,
+                "events": row.events,
+                "total_minutes": round(float(row.total_seconds or 0) / 60, 1),
+            }
+            for row in rows
+        ],
+    }
@@ -1,11 +1,24 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from pydantic import BaseModel, Field
-from typing import List, Dict
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Dict, Optional
+from datetime import datetime, timedelta
+import os
 import shutil
+import tempfile
 from pathlib import Path
 
-from src.ml_model import power_prediction_service
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from src.database import get_db
+from src.ml_model import (
+    TRAINING_JOB,
+    load_training_csv,
+    load_training_db,
+    power_prediction_service,
+)
+from src.models import MeterDB
 
 router = APIRouter(
     prefix="/api/prediction",
@@ -34,6 +47,48 @@ class WeekPredictionRequest(BaseModel):
     start_day: int = Field(0, ge=0, le=6, description="Starting day (0=Monday)")
 
 
+# Largest batch one request may ask for (a week at one-minute steps)
+MAX_BATCH_POINTS = 7 * 24 * 60
+
+
+class BatchPredictionRequest(BaseModel):
+    timestamps: Optional[List[datetime]] = Field(None, description="Explicit timestamps")
+    start: Optional[datetime] = Field(None, description="Range start (inclusive)")
+    end: Optional[datetime] = Field(None, description="Range end (exclusive)")
+    step_minutes: int = Field(5, ge=1, le=1440, description="Range step in minutes")
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if (self.timestamps is None) == (self.start is None or self.end is None):
+            raise ValueError("Give either timestamps or both start and end")
+        stamps = self.timestamps if self.timestamps is not None else [self.start, self.end]
+        if len({ts.utcoffset() for ts in stamps}) > 1:
+            raise ValueError("Timestamps must all be naive or share one UTC offset")
+        if self.timestamps is None and self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
+
+    @property
+    def points(self) -> int:
+        """How many timestamps the request covers, without building them"""
+        if self.timestamps is not None:
+            return len(self.timestamps)
+        return -(-(self.end - self.start) // timedelta(minutes=self.step_minutes))
+
+
+class TrainFromDatabaseRequest(BaseModel):
+    meter_id: int = Field(..., description="Meter whose power readings to learn")
+    start: datetime = Field(..., description="First reading time (inclusive)")
+    end: datetime = Field(..., description="Last reading time (exclusive)")
+    hourly: bool = Field(False, description="Train on hourly averages instead of raw readings")
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
+
+
 class PredictionResponse(BaseModel):
     power_kw: float
     month: int
@@ -69,6 +124,16 @@ def get_day_name(day_of_week: int) -> str:
     return days[day_of_week]
 
 
+def _training_accepted(job):
+    """202 pointing the client at the training job to poll"""
+    status_url = f"/api/prediction/train/jobs/{job.id}"
+    return JSONResponse(
+        status_code=202,
+        content={**job.to_dict(), 'status_url': status_url},
+        headers={'Location': status_url},
+    )
+
+
 # ============================================================================
 # Routes
 # ============================================================================
@@ -109,6 +174,58 @@ async def predict_single_point(request: SinglePredictionRequest):
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
+@router.post("/batch")
+async def predict_batch(request: BatchPredictionRequest):
+    """
+    Predict power at many timestamps in one forest pass
+
+    Example:
+    ```json
+    {
+        "start": "2025-06-02T00:00:00",
+        "end": "2025-06-09T00:00:00",
+        "step_minutes": 5
+    }
+    ```
+    or `{"timestamps": ["2025-06-02T14:30:00", ...]}`
+    """
+    if request.points > MAX_BATCH_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch of {request.points} points exceeds {MAX_BATCH_POINTS}"
+        )
+    if request.timestamps is not None:
+        timestamps = pd.DatetimeIndex(request.timestamps)
+    else:
+        timestamps = pd.date_range(
+            request.start, request.end, freq=f"{request.step_minutes}min", inclusive="left"
+        )
+
+    try:
+        powers = power_prediction_service.predict_batch(timestamps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+    summary = {
+        'min_power': round(float(powers.min()), 2) if len(powers) else None,
+        'max_power': round(float(powers.max()), 2) if len(powers) else None,
+        'avg_power': round(float(powers.mean()), 2) if len(powers) else None,
+        'data_points': len(powers)
+    }
+    if request.timestamps is None:
+        summary['total_energy_kwh'] = round(float(powers.sum()) * request.step_minutes / 60, 2)
+
+    return {
+        'predictions': [
+            {'timestamp': ts.isoformat(), 'power_kw': round(float(power), 2)}
+            for ts, power in zip(timestamps, powers)
+        ],
+        'summary': summary
+    }
+
+
 @router.post("/day", response_model=DayPredictionResponse)
 async def predict_day(request: DayPredictionRequest):
     """
@@ -207,34 +324,63 @@ async def get_model_stats():
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
 
-@router.post("/train")
-async def train_new_model(file: UploadFile = File(...)):
+@router.post("/train", status_code=202)
+def train_new_model(file: UploadFile = File(...)):
     """
-    Train a new model from uploaded CSV file
+    Train a new model from uploaded CSV file, in the background
     
-    CSV should have columns: Time, Main_Transformer
+    CSV should have columns: Time, Main_Transformer. Poll the returned
+    status_url; the model goes live once training and validation pass.
     """
+    if power_prediction_service.jobs.active(TRAINING_JOB):
+        raise HTTPException(status_code=409, detail="A model is already being trained")
+
+    # Each upload gets its own file, removed when its job finishes
+    fd, temp_name = tempfile.mkstemp(prefix="training-", suffix=".csv")
+    temp_path = Path(temp_name)
     try:
-        # Save uploaded file temporarily
-        temp_path = Path("data/temp_training_data.csv")
-        temp_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with temp_path.open("wb") as buffer:
+        with os.fdopen(fd, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-        
-        # Train model
-        stats = power_prediction_service.train_model(str(temp_path))
-        
-        # Clean up
-        temp_path.unlink()
-        
-        return {
-            'message': 'Model trained successfully',
-            'stats': stats
-        }
+        job = power_prediction_service.submit_training(
+            load_training_csv, str(temp_path), cleanup=temp_path
+        )
     except Exception as e:
+        temp_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
 
+    # Another upload may have started training since the check above;
+    # submit_training has already removed this one's file
+    if job is None:
+        raise HTTPException(status_code=409, detail="A model is already being trained")
+    return _training_accepted(job)
+
+
+@router.post("/train/db", status_code=202)
+def train_from_database(request: TrainFromDatabaseRequest, db: Session = Depends(get_db)):
+    """
+    Train a new model from a meter's stored power readings, in the background
+
+    Readings are streamed from the database in chunks, so long ranges
+    train without loading them all at once. Poll the returned status_url.
+    """
+    if db.query(MeterDB).filter(MeterDB.meter_id == request.meter_id).first() is None:
+        raise HTTPException(status_code=404, detail=f"Meter {request.meter_id} not found")
+    job = power_prediction_service.submit_training(
+        load_training_db, request.meter_id, request.start, request.end, request.hourly
+    )
+    if job is None:
+        raise HTTPException(status_code=409, detail="A model is already being trained")
+    return _training_accepted(job)
+
+
+@router.get("/train/jobs/{job_id}")
+def get_training_job(job_id: str):
+    """Progress of a training job; carries the new version and stats once done"""
+    job = power_prediction_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+    return {**job.to_dict(), 'result': job.result}
+
 
 @router.post("/load")
 async def load_model():
@@ -244,6 +390,7 @@ async def load_model():
         stats = power_prediction_service.get_stats()
         return {
             'message': 'Model loaded successfully',
+            'version': power_prediction_service.version,
             'stats': stats
         }
     except FileNotFoundError as e:
@@ -252,11 +399,51 @@ async def load_model():
         raise HTTPException(status_code=500, detail=f"Failed to load model: {str(e)}")
 
 
+@router.get("/models")
+async def list_models():
+    """Stored model versions, newest first, with the live one flagged"""
+    return {'models': power_prediction_service.list_models()}
+
+
+@router.post("/models/rollback")
+async def rollback_model():
+    """Make the version before the live one live again"""
+    try:
+        version = power_prediction_service.rollback()
+        return {
+            'message': f'Rolled back to model version {version}',
+            'version': version,
+            'stats': power_prediction_service.get_stats()
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Rollback failed: {str(e)}")
+
+
+@router.post("/models/{version}/promote")
+async def promote_model(version: str):
+    """Make a stored model version the live one"""
+    try:
+        power_prediction_service.promote(version)
+        return {
+            'message': f'Model version {version} is live',
+            'version': version,
+            'stats': power_prediction_service.get_stats()
+        }
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Promotion failed: {str(e)}")
+
+
 @router.get("/health")
 async def health_check():
     """Check if model is loaded and ready"""
     try:
-        if power_prediction_service.model is None:
+        if power_prediction_service.loaded is None:
             return {
                 'status': 'not_ready',
                 'message': 'Model not loaded. Call /api/prediction/load first.'
@@ -267,6 +454,7 @@ async def health_check():
             'status': 'ready',
             'message': 'Model is loaded and ready',
             'model_info': {
+                'version': power_prediction_service.version,
                 'r2_score': stats['r2'],
                 'trained_at': stats['trained_at']
             }
@@ -3,7 +3,8 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from .database import SessionLocal
-from .api.billing import calculate_bill
+from .api.billing import dirty_months, submit_billing
+from .utils.heartbeat import update_stale_flags
 from .utils.meter_status import update_flatline_status
 
 def meter_status_job():
@@ -16,17 +17,27 @@ def meter_status_job():
     finally:
         db.close()
 
+def stale_meter_job():
+    db: Session = SessionLocal()
+    try:
+        update_stale_flags(db)
+    except Exception as e:
+        print(f"Error in stale meter job: {e}")
+    finally:
+        db.close()
+
 scheduler = BackgroundScheduler()
 
 def daily_billing_job():
     db: Session = SessionLocal()
     try:
         now = datetime.now()
-        year = now.year
-        month = now.month
 
-        calculate_bill(year, month, db)
-        print(f"Daily billing job completed for {year}-{month:02d} at {now}")
+        # Late ticks can still land in last month's ledger after it rolls over
+        months = {(now.year, now.month), *dirty_months(db)}
+        for year, month in sorted(months):
+            submit_billing(year, month)
+            print(f"Daily billing job queued {year}-{month:02d} at {now}")
     except Exception as e:
         print(f"Error in daily billing job: {e}")
     finally:
@@ -49,3 +60,11 @@ scheduler.add_job(
     id="meter_status_job",
     replace_existing=True
 )
+
+scheduler.add_job(
+    stale_meter_job,
+    trigger="interval",
+    minutes=15,
+    id="stale_meter_job",
+    replace_existing=True
+)
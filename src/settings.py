@@ -4,6 +4,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _floats(name: str, default: str) -> tuple[float, ...]:
+    """Comma-separated numbers, e.g. PQ_VOLTAGE_UNBALANCE_LIMITS=1,2,3"""
+    return tuple(float(value) for value in (os.getenv(name) or default).split(","))
+
+
 class Settings:
     def __init__(self):
         self.DATABASE_URL = os.getenv("DATABASE_URL")
@@ -11,6 +16,40 @@ class Settings:
         self.IAMMETER_TOKEN = os.getenv("IAMMETER_TOKEN")
         self.IAMMETER_COOKIE = os.getenv("IAMMETER_COOKIE")
 
+        # Optional redis:// URL shared by all workers; in-process cache otherwise
+        self.CACHE_URL = os.getenv("CACHE_URL")
+        # Optional redis:// URL fanning live readings out across workers
+        self.BROADCAST_URL = os.getenv("BROADCAST_URL") or self.CACHE_URL
+
+        # Threads running background jobs such as billing runs
+        self.JOB_WORKERS = int(os.getenv("JOB_WORKERS") or 2)
+
+        # Update flatline status on every collector tick, not just the 12h job
+        self.FLATLINE_STREAMING = (os.getenv("FLATLINE_STREAMING") or "false").lower() == "true"
+
+        # Forest size and processes training it (defaults to every core)
+        self.FOREST_TREES = int(os.getenv("FOREST_TREES") or 10)
+        self.TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS") or os.cpu_count() or 1)
+        # Model versions kept in the registry, the live one included
+        self.MODEL_KEEP = int(os.getenv("MODEL_KEEP") or 5)
+
+        # Power-quality rule thresholds, evaluated on every ingested tick
+        self.PQ_NOMINAL_VOLTAGE = float(os.getenv("PQ_NOMINAL_VOLTAGE") or 230)
+        self.PQ_MAX_CURRENT = float(os.getenv("PQ_MAX_CURRENT") or 100)
+        self.PQ_MIN_POWER_FACTOR = float(os.getenv("PQ_MIN_POWER_FACTOR") or 0.85)
+        self.PQ_CRITICAL_POWER_FACTOR = float(
+            os.getenv("PQ_CRITICAL_POWER_FACTOR") or self.PQ_MIN_POWER_FACTOR - 0.15
+        )
+        # Share of PQ_MAX_CURRENT that warns; above the maximum is CRITICAL
+        self.PQ_CURRENT_WARNING_RATIO = float(os.getenv("PQ_CURRENT_WARNING_RATIO") or 0.9)
+        # WARNING,CRITICAL multiples of the nominal voltage
+        self.PQ_OVER_VOLTAGE_RATIOS = _floats("PQ_OVER_VOLTAGE_RATIOS", "1.10,1.15")
+        self.PQ_UNDER_VOLTAGE_RATIOS = _floats("PQ_UNDER_VOLTAGE_RATIOS", "0.90,0.85")
+        # Unbalance (%) limits between status levels, lowest first: voltage
+        # NORMAL/ACCEPTABLE/WARNING/CRITICAL, current NORMAL/WARNING/CRITICAL
+        self.PQ_VOLTAGE_UNBALANCE_LIMITS = _floats("PQ_VOLTAGE_UNBALANCE_LIMITS", "1,2,3")
+        self.PQ_CURRENT_UNBALANCE_LIMITS = _floats("PQ_CURRENT_UNBALANCE_LIMITS", "10,20")
+
         self.PORT = int(os.environ.get("PORT", 8000))
 
         self.ENV = os.getenv("ENV", "debug")
@@ -22,6 +61,10 @@ class Settings:
         assert self.DATABASE_URL is not None, "DATABASE_URL is missing in .env"
         assert self.SECRET_KEY is not None, "SECRET_KEY is missing in .env"
         assert self.IAMMETER_TOKEN is not None, "IAMMETER_TOKEN is missing in .env"
+        assert len(self.PQ_OVER_VOLTAGE_RATIOS) == 2, "PQ_OVER_VOLTAGE_RATIOS needs 2 values"
+        assert len(self.PQ_UNDER_VOLTAGE_RATIOS) == 2, "PQ_UNDER_VOLTAGE_RATIOS needs 2 values"
+        assert len(self.PQ_VOLTAGE_UNBALANCE_LIMITS) == 3, "PQ_VOLTAGE_UNBALANCE_LIMITS needs 3 values"
+        assert len(self.PQ_CURRENT_UNBALANCE_LIMITS) == 2, "PQ_CURRENT_UNBALANCE_LIMITS needs 2 values"
 
 
 settings = Settings()
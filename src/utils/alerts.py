@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Callable, Optional
+
+import aiosmtplib
+
+# Alerts raised within this many seconds of each other go out as one digest
+BATCH_SECONDS = 10
+
+
+@dataclass
+class Alert:
+    meter_id: int
+    subject: str
+    body: str
+    # Called from the dispatcher thread once the mail has gone out
+    on_sent: Optional[Callable[[], None]] = None
+
+
+class AlertDispatcher:
+    """
+    Sends alert emails from a background thread with its own event loop.
+
+    Producers (the scheduler, the collector) only enqueue and never wait on
+    SMTP. The worker holds one SMTP connection open across sends, merges
+    alerts arriving within BATCH_SECONDS into a single digest, and calls
+    each alert's on_sent once the digest is delivered. A failed digest is
+    logged and dropped without calling them, so producers can raise the
+    alert again.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        # Latest queued, not yet delivered alert per meter
+        self._pending: dict[int, Alert] = {}
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="alerts", daemon=True)
+            self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        self._loop.run_until_complete(self._worker())
+        self._loop.close()
+
+    def send(self, alert: Alert):
+        """Queue an alert; returns immediately"""
+        self._ensure_started()
+        with self._lock:
+            self._pending[alert.meter_id] = alert
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, alert)
+
+    def pending(self, meter_id: int) -> bool:
+        """Whether an alert for the meter is queued or being delivered"""
+        with self._lock:
+            return meter_id in self._pending
+
+    def stop(self, timeout: float = 10):
+        """Flush what is queued, close the SMTP connection and end the thread"""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        self._thread.join(timeout)
+
+    async def _worker(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = {first.meter_id: first}
+
+            # Gather whatever else arrives in the batch window; a newer
+            # alert for the same meter replaces the older one
+            deadline = self._loop.time() + BATCH_SECONDS
+            while (remaining := deadline - self._loop.time()) > 0:
+                try:
+                    alert = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if alert is None:
+                    stopping = True
+                    break
+                batch[alert.meter_id] = alert
+
+            try:
+                await self._deliver(list(batch.values()))
+                self._sent(batch.values())
+            except Exception as e:
+                print(f"Alert email failed for meters {sorted(batch)}: {e}")
+            finally:
+                with self._lock:
+                    for meter_id, alert in batch.items():
+                        # A newer alert queued meanwhile is still pending
+                        if self._pending.get(meter_id) is alert:
+                            del self._pending[meter_id]
+
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _sent(alerts):
+        for alert in alerts:
+            if alert.on_sent is None:
+                continue
+            try:
+                alert.on_sent()
+            except Exception as e:
+                print(f"Recording alert for meter {alert.meter_id} as sent failed: {e}")
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp is None or not self._smtp.is_connected:
+            self._smtp = aiosmtplib.SMTP(
+                hostname=os.environ["SMTP_HOST"],
+                port=int(os.environ.get("SMTP_PORT", "587")),
+                username=os.environ["SMTP_USER"],
+                password=os.environ["SMTP_PASS"],
+                start_tls=True,
+                timeout=15,
+            )
+            await self._smtp.connect()
+        return self._smtp
+
+    async def _deliver(self, alerts: list[Alert]):
+        msg = EmailMessage()
+        msg["From"] = os.environ["MAIL_FROM"]
+        msg["To"] = os.environ["ADMIN_EMAIL"]
+        if len(alerts) == 1:
+            msg["Subject"] = alerts[0].subject
+            msg.set_content(alerts[0].body)
+        else:
+            msg["Subject"] = f"🚨 {len(alerts)} meter alerts"
+            msg.set_content(
+                "\n\n".join(f"{alert.subject}\n{alert.body}" for alert in alerts)
+            )
+
+        try:
+            await (await self._connection()).send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection; reconnect once
+            self._smtp = None
+            await (await self._connection()).send_message(msg)
+
+
+alert_dispatcher = AlertDispatcher()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+from typing import Optional
+
+from src.settings import settings
+
+try:
+    import redis
+except ImportError:  # shared backend is optional
+    redis = None
+
+
+class Subscription:
+    """One client's queue of events for the meters it asked for"""
+
+    def __init__(self, meter_ids: Optional[set[int]], max_pending: int = 100):
+        self.meter_ids = meter_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    def offer(self, event: dict):
+        if self.meter_ids is not None and event.get("meter_id") not in self.meter_ids:
+            return
+        if self.queue.full():
+            # A slow client loses its oldest events rather than stalling others
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class Broadcaster:
+    """
+    Fans collector events out to streaming clients.
+
+    Subscriptions live on the app's event loop; publish() may be called from
+    any thread. With a redis URL, events go through a pub/sub channel so
+    every worker process receives what any collector published; otherwise
+    fan-out stays in this process.
+    """
+
+    CHANNEL = "kusm:events"
+
+    def __init__(self, url: Optional[str]):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: set[Subscription] = set()
+        self._client = None
+        self._listener: Optional[threading.Thread] = None
+
+        if url:
+            if redis is None:
+                print("BROADCAST_URL is set but redis is not installed; broadcasting in-process")
+            else:
+                self._client = redis.Redis.from_url(url)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Attach to the app's event loop; called once from the lifespan"""
+        self._loop = loop
+        if self._client is not None and self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="broadcast", daemon=True)
+            self._listener.start()
+
+    def close(self):
+        self._loop = None
+        if self._client is not None:
+            self._client.close()
+
+    def publish(self, events: list[dict]):
+        if not events:
+            return
+        if self._client is not None:
+            self._client.publish(self.CHANNEL, json.dumps(events, default=str))
+        else:
+            self._fan_out(events)
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.CHANNEL)
+        for message in pubsub.listen():
+            self._fan_out(json.loads(message["data"]))
+
+    def _fan_out(self, events: list[dict]):
+        loop = self._loop
+        if loop is not None and self._subscriptions:
+            loop.call_soon_threadsafe(self._deliver, events)
+
+    def _deliver(self, events: list[dict]):
+        for subscription in list(self._subscriptions):
+            for event in events:
+                subscription.offer(event)
+
+    def subscribe(self, meter_ids: Optional[list[int]] = None) -> Subscription:
+        subscription = Subscription(set(meter_ids) if meter_ids else None)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+
+broadcaster = Broadcaster(settings.BROADCAST_URL)
@@ -0,0 +1,137 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from src.settings import settings
+
+try:
+    import redis
+except ImportError:  # shared backend is optional
+    redis = None
+
+
+class InMemoryBackend:
+    """Thread-safe LRU with per-entry TTL, local to this worker process"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            # Old-generation keys can never be hit again
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shared backend so every worker sees the same entries and invalidations"""
+
+    GENERATION_KEY = "kusm:cache:generation"
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        raw = self._client.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value, ttl: float):
+        self._client.set(key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def generation(self) -> int:
+        return int(self._client.get(self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        # Entries of older generations simply expire through their TTL
+        self._client.incr(self.GENERATION_KEY)
+
+
+class ResultCache:
+    """
+    Caches computed route results keyed on route and parameters.
+
+    Keys embed a generation counter which the collector bumps after every
+    committed tick, so one increment invalidates everything that was derived
+    from older data. Concurrent misses on the same key are coalesced: one
+    caller computes, the others wait for its result.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def key(self, route: str, *params) -> str:
+        return ":".join(
+            ["kusm", str(self.backend.generation()), route, *map(str, params)]
+        )
+
+    def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Any]):
+        cached = self.backend.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            self.backend.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def invalidate(self):
+        self.backend.bump_generation()
+
+
+def _create_backend(url: Optional[str]):
+    if url:
+        if redis is None:
+            print("CACHE_URL is set but redis is not installed; using in-process cache")
+        else:
+            return RedisBackend(url)
+    return InMemoryBackend()
+
+
+result_cache = ResultCache(_create_backend(settings.CACHE_URL))
@@ -0,0 +1,144 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from src.models import MeterDB, MeterHeartbeatDB, get_nepal_time
+
+# A meter is stale once its data lags this many collection intervals
+STALE_INTERVALS = 3
+# Floor on the expected interval, so back-to-back manual runs don't tighten it
+MIN_INTERVAL_SECONDS = 60
+
+HEARTBEAT_FIELDS = (
+    "last_attempt_at",
+    "last_success_at",
+    "last_sample_at",
+    "last_fresh_at",
+    "interval_seconds",
+    "consecutive_failures",
+)
+
+
+class HeartbeatTracker:
+    """
+    Per-meter collection heartbeat kept in memory and mirrored to
+    MeterHeartbeatDB with one upsert per tick.
+
+    A reading only counts as fresh when its timestamp advances: the meter
+    cloud keeps answering with the last sample of a device that went
+    offline, which would otherwise look like a healthy meter.
+    """
+
+    def __init__(self):
+        self._beats: dict[int, dict] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session):
+        for row in db.query(MeterHeartbeatDB):
+            self._beats[row.meter_id] = {field: getattr(row, field) for field in HEARTBEAT_FIELDS}
+        self._loaded = True
+
+    def discard(self):
+        """Drop the in-memory state after a rolled-back tick; reloaded on next use"""
+        with self._lock:
+            self._beats.clear()
+            self._loaded = False
+
+    def record(self, db: Session, attempted: list[int], samples: dict[int, datetime]):
+        """
+        Note one collection attempt per meter in `attempted`; `samples` maps
+        the meters that answered to their reading timestamp. Changes are
+        committed by the caller, who must call discard() if it rolls back.
+        """
+        now = get_nepal_time()
+        rows = []
+        with self._lock:
+            if not self._loaded:
+                self._load(db)
+
+            for meter_id in attempted:
+                beat = self._beats.setdefault(
+                    meter_id,
+                    {field: None for field in HEARTBEAT_FIELDS} | {"consecutive_failures": 0},
+                )
+                if beat["last_attempt_at"] is not None:
+                    beat["interval_seconds"] = (now - beat["last_attempt_at"]).total_seconds()
+                beat["last_attempt_at"] = now
+
+                ts = samples.get(meter_id)
+                if ts is None:
+                    beat["consecutive_failures"] += 1
+                else:
+                    beat["consecutive_failures"] = 0
+                    beat["last_success_at"] = now
+                    if beat["last_sample_at"] is None or ts > beat["last_sample_at"]:
+                        beat["last_sample_at"] = ts
+                        beat["last_fresh_at"] = now
+
+                rows.append({"meter_id": meter_id, **beat})
+
+        if rows:
+            stmt = insert(MeterHeartbeatDB).values(rows)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[MeterHeartbeatDB.meter_id],
+                    set_={field: stmt.excluded[field] for field in HEARTBEAT_FIELDS},
+                )
+            )
+
+
+def meter_lag(db: Session, intervals: int = STALE_INTERVALS):
+    """
+    Every meter's data lag against its collection interval, read from the
+    heartbeat table alone (one row per meter, no reading-table scans).
+    Meters that never produced a fresh reading are stale.
+    """
+    now = get_nepal_time()
+    report = []
+    for meter_id, name, beat in (
+        db.query(MeterDB.meter_id, MeterDB.name, MeterHeartbeatDB)
+        .outerjoin(MeterHeartbeatDB, MeterHeartbeatDB.meter_id == MeterDB.meter_id)
+        .order_by(MeterDB.meter_id)
+    ):
+        fresh_at = beat.last_fresh_at if beat else None
+        interval = max((beat.interval_seconds if beat else None) or 0, MIN_INTERVAL_SECONDS)
+        lag = (now - fresh_at).total_seconds() if fresh_at else None
+
+        report.append(
+            {
+                "meter_id": meter_id,
+                "name": name,
+                "is_stale": lag is None or lag > intervals * interval,
+                "lag_seconds": round(lag) if lag is not None else None,
+                "interval_seconds": beat.interval_seconds if beat else None,
+                "last_sample_at": beat.last_sample_at if beat else None,
+                "last_success_at": beat.last_success_at if beat else None,
+                "last_attempt_at": beat.last_attempt_at if beat else None,
+                "consecutive_failures": beat.consecutive_failures if beat else None,
+            }
+        )
+    return report
+
+
+def update_stale_flags(db: Session, intervals: int = STALE_INTERVALS):
+    """Scheduler check: persist is_stale for every meter with a heartbeat"""
+    report = meter_lag(db, intervals)
+    stale = {row["meter_id"] for row in report if row["is_stale"]}
+
+    db.query(MeterHeartbeatDB).update(
+        {MeterHeartbeatDB.is_stale: MeterHeartbeatDB.meter_id.in_(list(stale))},
+        synchronize_session=False,
+    )
+    db.commit()
+
+    for row in report:
+        if row["is_stale"]:
+            lag = f"{row['lag_seconds']}s" if row["lag_seconds"] is not None else "never reported"
+            print(f"Meter {row['meter_id']} ({row['name']}) not reporting; lag {lag}")
+    return stale
+
+
+heartbeat = HeartbeatTracker()
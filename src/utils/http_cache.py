@@ -0,0 +1,104 @@
+import hashlib
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from src.models import get_nepal_time
+
+# Periods that have already ended only change when data is backfilled, so
+# browsers may reuse them for a day before revalidating.
+CLOSED_PERIOD_MAX_AGE = 24 * 60 * 60
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given parts (weak because gzip rewrites the body)"""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def data_watermark(db: Session, models, start: datetime, end: datetime, meter_id=None):
+    """
+    Row count and highest id per table in [start, end), in a single statement.
+    Any insert or delete inside the range moves the watermark.
+    """
+    columns = []
+    for model in models:
+        conditions = [model.timestamp >= start, model.timestamp < end]
+        if meter_id is not None:
+            conditions.append(model.meter_id == meter_id)
+
+        columns.append(
+            select(func.count(model.id)).where(*conditions).scalar_subquery()
+        )
+        columns.append(
+            select(func.coalesce(func.max(model.id), 0))
+            .where(*conditions)
+            .scalar_subquery()
+        )
+
+    return tuple(db.query(*columns).one())
+
+
+def latest_timestamps(db: Session, models, start: datetime, end: datetime, meter_id: int):
+    """
+    Newest reading time per table in [start, end) for one meter, each a
+    single probe of the (meter_id, timestamp) index.
+
+    Cheap enough for periods still being written to, where every tick
+    moves it; rows backfilled behind the newest one are only picked up
+    with the next tick.
+    """
+    columns = [
+        select(func.max(model.timestamp))
+        .where(model.meter_id == meter_id, model.timestamp >= start, model.timestamp < end)
+        .scalar_subquery()
+        for model in models
+    ]
+    return tuple(db.query(*columns).one())
+
+
+def is_closed_day(day: date) -> bool:
+    return day < get_nepal_time().date()
+
+
+def is_closed_month(year: int, month: int) -> bool:
+    today = get_nepal_time().date()
+    return (year, month) < (today.year, today.month)
+
+
+def is_closed_year(year: int) -> bool:
+    return year < get_nepal_time().year
+
+
+def cache_headers(etag: str, closed: bool) -> dict:
+    if closed:
+        cache_control = f"public, max-age={CLOSED_PERIOD_MAX_AGE}"
+    else:
+        # Still changing: clients must revalidate, but a match costs only a 304
+        cache_control = "no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(request: Request, etag: str, closed: bool) -> Optional[Response]:
+    """304 response if the client already holds this version, otherwise None"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers(etag, closed))
+    return None
+
+
+def set_cache_headers(response: Response, etag: str, closed: bool):
+    response.headers.update(cache_headers(etag, closed))
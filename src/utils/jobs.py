@@ -0,0 +1,149 @@
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Hashable, Optional
+
+from src.models import get_nepal_time
+from src.settings import settings
+
+
+class Job:
+    """One unit of background work and what became of it"""
+
+    def __init__(self, key: Hashable):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.submitted_at: datetime = get_nepal_time()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.progress: Optional[dict] = None
+        self.done = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": self.progress,
+            "error": self.error,
+        }
+
+
+# The job whose function is running in this thread
+_current_job: ContextVar[Optional[Job]] = ContextVar("current_job", default=None)
+
+
+def report_progress(**progress):
+    """Publish progress details on the job running in this thread, if any"""
+    job = _current_job.get()
+    if job is not None:
+        job.progress = progress
+
+
+class JobQueue:
+    """
+    Runs jobs on a small thread pool, at most one active job per key.
+
+    Submitting a key that is already queued or running returns the existing
+    job instead of starting another, so a burst of identical requests costs
+    one computation. A key whose job failed returns that failed job for
+    `retry_after` seconds rather than failing again on every request.
+    Finished jobs are kept (up to `keep`) for polling.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        keep: int = 256,
+        retry_after: float = 300,
+        name: str = "job",
+    ):
+        self.keep = keep
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: dict[Hashable, Job] = {}
+        self._failed: dict[Hashable, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Job:
+        return self._submit(key, fn, args, kwargs)[0]
+
+    def submit_exclusive(self, key: Hashable, fn: Callable, *args, **kwargs) -> Optional[Job]:
+        """Like submit, but None instead of a job this caller did not create"""
+        job, created = self._submit(key, fn, args, kwargs)
+        return job if created else None
+
+    def _submit(self, key: Hashable, fn: Callable, args, kwargs) -> tuple[Job, bool]:
+        with self._lock:
+            job = self._active.get(key) or self._recent_failure(key)
+            if job is not None:
+                return job, False
+
+            job = Job(key)
+            self._active[key] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.active:
+                    break
+                del self._jobs[oldest_id]
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job, True
+
+    def _recent_failure(self, key: Hashable) -> Optional[Job]:
+        job = self._failed.get(key)
+        if job is None:
+            return None
+        if (get_nepal_time() - job.finished_at).total_seconds() < self.retry_after:
+            return job
+        del self._failed[key]
+        return None
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        job.status = "running"
+        job.started_at = get_nepal_time()
+        token = _current_job.set(job)
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            _current_job.reset(token)
+            job.finished_at = get_nepal_time()
+            with self._lock:
+                self._active.pop(job.key, None)
+                if job.status == "failed":
+                    self._failed[job.key] = job
+                else:
+                    self._failed.pop(job.key, None)
+            job.done.set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active(self, key: Hashable) -> Optional[Job]:
+        return self._active.get(key)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_queue = JobQueue(max_workers=settings.JOB_WORKERS)
@@ -1,95 +1,246 @@
+from collections import deque
 from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import os
-import asyncio
+import threading
 
-from src.models import PowerDB, MeterDB, MeterStatusDB
-from src.utils.email_service import send_email
+from src.database import SessionLocal
+from src.models import PowerDB, MeterDB, MeterStatusDB, get_nepal_time
+from src.utils.alerts import Alert, alert_dispatcher
 
 WINDOW_MINUTES = 60
 EPS = 1
 MIN_POINTS = 10
 
-
-def is_flatline(values: list[float]) -> bool:
-    vals = [int(round(v)) for v in values]  # float-safe strict W
-    return max(vals) - min(vals) <= EPS
-
-
-def run_async_blocking(coro):
-    # Best for scheduler: actually wait until email is sent
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
-
-    if loop and loop.is_running():
-        new_loop = asyncio.new_event_loop()
-        try:
-            return new_loop.run_until_complete(coro)
-        finally:
-            new_loop.close()
+# A meter that stays down is re-alerted at most this often
+ALERT_COOLDOWN = timedelta(hours=24)
+
+POWER_PHASES = (
+    PowerDB.phase_A_active_power,
+    PowerDB.phase_B_active_power,
+    PowerDB.phase_C_active_power,
+)
+
+
+def queue_flatline_alert(status: MeterStatusDB, name: str, sn: str, now: datetime):
+    """
+    Raise, repeat or clear the meter's alert after its verdict was updated.
+
+    A meter going down alerts at once and then at most every ALERT_COOLDOWN;
+    recovery sends one all-clear. The email itself goes out asynchronously;
+    the cooldown starts once it is delivered, and while it is still queued
+    the meter is not alerted again. A failed delivery leaves the cooldown
+    unstarted, so the next check retries.
+    """
+    if not os.environ.get("ADMIN_EMAIL"):
+        return
+
+    if status.is_flatline:
+        due = (
+            not status.alert_active
+            or status.last_alert_sent_at is None
+            or now - status.last_alert_sent_at >= ALERT_COOLDOWN
+        ) and not alert_dispatcher.pending(status.meter_id)
+        status.alert_active = True
+        if not due:
+            return
+        subject = f"🚨 Meter DOWN (Flatline) — ID {status.meter_id}"
+        headline = "Meter is DOWN (flatline still detected)"
+    elif status.alert_active:
+        status.alert_active = False
+        subject = f"✅ Meter RECOVERED — ID {status.meter_id}"
+        headline = "Meter is reporting changing values again"
     else:
-        return asyncio.run(coro)
+        return
+
+    body = (
+        f"{headline}\n\n"
+        f"Meter ID : {status.meter_id}\n"
+        f"Name     : {name}\n"
+        f"SN       : {sn}\n"
+        f"Checked  : {now.isoformat()} UTC\n"
+        f"Window   : {WINDOW_MINUTES} minutes\n"
+        f"EPS      : {EPS} watt\n"
+    )
+    alert_dispatcher.send(
+        Alert(status.meter_id, subject, body, on_sent=partial(_mark_alert_sent, status.meter_id))
+    )
+
+
+def _mark_alert_sent(meter_id: int):
+    db = SessionLocal()
+    try:
+        db.query(MeterStatusDB).filter(MeterStatusDB.meter_id == meter_id).update(
+            {MeterStatusDB.last_alert_sent_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _window_start() -> datetime:
+    # Readings carry the meter's local (Nepal) time without a zone
+    return get_nepal_time().replace(tzinfo=None) - timedelta(minutes=WINDOW_MINUTES)
+
+
+def flatline_by_meter(db: Session, start: datetime) -> dict[int, bool]:
+    """
+    Flatline verdict per meter since `start`, from one grouped query.
+
+    Only counts and the min/max of each rounded phase leave the database;
+    meters with fewer than MIN_POINTS readings are not flat.
+    """
+    columns = [func.count().label("points")]
+    for phase in POWER_PHASES:
+        rounded = func.round(phase)
+        columns += [func.min(rounded), func.max(rounded)]
+
+    flat = {}
+    for meter_id, points, *ranges in (
+        db.query(PowerDB.meter_id, *columns)
+        .filter(PowerDB.timestamp >= start)
+        .group_by(PowerDB.meter_id)
+    ):
+        flat[meter_id] = points >= MIN_POINTS and all(
+            high - low <= EPS for low, high in zip(ranges[::2], ranges[1::2])
+        )
+    return flat
 
 
 def update_flatline_status(db: Session):
     now = datetime.utcnow()
-    start = now - timedelta(minutes=WINDOW_MINUTES)
+    flat_meters = flatline_by_meter(db, _window_start())
 
     alert_to = os.environ.get("ADMIN_EMAIL")
     if not alert_to:
         print("ALERT_TO_EMAIL not set; skipping email alerts")
 
     meters = db.query(MeterDB.meter_id, MeterDB.name, MeterDB.sn).all()
+    statuses = {status.meter_id: status for status in db.query(MeterStatusDB)}
 
     for meter_id, name, sn in meters:
-        rows = (
-            db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
-            )
-            .filter(PowerDB.meter_id == meter_id, PowerDB.timestamp >= start)
-            .all()
-        )
-
-        status = db.get(MeterStatusDB, meter_id)
+        status = statuses.get(meter_id)
         if not status:
             status = MeterStatusDB(meter_id=meter_id)
 
-        if len(rows) < MIN_POINTS:
-            status.is_flatline = False
-            status.checked_at = now
-            db.add(status)
-            continue
-
-        a = [r.phase_A_active_power for r in rows]
-        b = [r.phase_B_active_power for r in rows]
-        c = [r.phase_C_active_power for r in rows]
-
-        flat = is_flatline(a) and is_flatline(b) and is_flatline(c)
+        flat = flat_meters.get(meter_id, False)
 
         status.is_flatline = flat
         status.checked_at = now
 
-        if flat and alert_to:
-            subject = f"🚨 Meter DOWN (Flatline) — ID {meter_id}"
-            body = (
-                f"Meter is DOWN (flatline still detected)\n\n"
-                f"Meter ID : {meter_id}\n"
-                f"Name     : {name}\n"
-                f"SN       : {sn}\n"
-                f"Checked  : {now.isoformat()} UTC\n"
-                f"Window   : {WINDOW_MINUTES} minutes\n"
-                f"EPS      : {EPS} watt\n"
-            )
-            try:
-                run_async_blocking(send_email(alert_to, subject, body))
-                status.last_alert_sent_at = now  # keep this if column exists
-            except Exception as e:
-                print(f"Email send failed for meter {meter_id}: {e}")
-
+        queue_flatline_alert(status, name, sn, now)
         db.add(status)
 
     db.commit()
+
+
+class RollingRange:
+    """Min and max over a sliding time window, amortised O(1) per sample"""
+
+    def __init__(self):
+        self._min = deque()  # (ts, value), values increasing
+        self._max = deque()  # (ts, value), values decreasing
+
+    def push(self, ts: datetime, value: int):
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((ts, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((ts, value))
+
+    def expire(self, cutoff: datetime):
+        for window in (self._min, self._max):
+            while window and window[0][0] < cutoff:
+                window.popleft()
+
+    @property
+    def spread(self) -> int:
+        return self._max[0][1] - self._min[0][1]
+
+
+class FlatlineMonitor:
+    """
+    Streaming flatline detection fed by the collector on every tick.
+
+    Keeps the last WINDOW_MINUTES of rounded phase powers per meter in
+    monotonic deques, so each tick costs O(1) instead of a window query.
+    State is seeded from PowerDB on first use, so a restart does not reset
+    meters that were already flat. Alerts follow the same cooldown rules
+    as the scheduled check.
+    """
+
+    def __init__(self):
+        self._window = timedelta(minutes=WINDOW_MINUTES)
+        self._meters: dict[int, tuple[deque, list[RollingRange]]] = {}
+        self._seeded = False
+        self._lock = threading.Lock()
+
+    def _push(self, meter_id: int, ts: datetime, values) -> bool:
+        times, ranges = self._meters.setdefault(
+            meter_id, (deque(), [RollingRange() for _ in POWER_PHASES])
+        )
+        if times and ts <= times[-1]:
+            # Repeated or late reading; the window already covers it
+            return self._is_flat(times, ranges)
+
+        cutoff = ts - self._window
+        times.append(ts)
+        while times[0] < cutoff:
+            times.popleft()
+        for rolling, value in zip(ranges, values):
+            rolling.push(ts, int(round(value)))
+            rolling.expire(cutoff)
+        return self._is_flat(times, ranges)
+
+    @staticmethod
+    def _is_flat(times, ranges) -> bool:
+        return len(times) >= MIN_POINTS and all(r.spread <= EPS for r in ranges)
+
+    def _seed(self, db: Session):
+        for meter_id, ts, *values in (
+            db.query(PowerDB.meter_id, PowerDB.timestamp, *POWER_PHASES)
+            .filter(PowerDB.timestamp >= _window_start())
+            .order_by(PowerDB.timestamp)
+        ):
+            self._push(meter_id, ts, values)
+        self._seeded = True
+
+    def observe(self, db: Session, ticks: dict[int, tuple[datetime, list[dict]]]):
+        """
+        Fold one collector tick in and update the status rows of the meters
+        in it. Changes are committed by the caller. Returns the meters whose
+        verdict flipped, as {meter_id: is_flatline}.
+        """
+        with self._lock:
+            if not self._seeded:
+                self._seed(db)
+            verdicts = {
+                meter_id: self._push(meter_id, ts, [p["active_power"] for p in phases])
+                for meter_id, (ts, phases) in ticks.items()
+            }
+
+        now = datetime.utcnow()
+        flipped = {}
+        meters = (
+            db.query(MeterDB.meter_id, MeterDB.name, MeterDB.sn, MeterStatusDB)
+            .outerjoin(MeterStatusDB, MeterStatusDB.meter_id == MeterDB.meter_id)
+            .filter(MeterDB.meter_id.in_(list(verdicts)))
+        )
+        for meter_id, name, sn, status in meters:
+            flat = verdicts[meter_id]
+            if status is None:
+                status = MeterStatusDB(meter_id=meter_id)
+                db.add(status)
+            if bool(status.is_flatline) != flat:
+                flipped[meter_id] = flat
+            status.is_flatline = flat
+            status.checked_at = now
+            queue_flatline_alert(status, name, sn, now)
+        return flipped
+
+
+flatline_monitor = FlatlineMonitor()
@@ -0,0 +1,68 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+# Settings refuse to load without these; tests only need a reachable database
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://postgres@localhost/kusm")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("IAMMETER_TOKEN", "test")
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from src.settings import settings  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """An engine whose connections live in a throwaway schema"""
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(settings.DATABASE_URL)
+    try:
+        with admin.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+    except OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+
+    engine = create_engine(
+        settings.DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"}
+    )
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@contextmanager
+def _recording(engine):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def count_statements(engine):
+    """`with count_statements() as statements:` collects what the engine sends"""
+    return lambda: _recording(engine)
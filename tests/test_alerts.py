@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from src.models import Base, MeterDB, MeterStatusDB, PowerDB, get_nepal_time
+from src.utils import alerts, meter_status
+from src.utils.alerts import Alert, AlertDispatcher
+
+
+@pytest.fixture(autouse=True)
+def quick_batches(monkeypatch):
+    monkeypatch.setattr(alerts, "BATCH_SECONDS", 0.05)
+
+
+def dispatcher(deliveries: list, fail: bool = False) -> AlertDispatcher:
+    """A dispatcher that records each digest instead of mailing it"""
+    sender = AlertDispatcher()
+
+    async def deliver(batch):
+        if fail:
+            raise ConnectionError("SMTP unreachable")
+        deliveries.append(batch)
+
+    sender._deliver = deliver
+    return sender
+
+
+def test_alerts_in_one_window_go_out_as_one_digest():
+    deliveries, sent = [], []
+    sender = dispatcher(deliveries)
+
+    sender.send(Alert(1, "down", "first", on_sent=lambda: sent.append(1)))
+    sender.send(Alert(2, "down", "other", on_sent=lambda: sent.append(2)))
+    sender.send(Alert(1, "down", "newer", on_sent=lambda: sent.append(1)))
+    assert sender.pending(1)
+    sender.stop()
+
+    [digest] = deliveries
+    assert [(alert.meter_id, alert.body) for alert in digest] == [(1, "newer"), (2, "other")]
+    assert sorted(sent) == [1, 2]
+    assert not sender.pending(1) and not sender.pending(2)
+
+
+def test_failed_digest_is_not_recorded_as_sent():
+    sent = []
+    sender = dispatcher([], fail=True)
+
+    sender.send(Alert(1, "down", "body", on_sent=lambda: sent.append(1)))
+    sender.stop()
+
+    assert sent == []
+    assert not sender.pending(1)
+
+
+@pytest.fixture
+def flat_meter(engine, db, monkeypatch):
+    """One meter flat for the last hour, with alert mail configured"""
+    Base.metadata.create_all(
+        engine, tables=[MeterDB.__table__, PowerDB.__table__, MeterStatusDB.__table__]
+    )
+    db.execute(text("TRUNCATE meters RESTART IDENTITY CASCADE"))
+    db.add(MeterDB(name="Flat", sn="F"))
+    db.flush()
+    now = get_nepal_time().replace(tzinfo=None)
+    for minute in range(0, 50, 5):
+        db.add(PowerDB(
+            meter_id=1, timestamp=now - timedelta(minutes=minute),
+            phase_A_active_power=500, phase_A_power_factor=1,
+            phase_B_active_power=500, phase_B_power_factor=1,
+            phase_C_active_power=500, phase_C_power_factor=1,
+        ))
+    db.commit()
+
+    monkeypatch.setenv("ADMIN_EMAIL", "ops@example.com")
+    monkeypatch.setattr(meter_status, "SessionLocal", sessionmaker(bind=engine))
+
+
+def check(db, monkeypatch, sender: AlertDispatcher) -> MeterStatusDB:
+    monkeypatch.setattr(meter_status, "alert_dispatcher", sender)
+    meter_status.update_flatline_status(db)
+    sender.stop()
+    db.expire_all()
+    return db.get(MeterStatusDB, 1)
+
+
+def test_undelivered_alert_is_raised_again(db, flat_meter, monkeypatch):
+    status = check(db, monkeypatch, dispatcher([], fail=True))
+    assert status.alert_active and status.last_alert_sent_at is None
+
+    deliveries = []
+    status = check(db, monkeypatch, dispatcher(deliveries))
+    assert len(deliveries) == 1
+    assert status.last_alert_sent_at is not None
+
+    # Delivered, so the cooldown now holds the next check back
+    deliveries = []
+    check(db, monkeypatch, dispatcher(deliveries))
+    assert deliveries == []
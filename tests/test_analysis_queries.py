@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from src.api.analysis import aggregate
+from src.database import get_db
+from src.models import Base, CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB, get_nepal_time
+from src.routes import analysis
+from src.utils.cache import result_cache
+
+TABLES = [MeterDB, PowerDB, EnergyDB, VoltageDB, CurrentDB]
+
+ENDPOINTS = [
+    "/analysis/avg_consumption_yearly?year=2025",
+    "/analysis/prev_curr_power",
+    "/analysis/voltage",
+    "/analysis/current",
+]
+
+
+@pytest.fixture(scope="module")
+def tables(engine):
+    Base.metadata.create_all(engine, tables=[model.__table__ for model in TABLES])
+
+
+def seed(db, meters: int):
+    """`meters` meters; every other one has three readings of each kind"""
+    db.execute(text("TRUNCATE meters RESTART IDENTITY CASCADE"))
+    start = datetime(2025, 3, 1)
+    for i in range(meters):
+        meter = MeterDB(name=f"Meter {i}", sn=f"SN{i}")
+        db.add(meter)
+        db.flush()
+        if i % 2:
+            continue
+        for step in range(3):
+            ts = start + timedelta(minutes=5 * step)
+            db.add_all([
+                PowerDB(
+                    meter_id=meter.meter_id, timestamp=ts,
+                    phase_A_active_power=100 + step, phase_A_power_factor=0.9,
+                    phase_B_active_power=200 + step, phase_B_power_factor=0.9,
+                    phase_C_active_power=300 + step, phase_C_power_factor=0.9,
+                ),
+                EnergyDB(
+                    meter_id=meter.meter_id, timestamp=ts,
+                    phase_A_grid_consumption=10 + step, phase_A_exported_power=0,
+                    phase_B_grid_consumption=20 + step, phase_B_exported_power=0,
+                    phase_C_grid_consumption=30 + step, phase_C_exported_power=0,
+                ),
+                VoltageDB(
+                    meter_id=meter.meter_id, timestamp=ts,
+                    phase_A_voltage=230, phase_B_voltage=231, phase_C_voltage=229,
+                ),
+                CurrentDB(
+                    meter_id=meter.meter_id, timestamp=ts,
+                    phase_A_current=10, phase_B_current=11, phase_C_current=9,
+                ),
+            ])
+    db.commit()
+
+
+@pytest.fixture
+def client(db, tables):
+    app = FastAPI()
+    app.include_router(analysis.router)
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("meters", [1, 25])
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_one_statement_per_request(client, db, count_statements, path, meters):
+    seed(db, meters)
+    result_cache.invalidate()
+
+    with count_statements() as statements:
+        response = client.get(path)
+
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize("meters", [1, 25])
+def test_prev_curr_power_lists_meters_without_data(client, db, meters):
+    seed(db, meters)
+    result_cache.invalidate()
+
+    rows = client.get("/analysis/prev_curr_power").json()
+
+    assert [row["meter_name"] for row in rows] == [f"Meter {i}" for i in range(meters)]
+    for i, row in enumerate(rows):
+        if i % 2:
+            assert row["current_power"] is None and row["previous_power"] is None
+        else:
+            assert row["current_power"] == pytest.approx(606 / 3)
+            assert row["previous_power"] == pytest.approx(603 / 3)
+
+
+def test_open_year_revalidation_skips_the_year_scan(client, db, count_statements):
+    seed(db, 1)
+    year = get_nepal_time().year
+    path = f"/analysis/monthly_average/{year}/Meter 0"
+
+    def read_power(minute):
+        db.add(PowerDB(
+            meter_id=1, timestamp=datetime(year, 1, 1, 0, minute),
+            phase_A_active_power=1, phase_A_power_factor=1,
+            phase_B_active_power=1, phase_B_power_factor=1,
+            phase_C_active_power=1, phase_C_power_factor=1,
+        ))
+        db.commit()
+
+    read_power(0)
+    etag = client.get(path).headers["etag"]
+
+    with count_statements() as statements:
+        response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert not any("count(" in statement for statement in statements), statements
+
+    read_power(5)
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_aggregate_counts_a_missing_phase_as_zero(db, tables):
+    seed(db, 1)
+    # Older schemas allow a phase to be missing from a reading
+    db.execute(text("ALTER TABLE power ALTER COLUMN \"phase_C_active_power\" DROP NOT NULL"))
+    db.execute(text("UPDATE power SET \"phase_C_active_power\" = NULL WHERE timestamp = '2025-03-01 00:00'"))
+    db.commit()
+
+    [values] = aggregate(
+        db, ["power"], ["avg", "sum", "max"], "month",
+        datetime(2025, 3, 1), datetime(2025, 4, 1), meter_ids=[1],
+    ).values()
+
+    # Phase A and B average 101 and 201 over three readings, C 301.5 over two
+    assert values["power_avg"] == pytest.approx(101 + 201 + 301.5)
+    assert values["power_sum"] == pytest.approx(303 + 603 + 603)
+    assert values["power_max"] == pytest.approx(606)
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from src.utils.broadcast import Broadcaster, Subscription
+
+
+def drain(subscription: Subscription) -> list[dict]:
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def test_slow_subscriber_loses_its_oldest_events():
+    subscription = Subscription(None, max_pending=3)
+
+    for i in range(5):
+        subscription.offer({"meter_id": 1, "seq": i})
+
+    assert [event["seq"] for event in drain(subscription)] == [2, 3, 4]
+
+
+def test_subscription_only_receives_its_meters():
+    subscription = Subscription({2})
+
+    subscription.offer({"meter_id": 1})
+    subscription.offer({"meter_id": 2})
+
+    assert drain(subscription) == [{"meter_id": 2}]
+
+
+def test_publish_from_another_thread_reaches_every_subscriber():
+    async def scenario():
+        broadcaster = Broadcaster(None)
+        broadcaster.bind(asyncio.get_running_loop())
+        everything = broadcaster.subscribe()
+        one_meter = broadcaster.subscribe([1])
+        gone = broadcaster.subscribe()
+        broadcaster.unsubscribe(gone)
+
+        collector = threading.Thread(
+            target=broadcaster.publish, args=([{"meter_id": 1}, {"meter_id": 2}],)
+        )
+        collector.start()
+        collector.join()
+
+        first = await asyncio.wait_for(everything.queue.get(), 1)
+        await asyncio.sleep(0)
+        return [first, *drain(everything)], drain(one_meter), drain(gone)
+
+    everything, one_meter, gone = asyncio.run(scenario())
+
+    assert everything == [{"meter_id": 1}, {"meter_id": 2}]
+    assert one_meter == [{"meter_id": 1}]
+    assert gone == []
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.cache import InMemoryBackend, ResultCache
+
+
+@pytest.fixture
+def cache():
+    return ResultCache(InMemoryBackend())
+
+
+def test_concurrent_misses_compute_once(cache):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"value": 42}
+
+    key = cache.key("route", 1)
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute(key, 60, compute)))
+    leader.start()
+    assert started.wait(5)
+
+    followers = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute(key, 60, compute)))
+        for _ in range(4)
+    ]
+    for thread in followers:
+        thread.start()
+    # Let the followers reach the in-flight future before the leader finishes
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [{"value": 42}] * 5
+
+
+def test_failed_compute_reaches_waiters_and_is_not_cached(cache):
+    key = cache.key("route")
+
+    def fail():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute(key, 60, fail)
+    assert cache.get_or_compute(key, 60, lambda: "ok") == "ok"
+
+
+def test_invalidate_moves_every_key_to_a_new_generation(cache):
+    old_key = cache.key("route", "a")
+    cache.get_or_compute(old_key, 60, lambda: "old")
+
+    cache.invalidate()
+
+    new_key = cache.key("route", "a")
+    assert new_key != old_key
+    assert cache.get_or_compute(new_key, 60, lambda: "new") == "new"
+    assert cache.backend.get(old_key) is None
+
+
+def test_entries_expire_after_their_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.utils.cache.time.monotonic", lambda: now[0])
+    key = cache.key("route")
+    cache.get_or_compute(key, 60, lambda: "first")
+
+    now[0] += 61
+    assert cache.get_or_compute(key, 60, lambda: "second") == "second"
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from src.api.demand import peak_demand, top_demand_intervals
+from src.models import Base, MeterDB, PowerDB
+
+START = datetime(2025, 3, 1)
+END = START + timedelta(hours=2)
+
+
+@pytest.fixture(scope="module")
+def tables(engine):
+    Base.metadata.create_all(engine, tables=[MeterDB.__table__, PowerDB.__table__])
+
+
+def power(meter_id: int, ts: datetime, kw: float):
+    watts = kw * 1000 / 3
+    return PowerDB(
+        meter_id=meter_id, timestamp=ts,
+        phase_A_active_power=watts, phase_A_power_factor=1,
+        phase_B_active_power=watts, phase_B_power_factor=1,
+        phase_C_active_power=watts, phase_C_power_factor=1,
+    )
+
+
+@pytest.fixture
+def alternating(db, tables):
+    """Two meters at a steady 100 kW, reporting on alternate minutes"""
+    db.execute(text("TRUNCATE meters RESTART IDENTITY CASCADE"))
+    db.add_all([MeterDB(name="Even", sn="E"), MeterDB(name="Odd", sn="O")])
+    db.flush()
+    for minute in range(0, 120, 2):
+        db.add(power(1, START + timedelta(minutes=minute), 100))
+        db.add(power(2, START + timedelta(minutes=minute + 1), 100))
+    db.commit()
+
+
+def test_campus_demand_sums_meters_on_different_clocks(db, alternating):
+    peaks = peak_demand(db, START, END, 15, "day")
+
+    [campus] = peaks["campus"]
+    assert campus["demand_kw"] == pytest.approx(200)
+    assert [meter["meter_id"] for meter in campus["coincident"]] == [1, 2]
+    assert sum(meter["demand_kw"] for meter in campus["coincident"]) == pytest.approx(200)
+
+    [top] = top_demand_intervals(db, START, END, 15, limit=1)
+    assert top["demand_kw"] == pytest.approx(200)
+
+
+def test_silent_meter_stops_counting_after_a_window(db, alternating):
+    # Meter 2 goes quiet for the second hour
+    db.execute(text("DELETE FROM power WHERE meter_id = 2 AND timestamp >= :t"), {"t": START + timedelta(hours=1)})
+    db.commit()
+
+    late = START + timedelta(minutes=90)
+    [top] = top_demand_intervals(db, late, END, 15, limit=1)
+    assert top["demand_kw"] == pytest.approx(100)
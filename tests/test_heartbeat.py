@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from src.models import Base, MeterDB, MeterHeartbeatDB, get_nepal_time
+from src.utils.heartbeat import HeartbeatTracker, meter_lag, update_stale_flags
+
+SAMPLE = datetime(2025, 3, 1, 10, 0)
+
+
+@pytest.fixture
+def meters(engine, db):
+    Base.metadata.create_all(engine, tables=[MeterDB.__table__, MeterHeartbeatDB.__table__])
+    db.execute(text("TRUNCATE meters RESTART IDENTITY CASCADE"))
+    db.add_all([MeterDB(name="One", sn="S1"), MeterDB(name="Two", sn="S2")])
+    db.commit()
+
+
+def test_repeated_sample_is_not_fresh(db, meters):
+    tracker = HeartbeatTracker()
+    tracker.record(db, [1], {1: SAMPLE})
+    db.commit()
+    fresh_at = db.get(MeterHeartbeatDB, 1).last_fresh_at
+
+    # The meter cloud keeps answering with the offline device's last sample
+    tracker.record(db, [1], {1: SAMPLE})
+    db.commit()
+    db.expire_all()
+
+    beat = db.get(MeterHeartbeatDB, 1)
+    assert beat.last_fresh_at == fresh_at
+    assert beat.last_success_at > fresh_at
+    assert beat.consecutive_failures == 0
+
+
+def test_failures_count_until_the_meter_answers(db, meters):
+    tracker = HeartbeatTracker()
+    for _ in range(3):
+        tracker.record(db, [1], {})
+    db.commit()
+    assert db.get(MeterHeartbeatDB, 1).consecutive_failures == 3
+
+    tracker.record(db, [1], {1: SAMPLE})
+    db.commit()
+    db.expire_all()
+    assert db.get(MeterHeartbeatDB, 1).consecutive_failures == 0
+
+
+def test_discard_reloads_state_from_the_table(db, meters):
+    tracker = HeartbeatTracker()
+    tracker.record(db, [1], {1: SAMPLE})
+    db.commit()
+
+    tracker.record(db, [1], {1: SAMPLE + timedelta(minutes=5)})
+    db.rollback()
+    tracker.discard()
+
+    tracker.record(db, [1], {})
+    db.commit()
+    db.expire_all()
+    assert db.get(MeterHeartbeatDB, 1).last_sample_at == SAMPLE
+
+
+def test_stale_flags_follow_the_lag(db, meters):
+    now = get_nepal_time()
+    # Meter 1 was fresh a minute ago; meter 2 has never reported
+    db.add(MeterHeartbeatDB(
+        meter_id=1, last_attempt_at=now, last_fresh_at=now - timedelta(minutes=1),
+        interval_seconds=60, consecutive_failures=0,
+    ))
+    db.add(MeterHeartbeatDB(meter_id=2, last_attempt_at=now, consecutive_failures=4))
+    db.commit()
+
+    assert update_stale_flags(db) == {2}
+    assert [row["is_stale"] for row in meter_lag(db)] == [False, True]
+
+    # Three intervals without a fresh reading make meter 1 stale too
+    db.execute(
+        text("UPDATE meter_heartbeat SET last_fresh_at = :t WHERE meter_id = 1"),
+        {"t": now - timedelta(minutes=4)},
+    )
+    db.commit()
+    assert update_stale_flags(db) == {1, 2}
+    db.expire_all()
+    assert db.get(MeterHeartbeatDB, 1).is_stale
@@ -0,0 +1,146 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.api import billing, iammeter
+from src.models import (
+    Base,
+    DailyEnergyDB,
+    EnergyDB,
+    MeterHeartbeatDB,
+    PowerDB,
+    PowerQualityEventDB,
+)
+from src.utils.heartbeat import HeartbeatTracker
+from src.utils.meter_status import FlatlineMonitor
+
+TICK = datetime(2025, 3, 1, 10, 0)
+
+
+@pytest.fixture(scope="module")
+def tables(engine):
+    Base.metadata.create_all(engine)
+
+
+def reading(ts: datetime, volts: float = 230, consumption: float = 100):
+    phase = {
+        "voltage": volts,
+        "current": 10,
+        "active_power": 2000,
+        "power_factor": 0.95,
+        "grid_consumption": consumption,
+        "exported_power": 0,
+    }
+    return {
+        "timestamp": ts.strftime("%Y/%m/%d %H:%M:%S"),
+        "phaseAdata": dict(phase),
+        "phaseBdata": dict(phase),
+        "phaseCdata": dict(phase),
+    }
+
+
+@pytest.fixture
+def ingest(engine, db, tables, monkeypatch):
+    """Two meters answering with `readings[sn]`; returns a one-tick runner"""
+    db.execute(text("TRUNCATE meters RESTART IDENTITY CASCADE"))
+    db.execute(text("INSERT INTO meters (name, sn) VALUES ('One', 'S1'), ('Two', 'S2')"))
+    db.commit()
+
+    readings = {"S1": reading(TICK), "S2": reading(TICK)}
+    monkeypatch.setattr(iammeter, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(iammeter, "fetch_meter_data", lambda sn: readings.get(sn))
+    monkeypatch.setattr(iammeter, "heartbeat", HeartbeatTracker())
+
+    def tick(**changes):
+        readings.update(changes)
+        iammeter.store_all_meter_data()
+
+    return tick
+
+
+def fail_commit(session):
+    raise RuntimeError("database went away")
+
+
+def test_failing_power_quality_keeps_the_readings(ingest, db, monkeypatch):
+    def broken(db, ticks):
+        raise RuntimeError("rule failed")
+
+    monkeypatch.setattr(iammeter, "evaluate_power_quality", broken)
+    ingest()
+
+    assert db.query(PowerDB).count() == 2
+    assert db.query(EnergyDB).count() == 2
+
+
+def test_power_quality_events_follow_the_tick(ingest, db):
+    ingest(S1=reading(TICK, volts=270))
+
+    [event] = db.query(PowerQualityEventDB).all()
+    assert (event.meter_id, event.rule, event.severity) == (1, "over_voltage", "CRITICAL")
+    assert event.ended_at is None
+
+
+def test_stale_meter_events_close_at_its_last_sample(ingest, db):
+    ingest(S2=reading(TICK, volts=270))
+
+    # Meter 2 goes silent and the heartbeat check flags it stale
+    db.execute(text("UPDATE meter_heartbeat SET is_stale = true WHERE meter_id = 2"))
+    db.commit()
+    ingest(S1=reading(datetime(2025, 3, 1, 10, 5)), S2=None)
+
+    [event] = db.query(PowerQualityEventDB).filter(PowerQualityEventDB.meter_id == 2).all()
+    assert event.ended_at == TICK
+
+
+def test_failed_ledger_merge_is_rebuilt_from_readings(ingest, db, monkeypatch):
+    ingest()
+    db.execute(text("UPDATE daily_energy SET is_dirty = false"))
+    db.commit()
+
+    merge = billing._upsert_daily_energy
+
+    def conflicting(db, rows, replace=False):
+        if not replace:
+            raise RuntimeError("ledger conflict")
+        merge(db, rows, replace)
+
+    monkeypatch.setattr(billing, "_upsert_daily_energy", conflicting)
+    later = datetime(2025, 3, 1, 10, 5)
+    ingest(S1=reading(later, consumption=103), S2=reading(later, consumption=101))
+
+    assert db.query(EnergyDB).count() == 4
+    ledger = db.query(DailyEnergyDB).order_by(DailyEnergyDB.meter_id).all()
+    assert [row.is_dirty for row in ledger] == [True, True]
+    assert [row.last_a for row in ledger] == [103, 101]
+
+
+def test_rolled_back_tick_leaves_flatline_windows_alone(ingest, monkeypatch):
+    monitor = FlatlineMonitor()
+    monkeypatch.setattr(iammeter, "flatline_monitor", monitor)
+    monkeypatch.setattr(iammeter.settings, "FLATLINE_STREAMING", True)
+    monkeypatch.setattr(Session, "commit", fail_commit)
+
+    with pytest.raises(RuntimeError):
+        ingest()
+
+    assert monitor._meters == {}
+
+
+def test_rolled_back_tick_does_not_advance_the_heartbeat(ingest, db, monkeypatch):
+    ingest()
+    later = datetime(2025, 3, 1, 10, 5)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Session, "commit", fail_commit)
+        with pytest.raises(RuntimeError):
+            ingest(S1=reading(later))
+
+    # Meter 1 stops answering; its heartbeat must still end at the first tick
+    ingest(S1=None)
+
+    beat = db.get(MeterHeartbeatDB, 1)
+    assert beat.last_sample_at == TICK
+    assert beat.consecutive_failures == 1
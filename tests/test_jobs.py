@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from src.utils.jobs import JobQueue
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, retry_after=60)
+    yield queue
+    queue.shutdown()
+
+
+def fail(calls):
+    calls.append(1)
+    raise ValueError("bad month")
+
+
+def test_failed_key_is_not_rerun_until_retry_after(queue):
+    calls = []
+    job = queue.submit(("billing", 2025, 13), fail, calls)
+    assert job.done.wait(5)
+    assert job.status == "failed"
+
+    assert queue.submit(("billing", 2025, 13), fail, calls) is job
+    assert calls == [1]
+
+    queue.retry_after = 0
+    retried = queue.submit(("billing", 2025, 13), fail, calls)
+    assert retried is not job
+    assert retried.done.wait(5)
+    assert calls == [1, 1]
+
+
+def test_submit_exclusive_refuses_an_active_key(queue):
+    release = threading.Event()
+    first = queue.submit_exclusive(("training",), release.wait, 5)
+    assert first is not None
+
+    assert queue.submit_exclusive(("training",), release.wait, 5) is None
+    assert queue.submit(("training",), release.wait, 5) is first
+
+    release.set()
+    assert first.done.wait(5)
+    assert queue.submit_exclusive(("training",), release.wait, 5) is not first
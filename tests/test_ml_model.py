@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.ml_model import (
+    GRID_SHAPE,
+    ModelRegistry,
+    PowerPredictionService,
+    SimpleForest,
+    build_grid,
+    load_training_csv,
+    time_features,
+    validate_model,
+)
+
+
+def forest(level: float) -> SimpleForest:
+    """A two-tree forest predicting `level` kW by day and level / 2 by night"""
+    timestamps = [datetime(2025, 1, 1) + timedelta(minutes=15 * i) for i in range(4 * 24 * 7)]
+    X = time_features(timestamps)
+    y = np.where((X[:, 2] >= 8) & (X[:, 2] < 18), level, level / 2)
+    model = SimpleForest(n_trees=2, max_depth=3, random_state=0)
+    model.fit(X, y)
+    return model
+
+
+@pytest.fixture(scope="module")
+def models():
+    return {level: forest(level) for level in (10.0, 20.0, 30.0)}
+
+
+def save(registry: ModelRegistry, model: SimpleForest, level: float) -> str:
+    return registry.save(model, {"level": level}, build_grid(model))
+
+
+def test_saved_version_is_not_live_until_promoted(tmp_path, models):
+    registry = ModelRegistry(tmp_path, keep=5)
+    version = save(registry, models[10.0], 10.0)
+
+    assert registry.versions() == [version]
+    assert registry.current() is None
+
+    registry.promote(version)
+    model, stats, grid = registry.load(version)
+    assert registry.current() == version
+    assert stats == {"level": 10.0}
+    assert grid.shape == GRID_SHAPE
+    assert grid[0, 0, 12, 0] == pytest.approx(10.0)
+
+
+def test_prune_keeps_the_newest_versions_and_the_live_one(tmp_path, models):
+    registry = ModelRegistry(tmp_path, keep=2)
+    first = save(registry, models[10.0], 10.0)
+    registry.promote(first)
+    second = save(registry, models[20.0], 20.0)
+    third = save(registry, models[30.0], 30.0)
+
+    # The live version survives although two newer ones exist
+    registry.prune()
+    assert registry.versions() == [first, third]
+
+    registry.promote(third)
+    assert registry.versions() == [first, third]
+    assert second not in registry.versions()
+    with pytest.raises(ValueError):
+        registry.discard(third)
+
+
+def test_rollback_serves_the_previous_version(tmp_path, models):
+    service = PowerPredictionService(
+        model_path=str(tmp_path / "missing.pkl"), registry_path=str(tmp_path / "models")
+    )
+    first = save(service.registry, models[10.0], 10.0)
+    service.promote(first)
+    second = save(service.registry, models[20.0], 20.0)
+    service.promote(second)
+    assert service.predict_single(1, 0, 12, 0) == pytest.approx(20.0)
+
+    assert service.rollback() == first
+    assert service.version == first
+    assert service.registry.current() == first
+    assert service.predict_single(1, 0, 12, 0) == pytest.approx(10.0)
+
+    with pytest.raises(ValueError):
+        service.rollback()
+
+
+def test_validation_rejects_unusable_models():
+    grid = np.ones(GRID_SHAPE, dtype=np.float32)
+    good = {"test_samples": 10, "r2": 0.8}
+
+    assert validate_model(good, grid) is None
+    assert "below" in validate_model({**good, "r2": -0.5}, grid)
+    assert "undefined" in validate_model({**good, "r2": float("nan")}, grid)
+    assert "no test samples" in validate_model({**good, "test_samples": 0}, grid)
+
+    grid[0, 0, 0, 0] = np.nan
+    assert "non-finite" in validate_model(good, grid)
+
+
+def write_export(path, kw):
+    """A Time,Main_Transformer export of a week at 15 minute steps"""
+    lines = ["Time,Main_Transformer"]
+    for i in range(4 * 24 * 7):
+        ts = datetime(2025, 1, 1) + timedelta(minutes=15 * i)
+        lines.append(f'{ts:%m/%d/%Y %H:%M},"{kw(ts) * 1000:,.0f} W"')
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # Read again by the spawned training process
+    monkeypatch.setenv("FOREST_TREES", "2")
+    monkeypatch.setenv("TRAINING_WORKERS", "1")
+    return PowerPredictionService(
+        model_path=str(tmp_path / "missing.pkl"), registry_path=str(tmp_path / "models")
+    )
+
+
+def test_background_training_swaps_in_a_valid_model(tmp_path, service):
+    export = write_export(tmp_path / "export.csv", lambda ts: 40 if 8 <= ts.hour < 18 else 10)
+
+    result = service.train_in_background(load_training_csv, export)
+
+    assert service.version == result["version"]
+    assert service.registry.current() == result["version"]
+    assert service.predict_single(1, 2, 12, 0) == pytest.approx(40, rel=0.1)
+
+
+def test_rejected_model_is_discarded_and_the_live_one_kept(tmp_path, service, models):
+    live = save(service.registry, models[10.0], 10.0)
+    service.promote(live)
+    export = write_export(tmp_path / "flat.csv", lambda ts: 5)
+
+    with pytest.raises(ValueError, match="rejected"):
+        service.train_in_background(load_training_csv, export)
+
+    assert service.version == live
+    assert service.registry.versions() == [live]
+    assert service.predict_single(1, 0, 12, 0) == pytest.approx(10.0)
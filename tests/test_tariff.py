@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from src.api.tariff import compare_tariffs, hourly_energy
+from src.models import (
+    Base,
+    EnergyDB,
+    MeterDB,
+    PowerDB,
+    TariffDB,
+    TariffRateDB,
+    TariffTierDB,
+)
+
+START = datetime(2025, 3, 1)
+# Hours with readings; 3, 4 and 5 are a collection gap
+READ_HOURS = [0, 1, 2, 6]
+
+
+@pytest.fixture(scope="module")
+def tables(engine):
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            model.__table__
+            for model in (MeterDB, EnergyDB, PowerDB, TariffDB, TariffRateDB, TariffTierDB)
+        ],
+    )
+
+
+@pytest.fixture
+def gap(db, tables):
+    """One meter using 12 kWh an hour at a steady 10 kW, unread for 3 hours"""
+    db.execute(text("TRUNCATE meters, tariffs RESTART IDENTITY CASCADE"))
+    db.add(MeterDB(name="Gap", sn="G"))
+    db.flush()
+    for hour in READ_HOURS:
+        for step in range(12):
+            ts = START + timedelta(hours=hour, minutes=5 * step)
+            db.add(EnergyDB(
+                meter_id=1, timestamp=ts,
+                phase_A_grid_consumption=hour * 12 + step, phase_A_exported_power=0,
+                phase_B_grid_consumption=0, phase_B_exported_power=0,
+                phase_C_grid_consumption=0, phase_C_exported_power=0,
+            ))
+            db.add(PowerDB(
+                meter_id=1, timestamp=ts,
+                phase_A_active_power=10000, phase_A_power_factor=1,
+                phase_B_active_power=0, phase_B_power_factor=1,
+                phase_C_active_power=0, phase_C_power_factor=1,
+            ))
+    db.commit()
+
+
+def test_gap_energy_is_spread_over_missing_hours(db, gap):
+    meters, hours, energy = hourly_energy(db, START, START + timedelta(days=1))
+
+    assert list(meters) == [1]
+    assert energy[0, :8] == pytest.approx([11, 12, 12, 12, 12, 12, 12, 0])
+    assert energy.sum() == pytest.approx(83)
+    assert np.all(energy[0, 7:] == 0)
+
+
+def test_demand_charge_uses_rolling_power_demand(db, gap):
+    tariff = TariffDB(name="TOU", base_rate=10, demand_charge_per_kw=5, fixed_charge=0)
+    db.add(tariff)
+    db.flush()
+    # Hour 6, when collection resumed, is expensive
+    db.add(TariffRateDB(tariff_id=tariff.id, rate=100, start_hour=6, end_hour=7))
+    db.commit()
+
+    [result] = compare_tariffs(db, 2025, 3)
+    [meter] = result["meters"]
+
+    assert meter["energy_kwh"] == pytest.approx(83)
+    assert meter["energy_cost"] == pytest.approx(83 * 10 + 12 * 90)
+    assert meter["peak_kw"] == pytest.approx(10)
+    assert meter["demand_cost"] == pytest.approx(50)